@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+# Copyright (c) Facebook, Inc. and its affiliates. All Rights Reserved
+"""
+Local HTTP server of synthetic sites, to benchmark the crawl offline.
+
+Urls look like http://127.0.0.1:<port>/<site>/item?<params>. The content of
+a page only depends on the site and on its content params (id and page by
+default): removing any other param gives the same page. Pages can be
+served with latency, a given size, and a share of words that change on
+every request (dynamic noise, e.g. ads or timestamps).
+
+Run it standalone with:
+    python fake_server.py --port 8000 --latency 0.05 --noise 0.02
+"""
+
+import time
+import random
+import zlib
+import argparse
+import threading
+import urllib.parse as urlparse
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+CONTENT_PARAMS = ('id', 'page')
+
+
+class FakeSiteServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # the default backlog of 5 drops the connections of a concurrent crawl,
+    # which are then retried after a second
+    request_queue_size = 1024
+
+    def __init__(
+            self,
+            address=('127.0.0.1', 0),
+            latency=0.0,
+            words=300,
+            noise=0.0,
+            content_params=CONTENT_PARAMS):
+        """
+        :param latency: FLOAT. Mean number of seconds to wait before
+            answering (exponentially distributed).
+        :param words: INT. Number of words in the body of a page.
+        :param noise: FLOAT. Share of the words of a page that change on
+            every request.
+        :param content_params: params whose values change the content
+        """
+        super().__init__(address, FakeSiteHandler)
+        self.latency = latency
+        self.words = words
+        self.noise = noise
+        self.content_params = content_params
+        self.requests = 0
+
+    @property
+    def base_url(self):
+        return 'http://{0}:{1}'.format(*self.server_address[:2])
+
+    def page(self, site, query):
+        """
+        :return: (title, body) of the page of site for query (a dict of
+            param -> list of values)
+        """
+        content = [
+            '{0}={1}'.format(param, query[param][0])
+            for param in self.content_params if param in query]
+        seed = zlib.crc32('/'.join([site] + content).encode())
+        rng = random.Random(seed)
+        body = ['w{0}'.format(rng.randrange(5000)) for _ in range(self.words)]
+        n_noise = int(self.words * self.noise)
+        for i in random.sample(range(self.words), n_noise):
+            body[i] = 'n{0}'.format(random.randrange(5000))
+        title = '{0} {1}'.format(site, ' '.join(content))
+        return title, ' '.join(body)
+
+
+class FakeSiteHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        server.requests += 1
+        if server.latency:
+            time.sleep(random.expovariate(1.0 / server.latency))
+        parsed = urlparse.urlparse(self.path)
+        site = parsed.path.strip('/').split('/')[0]
+        title, body = server.page(site, urlparse.parse_qs(parsed.query))
+        content = (
+            '<html><head><title>{0}</title></head>'
+            '<body><p>{1}</p></body></html>').format(title, body).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+
+def start(port=0, **kwargs):
+    """
+    Start a FakeSiteServer in a background thread.
+
+    :param kwargs: see FakeSiteServer
+    :return: FakeSiteServer, call shutdown() to stop it
+    """
+    server = FakeSiteServer(('127.0.0.1', port), **kwargs)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--words', type=int, default=300)
+    parser.add_argument('--noise', type=float, default=0.0)
+    args = parser.parse_args()
+    server = FakeSiteServer(
+        ('127.0.0.1', args.port), latency=args.latency, words=args.words,
+        noise=args.noise)
+    print("serving on {0}".format(server.base_url))
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+# Copyright (c) Facebook, Inc. and its affiliates. All Rights Reserved
+"""
+Generate synthetic url data (canonical_url, full_domain, url_id) pointing
+at a fake_server, as training and full TSV files for process_urls.
+
+Each url has content params (id, page) and a random subset of tracking
+params, some of them carrying phone numbers or email addresses, so that
+every path of the pipeline is exercised. Domain sizes follow a Zipf-like
+distribution, as in real data.
+
+    python generate_data.py --urls 100000 --domains 1000 \\
+        --base-url http://127.0.0.1:8000 --output-dir /tmp/bench
+"""
+
+import os
+import random
+import argparse
+import numpy as np
+import pandas as pd
+
+TRACKING_PARAMS = (
+    'utm_source', 'utm_campaign', 'ref', 'sid', 'fbclid', 'session', 'lang')
+PII_VALUES = ('%2B1-650-253-0000', 'someone%40example.com')
+
+
+def generate(n_urls, n_domains, base_url, seed=0, pii_share=0.01):
+    """
+    :param n_urls: INT. Number of urls.
+    :param n_domains: INT. Number of domains (sites of the fake server).
+    :param base_url: STRING. Base url of the fake server.
+    :param pii_share: FLOAT. Share of urls with a phone number or email.
+    :return: pd.DataFrame with columns canonical_url, full_domain, url_id
+    """
+    rng = random.Random(seed)
+    # Zipf-like domain sizes
+    weights = 1.0 / np.arange(1, n_domains + 1)
+    domains = np.random.RandomState(seed).choice(
+        n_domains, size=n_urls, p=weights / weights.sum())
+    rows = []
+    for i, domain in enumerate(domains):
+        site = 'site{0}'.format(domain)
+        params = ['id={0}'.format(rng.randrange(1000))]
+        if rng.random() < 0.5:
+            params.append('page={0}'.format(rng.randrange(10)))
+        for param in rng.sample(TRACKING_PARAMS, rng.randrange(4)):
+            params.append('{0}={1}'.format(param, rng.randrange(10 ** 6)))
+        if rng.random() < pii_share:
+            params.append('contact={0}'.format(rng.choice(PII_VALUES)))
+        rng.shuffle(params)
+        rows.append((
+            '{0}/{1}/item?{2}'.format(base_url, site, '&'.join(params)),
+            '{0}.example.com'.format(site),
+            str(10 ** 15 + i)))
+    return pd.DataFrame(
+        rows, columns=['canonical_url', 'full_domain', 'url_id'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--urls', type=int, default=10000)
+    parser.add_argument('--domains', type=int, default=100)
+    parser.add_argument('--training-share', type=float, default=0.1)
+    parser.add_argument('--base-url', default='http://127.0.0.1:8000')
+    parser.add_argument('--output-dir', default='.')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    url_data = generate(args.urls, args.domains, args.base_url, args.seed)
+    training_data = url_data.sample(
+        frac=args.training_share, random_state=args.seed)
+    os.makedirs(args.output_dir, exist_ok=True)
+    url_data.to_csv(
+        os.path.join(args.output_dir, 'full.tsv'), sep='\t', index=False)
+    training_data.to_csv(
+        os.path.join(args.output_dir, 'training.tsv'), sep='\t', index=False)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+# Copyright (c) Facebook, Inc. and its affiliates. All Rights Reserved
+"""
+Timed scenarios of the pipeline on synthetic data, without internet access:
+
+- crawl: URLComparison.process_multiple_urls against a local fake_server
+- build_param_data: URLParametersRemoval.build_param_data
+- drop_params: URLParametersRemoval.drop_params_via_similarity
+- remove_pii: URLParametersRemoval.remove_pii_params
+
+Each scenario reports its throughput and the peak memory allocated by
+Python in this process (tracemalloc, which slows allocations down: use
+--no-memory for timings only). Memory is not measured for the crawl: its
+workers run in other processes, and tracing would slow down the fake
+server, which runs in this one. Append results to a JSON lines file with
+--json to track regressions across commits.
+
+    python run_benchmarks.py --urls 20000 --crawl-urls 200 --backend asyncio
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tracemalloc
+import numpy as np
+import pandas as pd
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..',
+                    'modules'))
+
+import fake_server  # noqa: E402
+from generate_data import generate  # noqa: E402
+from url_comparison import URLComparison  # noqa: E402
+from url_parameters_removal import URLParametersRemoval  # noqa: E402
+from crawl_results import Comparison, url_results  # noqa: E402
+from crawl_results import ResultAccumulator  # noqa: E402
+
+SCENARIOS = ('crawl', 'build_param_data', 'drop_params', 'remove_pii')
+
+
+def measure(scenario, n_items, function, memory=True):
+    """
+    Run function once.
+
+    :return: (output of function, dict of measurements)
+    """
+    if memory:
+        tracemalloc.start()
+    start_time = time.perf_counter()
+    output = function()
+    seconds = time.perf_counter() - start_time
+    peak_mb = None
+    if memory:
+        peak_mb = tracemalloc.get_traced_memory()[1] / 1024 / 1024
+        tracemalloc.stop()
+    return output, {
+        'scenario': scenario,
+        'items': n_items,
+        # a scenario that outputs nothing is broken, however fast
+        'output_rows': len(output),
+        'seconds': seconds,
+        'items_per_second': n_items / seconds,
+        'peak_mb': peak_mb,
+    }
+
+
+def synthetic_url_info(url_data, seed=0):
+    """
+    Synthetic output of URLComparison.process_multiple_urls for url_data,
+    built from the same records as a crawl of fake_server: one row per param
+    of each url, and one AA test row (key None) per url. Removing a content
+    param changes the page, removing any other param does not.
+    """
+    rng = np.random.RandomState(seed)
+    comparison = URLComparison()
+    results = ResultAccumulator()
+    for url in url_data['canonical_url'].values:
+        body_length = int(rng.randint(500, 5000))
+        comparisons = []
+        for key, mod_url in comparison.generate_modified_urls(url):
+            content = key in fake_server.CONTENT_PARAMS
+            comparisons.append((key, mod_url, Comparison(
+                success=True,
+                message=None,
+                dl_ratio=rng.uniform(0, 0.5) if content else 1.0,
+                running_time=0.0,
+                body_length=body_length,
+                same_title=not content,
+                status_code=200,
+                fetch_time=0.0,
+                parse_time=0.0,
+                response_bytes=body_length,
+                diff_time=0.0)))
+        results.add(url_results(url, comparisons))
+    return results.to_frame()
+
+
+def similarity_data(url_data, seed=0):
+    """
+    Output of append_url_similarity for url_data, see synthetic_url_info
+    """
+    return URLParametersRemoval(url_data.copy()).append_url_similarity(
+        synthetic_url_info(url_data, seed))
+
+
+def run(args):
+    results = []
+    url_data = generate(args.urls, args.domains, 'http://127.0.0.1:1')
+
+    if 'crawl' in args.scenarios:
+        server = fake_server.start(
+            latency=args.latency, words=args.words, noise=args.noise)
+        crawl_data = generate(
+            args.crawl_urls, args.domains, server.base_url, seed=1)
+        comparison = URLComparison(
+            backend=args.backend, max_worker=args.max_worker)
+        _url_info, result = measure(
+            'crawl', args.crawl_urls,
+            lambda: comparison.process_multiple_urls(
+                crawl_data['canonical_url'].values),
+            memory=False)
+        result['requests_per_second'] = server.requests / result['seconds']
+        server.shutdown()
+        results.append(result)
+
+    url_data_with_similarity = similarity_data(url_data)
+    param_domain, result = measure(
+        'build_param_data', url_data_with_similarity.shape[0],
+        lambda: URLParametersRemoval.build_param_data(
+            url_data_with_similarity),
+        args.memory)
+    if 'build_param_data' in args.scenarios:
+        results.append(result)
+
+    if 'drop_params' in args.scenarios or 'remove_pii' in args.scenarios:
+        # as the apply step of process_urls does
+        urls_with_param = url_data.merge(
+            URLParametersRemoval(url_data).parse_urls_for_param())
+        urls, result = measure(
+            'drop_params', urls_with_param.shape[0],
+            lambda: URLParametersRemoval.drop_params_via_similarity(
+                urls_with_param, param_domain),
+            args.memory)
+        if 'drop_params' in args.scenarios:
+            results.append(result)
+
+    if 'remove_pii' in args.scenarios:
+        _clean_urls, result = measure(
+            'remove_pii', urls['canonical_url'].nunique(),
+            lambda: URLParametersRemoval.remove_pii_params(urls),
+            args.memory)
+        results.append(result)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument(
+        '--scenarios', nargs='+', choices=SCENARIOS, default=SCENARIOS)
+    parser.add_argument(
+        '--urls', type=int, default=20000,
+        help='number of urls of the offline scenarios')
+    parser.add_argument('--domains', type=int, default=100)
+    parser.add_argument(
+        '--crawl-urls', type=int, default=200,
+        help='number of urls crawled')
+    parser.add_argument(
+        '--backend', choices=('requests', 'asyncio'), default='requests')
+    parser.add_argument('--max-worker', type=int, default=4)
+    parser.add_argument(
+        '--latency', type=float, default=0.0,
+        help='mean latency of the fake server, in seconds')
+    parser.add_argument('--words', type=int, default=300)
+    parser.add_argument('--noise', type=float, default=0.0)
+    parser.add_argument(
+        '--no-memory', dest='memory', action='store_false',
+        help='do not measure peak memory (faster, more accurate timings)')
+    parser.add_argument(
+        '--json', help='append the results to this JSON lines file')
+    args = parser.parse_args()
+
+    results = run(args)
+    print(pd.DataFrame(results).to_string(index=False))
+    if args.json is not None:
+        run_info = {
+            'time': time.time(),
+            'python': platform.python_version(),
+            'args': vars(args),
+        }
+        with open(args.json, 'a') as f:
+            for result in results:
+                f.write(json.dumps(dict(run_info, **result)) + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+# Copyright (c) Facebook, Inc. and its affiliates. All Rights Reserved
+"""
+Fetch many URLs concurrently with asyncio/aiohttp. Fetching is I/O bound,
+so a single event loop can keep hundreds of requests in flight where the
+requests-based URLContentFetcher keeps one per worker process. Pages are
+parsed in the event loop as they arrive.
+"""
+
+import time
+import asyncio
+import urllib.parse as urlparse
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+from url_content_fetcher import CHUNK_SIZE
+from url_content_cache import URLContentCache
+
+
+class AsyncURLFetcher(object):
+    """
+    Use as an async context manager, which holds one aiohttp session, and
+    so its keep-alive connections and DNS cache, for the whole crawl:
+
+        async with AsyncURLFetcher() as fetcher:
+            await fetcher.fetch(fetchers)
+    """
+    def __init__(
+            self,
+            timeout=3,
+            proxies=None,
+            max_connections=500,
+            max_per_host=8,
+            total_timeout=3600):
+        """
+        :param timeout: Seconds to wait to connect and between two reads of
+            the response, same as the timeout of requests.get.
+        :param proxies: Optional. Same format as the requests proxies
+            argument, e.g. {'http': 'http://10.10.1.10:3128'}.
+        :param max_connections: INT. Maximum number of open connections.
+        :param max_per_host: INT. Maximum number of open connections to a
+            single host.
+        :param total_timeout: Seconds after which a request is abandoned,
+            however much data keeps coming.
+        """
+        if aiohttp is None:
+            raise ImportError(
+                "the asyncio backend requires the aiohttp module")
+        self.timeout = timeout
+        self.proxies = proxies
+        self.max_connections = max_connections
+        self.max_per_host = max_per_host
+        self.total_timeout = total_timeout
+        self._session = None
+        # downloads in flight by normalized url, as (fetcher, task), shared
+        # by the fetchers of the same page
+        self._in_flight = {}
+
+    async def __aenter__(self):
+        timeout = aiohttp.ClientTimeout(
+            total=self.total_timeout,
+            sock_connect=self.timeout,
+            sock_read=self.timeout)
+        connector = aiohttp.TCPConnector(
+            limit=self.max_connections,
+            limit_per_host=self.max_per_host)
+        self._session = aiohttp.ClientSession(
+            connector=connector, timeout=timeout)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self._session.close()
+        self._session = None
+
+    def _proxy(self, url):
+        if not self.proxies:
+            return None
+        scheme = urlparse.urlparse(url).scheme
+        return self.proxies.get(scheme) or self.proxies.get('all')
+
+    async def _download(self, fetcher):
+        """
+        :return: (url_data, error), url_data is None if the fetch failed
+        """
+        try:
+            async with self._session.get(
+                    fetcher.url,
+                    headers=fetcher.request_headers(),
+                    proxy=self._proxy(fetcher.url)) as r:
+                fetcher.check_status(r.status)
+                fetcher.check_response_headers(r.headers)
+                chunks = []
+                size = 0
+                async for chunk in r.content.iter_chunked(CHUNK_SIZE):
+                    size += len(chunk)
+                    fetcher.content_bytes = size
+                    fetcher.check_size(size)
+                    chunks.append(chunk)
+            return b''.join(chunks).decode('utf-8', 'ignore'), None
+        except Exception as e:
+            if isinstance(e, asyncio.TimeoutError):
+                e = TimeoutError("timed out")
+            return None, e
+
+    async def _fetch_one(self, fetcher):
+        # replayed fetchers read the archive when their content is needed
+        if fetcher.replay or fetcher.read_from_cache():
+            return
+        start_time = time.time()
+        key = None
+        if fetcher.cache is not None and not fetcher.refresh:
+            # each distinct page is fetched once, as with the cache alone;
+            # the AA test (refresh) always gets a fetch of its own
+            key = URLContentCache.normalize_url(fetcher.url)
+        shared = self._in_flight.get(key) if key is not None else None
+        if shared is not None:
+            owner, task = shared
+            url_data, error = await task
+            # fetched once for both, as if read from the cache
+            fetcher.status_code = owner.status_code
+            fetcher.headers = owner.headers
+            fetcher.content_bytes = owner.content_bytes
+            fetcher.from_cache = True
+            self._load(fetcher, url_data, error, start_time)
+            return
+        task = asyncio.ensure_future(self._download(fetcher))
+        if key is not None:
+            self._in_flight[key] = (fetcher, task)
+        try:
+            url_data, error = await task
+            # parsed as soon as it arrives, and cached before later fetchers
+            # of the page look it up
+            self._load(fetcher, url_data, error, start_time)
+        finally:
+            if key is not None:
+                del self._in_flight[key]
+
+    @staticmethod
+    def _load(fetcher, url_data, error, start_time):
+        if error is not None:
+            fetcher.set_error(error)
+            return
+        try:
+            fetcher.load_content(url_data, start_time)
+        except Exception as e:
+            fetcher.set_error(e)
+
+    async def fetch(self, fetchers):
+        """
+        Fetch the content of every URLContentFetcher that is not already
+        cached (or replayed from an archive), concurrently. The fetchers
+        are updated in place, as if read_and_soup had been called on each
+        of them. Fetchers of a page already being fetched (with a cache,
+        and except for refreshes) share that fetch.
+
+        :param fetchers: list of URLContentFetcher
+        """
+        await asyncio.gather(*[self._fetch_one(f) for f in fetchers])
+        return fetchers
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# Copyright (c) Facebook, Inc. and its affiliates. All Rights Reserved
+"""
+Append-only archive of fetched pages, to recompute comparisons offline (see
+the replay mode of URLComparison). Each fetch is stored as one gzip member
+holding a JSON record (url, status, headers, body text, title, fetch time,
+error), so the data file is itself a valid gzip file. An index file next
+to it (path + '.idx') gives the offset and length of each record for
+random access. Writers from several processes append under an exclusive
+lock (fcntl), and a record is indexed only once fully written.
+"""
+
+import os
+import gzip
+import json
+import time
+import fcntl
+
+from url_content_cache import URLContentCache
+
+
+class CrawlArchive(object):
+    def __init__(self, path):
+        """
+        :param path: STRING. Path of the data file, created if it does not
+            exist. The index is written to path + '.idx'.
+        """
+        self.path = path
+        self.index_path = path + '.idx'
+        self._index = None
+        self._data_file = None
+        self._pid = None
+
+    def __getstate__(self):
+        # file handles can not cross the process boundary, each worker
+        # reopens them lazily
+        state = self.__dict__.copy()
+        state['_index'] = None
+        state['_data_file'] = None
+        state['_pid'] = None
+        return state
+
+    @staticmethod
+    def key(url):
+        return URLContentCache.normalize_url(url)
+
+    def put(self, record):
+        """
+        Append a record.
+
+        :param record: dict with at least a 'url' key, and 'refresh' (BOOL)
+            for a fetch that bypassed the cache
+        """
+        record = dict(record, fetched_at=time.time())
+        member = gzip.compress(json.dumps(record).encode('utf-8'))
+        with open(self.path, 'ab') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.seek(0, os.SEEK_END)
+                offset = f.tell()
+                f.write(member)
+                f.flush()
+                with open(self.index_path, 'a') as index_file:
+                    index_file.write('{0}\t{1}\t{2}\t{3}\n'.format(
+                        self.key(record['url']), offset, len(member),
+                        int(bool(record.get('refresh')))))
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _load_index(self):
+        if self._index is None or self._pid != os.getpid():
+            index = {}
+            if os.path.exists(self.index_path):
+                with open(self.index_path) as f:
+                    for line in f:
+                        key, offset, length, refresh = \
+                            line.rstrip('\n').split('\t')
+                        index.setdefault(key, []).append(
+                            (int(offset), int(length), refresh == '1'))
+            self._index = index
+            self._data_file = None
+            self._pid = os.getpid()
+        return self._index
+
+    def __len__(self):
+        return sum(len(entries) for entries in self._load_index().values())
+
+    def __contains__(self, url):
+        return self.key(url) in self._load_index()
+
+    def _read(self, offset, length):
+        if self._data_file is None:
+            self._data_file = open(self.path, 'rb')
+        self._data_file.seek(offset)
+        return json.loads(
+            gzip.decompress(self._data_file.read(length)).decode('utf-8'))
+
+    def get(self, url, refresh=False):
+        """
+        Return the last record of url, preferring the records with the same
+        refresh flag (the AA test of a url is a refreshed fetch), or None if
+        url was never archived. The index is read once per process.
+        """
+        entries = self._load_index().get(self.key(url))
+        if not entries:
+            return None
+        matching = [e for e in entries if e[2] == refresh] or entries
+        offset, length, _refresh = matching[-1]
+        return self._read(offset, length)
+
+    def records(self):
+        """
+        Generate every record, in the order they were written
+        """
+        with open(self.path, 'rb') as f, open(self.index_path) as index_file:
+            for line in index_file:
+                _key, offset, length, _refresh = line.rstrip('\n').split('\t')
+                f.seek(int(offset))
+                yield json.loads(gzip.decompress(
+                    f.read(int(length))).decode('utf-8'))
@@ -0,0 +1,373 @@
+#!/usr/bin/env python3
+# Copyright (c) Facebook, Inc. and its affiliates. All Rights Reserved
+"""
+Durable work queue of a crawl, so that a crawl survives crashes and can be
+spread across processes and hosts. The urls to crawl live in a SQLite
+database. Workers lease batches of urls, crawl them with a URLComparison,
+write the url_info of each batch to a shard file and mark the batch done.
+A worker renews the lease of its batch while it crawls it. A lease that is
+not renewed in time (the worker died) expires, and its urls are handed out
+again, up to a number of attempts. Rerunning a crawl on the same queue only
+crawls the urls that are not done yet.
+
+Workers on several hosts need the database and the shard directory on a
+shared filesystem with working (POSIX) file locks. The database uses the
+rollback journal rather than WAL, which needs shared memory between the
+processes and does not work over a network filesystem. The URLComparison
+of the crawl is stored in the database (see set_comparison), so that extra
+workers crawl with the same options. Start them with:
+    python crawl_queue.py /shared/crawl.db --max-worker 8
+"""
+
+import os
+import copy
+import pickle
+import time
+import socket
+import threading
+import sqlite3
+import logging
+import argparse
+import pandas as pd
+
+PENDING = 0
+LEASED = 1
+DONE = 2
+FAILED = 3
+
+
+class CrawlQueue(object):
+    def __init__(self, path, shard_dir=None, lease_seconds=600,
+                 max_attempts=3):
+        """
+        :param path: STRING. Path of the SQLite database file, created if it
+            does not exist.
+        :param shard_dir: STRING. Directory of the url_info shards. Defaults
+            to path + '.shards'.
+        :param lease_seconds: Seconds without renewal after which the urls
+            of a batch are handed out to other workers. run_worker renews
+            its lease every lease_seconds / 3.
+        :param max_attempts: INT. Number of failed or expired batches an
+            url can be part of before it is given up (marked failed).
+        """
+        self.path = path
+        self.shard_dir = shard_dir if shard_dir is not None \
+            else path + '.shards'
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._conn = None
+        self._pid = None
+
+    def __getstate__(self):
+        # sqlite connections can not cross the process boundary, each
+        # worker reconnects lazily
+        state = self.__dict__.copy()
+        state['_conn'] = None
+        state['_pid'] = None
+        return state
+
+    def _connect(self):
+        if self._conn is None or self._pid != os.getpid():
+            conn = sqlite3.connect(
+                self.path, timeout=60, isolation_level=None)
+            # WAL does not work over a network filesystem, and the queue
+            # only writes a few rows per batch
+            conn.execute("PRAGMA journal_mode=DELETE")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS urls ("
+                "url TEXT UNIQUE, "
+                "state INTEGER, "
+                "batch_id INTEGER, "
+                "lease_until REAL, "
+                "attempts INTEGER, "
+                "shard TEXT)")
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS urls_state "
+                "ON urls (state, lease_until)")
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS urls_batch_id "
+                "ON urls (batch_id)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS batches ("
+                "batch_id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                "worker TEXT, "
+                "leased_at REAL)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS config ("
+                "name TEXT PRIMARY KEY, "
+                "value BLOB)")
+            self._conn = conn
+            self._pid = os.getpid()
+        return self._conn
+
+    def add(self, url_list):
+        """
+        Queue urls. Urls already queued (pending, done or not) are ignored,
+        so that adding the same list again resumes the crawl.
+
+        :return: INT. Number of urls added.
+        """
+        conn = self._connect()
+        before = len(self)
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                "INSERT OR IGNORE INTO urls (url, state, attempts) "
+                "VALUES (?, ?, 0)",
+                ((url, PENDING) for url in url_list))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return len(self) - before
+
+    def lease(self, worker, size):
+        """
+        Lease up to size pending urls (or urls of expired leases), in the
+        order they were added.
+
+        :param worker: STRING. Name of the worker, for monitoring.
+        :return: (batch_id, list of urls), batch_id is None if there is
+            nothing to crawl right now.
+        """
+        conn = self._connect()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # the worker of an expired lease died, maybe because of its urls
+            self._retry(
+                conn, "state = ? AND lease_until < ?", (LEASED, now))
+            urls = [row[0] for row in conn.execute(
+                "SELECT url FROM urls WHERE state = ? "
+                "ORDER BY rowid LIMIT ?",
+                (PENDING, size))]
+            batch_id = None
+            if urls:
+                batch_id = conn.execute(
+                    "INSERT INTO batches (worker, leased_at) VALUES (?, ?)",
+                    (worker, now)).lastrowid
+                conn.executemany(
+                    "UPDATE urls SET state = ?, batch_id = ?, "
+                    "lease_until = ? WHERE url = ?",
+                    ((LEASED, batch_id, now + self.lease_seconds, url)
+                     for url in urls))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return batch_id, urls
+
+    def set_comparison(self, comparison):
+        """
+        Store the URLComparison of the crawl (pickled, without its metrics),
+        for the workers started with get_comparison.
+        """
+        self._connect().execute(
+            "INSERT OR REPLACE INTO config (name, value) VALUES (?, ?)",
+            ('comparison', pickle.dumps(comparison)))
+
+    def get_comparison(self):
+        """
+        :return: the URLComparison stored by set_comparison, or None
+        """
+        row = self._connect().execute(
+            "SELECT value FROM config WHERE name = ?",
+            ('comparison',)).fetchone()
+        return None if row is None else pickle.loads(row[0])
+
+    def shard_path(self, batch_id):
+        return os.path.join(
+            self.shard_dir, 'batch-{0:08d}.pkl'.format(batch_id))
+
+    def complete(self, batch_id, url_info):
+        """
+        Save the url_info of a batch to its shard, then mark its urls done.
+        Urls whose lease expired and were leased again in the meantime are
+        left to their new batch.
+
+        :param url_info: pd.DataFrame, output of
+            URLComparison.process_multiple_urls for the urls of the batch
+        :return: INT. Number of urls marked done.
+        """
+        os.makedirs(self.shard_dir, exist_ok=True)
+        path = self.shard_path(batch_id)
+        # readers never see a partial shard
+        url_info.to_pickle(path + '.tmp')
+        os.replace(path + '.tmp', path)
+        return self._connect().execute(
+            "UPDATE urls SET state = ?, shard = ? "
+            "WHERE batch_id = ? AND state = ?",
+            (DONE, os.path.basename(path), batch_id, LEASED)).rowcount
+
+    def renew(self, batch_id):
+        """
+        Extend the lease of a batch by lease_seconds.
+
+        :return: BOOL. False if the lease was lost (it expired and its urls
+            were handed out again).
+        """
+        return self._connect().execute(
+            "UPDATE urls SET lease_until = ? WHERE batch_id = ? AND state = ?",
+            (time.time() + self.lease_seconds, batch_id, LEASED)).rowcount > 0
+
+    def release(self, batch_id):
+        """
+        Hand out the urls of a failed batch again, or mark them failed after
+        max_attempts.
+        """
+        self._retry(
+            self._connect(), "batch_id = ? AND state = ?", (batch_id, LEASED))
+
+    def _retry(self, conn, where, parameters):
+        conn.execute(
+            "UPDATE urls SET attempts = attempts + 1, lease_until = NULL, "
+            "state = CASE WHEN attempts + 1 >= ? THEN ? ELSE ? END "
+            "WHERE " + where,
+            (self.max_attempts, FAILED, PENDING) + parameters)
+
+    def counts(self):
+        """
+        :return: dict of the number of urls per state ('pending', 'leased',
+            'done', 'failed')
+        """
+        counts = dict(self._connect().execute(
+            "SELECT state, COUNT(*) FROM urls GROUP BY state").fetchall())
+        return {
+            name: counts.get(state, 0)
+            for name, state in (
+                ('pending', PENDING), ('leased', LEASED), ('done', DONE),
+                ('failed', FAILED))}
+
+    def __len__(self):
+        return self._connect().execute(
+            "SELECT COUNT(*) FROM urls").fetchone()[0]
+
+    @property
+    def finished(self):
+        """
+        Whether every url is done or failed
+        """
+        counts = self.counts()
+        return counts['pending'] == 0 and counts['leased'] == 0
+
+    def iter_shards(self):
+        """
+        Generate the url_info of every done batch, restricted to the urls
+        the batch completed.
+        """
+        conn = self._connect()
+        shards = [row[0] for row in conn.execute(
+            "SELECT DISTINCT shard FROM urls WHERE state = ? "
+            "ORDER BY shard", (DONE,))]
+        for shard in shards:
+            urls = {row[0] for row in conn.execute(
+                "SELECT url FROM urls WHERE shard = ? AND state = ?",
+                (shard, DONE))}
+            url_info = pd.read_pickle(os.path.join(self.shard_dir, shard))
+            yield url_info[url_info['url'].isin(urls)]
+
+    def collect(self):
+        """
+        :return: pd.DataFrame, the url_info of every done url, or None if
+            no url is done
+        """
+        shards = list(self.iter_shards())
+        if not shards:
+            return None
+        return pd.concat(shards, axis=0, ignore_index=True)
+
+
+class _Heartbeat(object):
+    """
+    Renew the lease of a batch in a background thread, while it is crawled
+    """
+    def __init__(self, queue, batch_id):
+        # sqlite connections can not be shared between threads, the copy
+        # opens its own (see CrawlQueue.__getstate__)
+        self.queue = copy.copy(queue)
+        self.batch_id = batch_id
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self.stopped.wait(self.queue.lease_seconds / 3.0):
+            try:
+                if not self.queue.renew(self.batch_id):
+                    logging.error(
+                        "lost the lease of batch {0}".format(self.batch_id))
+                    return
+            except sqlite3.Error as e:
+                logging.error(repr(e) + ", batch: {0}".format(self.batch_id))
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stopped.set()
+        self.thread.join()
+
+
+def run_worker(queue, comparison, batch_size=200, worker=None, wait=True,
+               poll_interval=10.0):
+    """
+    Crawl the urls of queue until none is left.
+
+    :param queue: CrawlQueue
+    :param comparison: URLComparison used to crawl each batch
+    :param batch_size: INT. Number of urls leased at once. The lease is
+        renewed while the batch is crawled.
+    :param worker: STRING. Name of the worker, defaults to host-pid.
+    :param wait: BOOL. When nothing is pending but other workers hold
+        leases, wait for them to finish or expire instead of returning.
+    :param poll_interval: Seconds between checks while waiting.
+    :return: INT. Number of urls this worker completed.
+    """
+    if worker is None:
+        worker = '{0}-{1}'.format(socket.gethostname(), os.getpid())
+    n_done = 0
+    while True:
+        batch_id, urls = queue.lease(worker, batch_size)
+        if batch_id is None:
+            if not wait or queue.finished:
+                break
+            time.sleep(poll_interval)
+            continue
+        logging.info("%s: batch %d, %d urls", worker, batch_id, len(urls))
+        try:
+            with _Heartbeat(queue, batch_id):
+                url_info = comparison.process_multiple_urls(urls)
+        except Exception as e:
+            logging.error(repr(e) + ", batch: {0}".format(batch_id))
+            queue.release(batch_id)
+            continue
+        n_done += queue.complete(batch_id, url_info)
+        logging.info("%s: %s", worker, queue.counts())
+    return n_done
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Crawl the urls of a CrawlQueue, with the URLComparison "
+        "stored in it")
+    parser.add_argument('queue_path')
+    parser.add_argument('--shard-dir')
+    parser.add_argument('--batch-size', type=int, default=200)
+    parser.add_argument(
+        '--max-worker', type=int,
+        help='number of processes of this worker, defaults to the stored '
+        'configuration')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    queue = CrawlQueue(args.queue_path, args.shard_dir)
+    comparison = queue.get_comparison()
+    if comparison is None:
+        raise ValueError(
+            "no crawl configuration in {0}".format(args.queue_path))
+    if args.max_worker is not None:
+        comparison.max_worker = args.max_worker
+    run_worker(queue, comparison, args.batch_size)
+
+
+if __name__ == '__main__':
+    main()
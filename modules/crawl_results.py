@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+# Copyright (c) Facebook, Inc. and its affiliates. All Rights Reserved
+"""
+Fixed-schema records of the crawl. Each comparison is a namedtuple, which
+is cheap to build in a worker and to pickle back to the parent process,
+and a ResultAccumulator stores them column by column until the url_info
+DataFrame is built, once, at the end of the crawl.
+"""
+
+import collections
+import pandas as pd
+
+COMPARISON_FIELDS = (
+    'success',
+    'message',
+    'dl_ratio',
+    'running_time',
+    'body_length',
+    'same_title',
+    'status_code',
+    'fetch_time',
+    'parse_time',
+    'response_bytes',
+    'diff_time',
+    # the fetch failed with a timeout
+    'timed_out',
+    # only computed with URLComparison(calibrate=True)
+    'dl_ratio_reference',
+)
+
+# output of URLComparison.compare_two_soups
+Comparison = collections.namedtuple(
+    'Comparison', COMPARISON_FIELDS, defaults=(False, None))
+
+# a fetch that no comparison reports, for the metrics
+Fetch = collections.namedtuple(
+    'Fetch', ('fetch_time', 'parse_time', 'response_bytes', 'status_code',
+              'timed_out'))
+
+# one row of url_info. other_fetches (not a column of url_info) are the
+# fetches of the url that no row reports, on the first row only.
+URLResult = collections.namedtuple(
+    'URLResult',
+    ('url', 'key', 'mod_url') + COMPARISON_FIELDS + ('other_fetches',),
+    defaults=(False, None, ()))
+
+
+def url_results(url, comparisons, other_fetches=()):
+    """
+    :param comparisons: list of (key, mod_url, Comparison), the AA test
+        first
+    :param other_fetches: list of Fetch, the fetches of the url that no
+        comparison reports (the original url, the groups of a group test
+        that were split)
+    :return: list of URLResult, one per comparison
+    """
+    return [
+        URLResult(
+            url, key, mod_url, *comparison,
+            other_fetches=tuple(other_fetches) if i == 0 else ())
+        for i, (key, mod_url, comparison) in enumerate(comparisons)]
+
+
+def empty_result(url, message, timed_out=False):
+    """
+    :param timed_out: BOOL. The url was abandoned after a timeout.
+    :return: list of one failed URLResult, for an url that could not be
+        processed at all
+    """
+    return [URLResult(
+        url, None, None, False, message, None, None, None, None, None,
+        None, None, None, None, timed_out)]
+
+
+class ResultAccumulator(object):
+    def __init__(self, calibrate=False):
+        """
+        :param calibrate: BOOL. Keep the dl_ratio_reference column.
+        """
+        self.calibrate = calibrate
+        self.columns = [[] for _field in URLResult._fields]
+        # position of each row among the rows of its url
+        self.index = []
+
+    def add(self, results):
+        """
+        :param results: list of URLResult of one url
+        """
+        for column, values in zip(self.columns, zip(*results)):
+            column.extend(values)
+        self.index.extend(range(len(results)))
+
+    def __len__(self):
+        return len(self.index)
+
+    def to_frame(self):
+        """
+        :return: pd.DataFrame with an index column (the position of the row
+            among the rows of its url) and one column per field of
+            URLResult
+        """
+        data = {'index': self.index}
+        data.update(zip(URLResult._fields, self.columns))
+        # keep the HTTP status codes integers, even with missing ones
+        data['status_code'] = pd.Series(data['status_code'], dtype=object)
+        if not self.calibrate:
+            del data['dl_ratio_reference']
+        del data['other_fetches']
+        return pd.DataFrame(data)
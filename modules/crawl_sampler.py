@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+# Copyright (c) Facebook, Inc. and its affiliates. All Rights Reserved
+"""
+Sample the training urls to crawl. build_param_data only averages qsim and
+same_title per (domain, param), so once a pair has enough samples, or its
+means are known within a confidence bound, crawling more urls with that
+pair is wasted. The sampler caps the urls crawled per pair and skips urls
+whose pairs have all converged, as results come in.
+"""
+
+import math
+import urllib.parse as urlparse
+
+from url_parameters_removal import URLParametersRemoval
+
+
+class RunningMean(object):
+    """
+    Running mean and variance (Welford's algorithm)
+    """
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def add(self, value):
+        self.n += 1
+        delta = value - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (value - self.mean)
+
+    @property
+    def variance(self):
+        if self.n < 2:
+            return float('inf')
+        return self.m2 / (self.n - 1)
+
+    def half_width(self, z=1.96):
+        """
+        Half width of the confidence interval of the mean
+        """
+        if self.n < 2:
+            return float('inf')
+        return z * math.sqrt(self.variance / self.n)
+
+
+class CrawlSampler(object):
+    def __init__(
+            self,
+            url_data,
+            max_per_pair=100,
+            min_samples=10,
+            tolerance=0.05,
+            z=1.96):
+        """
+        :param url_data: pd.DataFrame of the training urls, with columns
+            canonical_url and, optionally, url_id and full_domain
+        :param max_per_pair: INT. Once that many urls with a (domain, param)
+            pair are crawled, the pair no longer makes a url worth crawling.
+            Urls are still crawled for their other pairs.
+        :param min_samples: INT. A pair is not considered converged with
+            fewer samples.
+        :param tolerance: FLOAT. A pair has converged once the confidence
+            intervals of its qsim and same_title means are narrower than
+            that (on either side of the mean).
+        :param z: FLOAT. z-score of the confidence intervals, 1.96 for 95%.
+        """
+        self.max_per_pair = max_per_pair
+        self.min_samples = min_samples
+        self.tolerance = tolerance
+        self.z = z
+        urls = url_data['canonical_url'].values
+        if 'full_domain' in url_data:
+            domains = url_data['full_domain'].values
+        else:
+            domains = [urlparse.urlparse(x).netloc for x in urls]
+        # the url itself is the id: the same url always has the same params
+        url_params = URLParametersRemoval.extract_query_params(urls, urls)
+        self.domains = dict(zip(urls, domains))
+        self.urls = list(urls)
+        self.pairs = {}
+        for url, param in zip(url_params['url_id'], url_params['param']):
+            self.pairs.setdefault(url, []).append((self.domains[url], param))
+        self.scheduled = {}
+        self.qsim = {}
+        self.same_title = {}
+        self.skipped = 0
+
+    def converged(self, pair):
+        qsim = self.qsim.get(pair)
+        if qsim is None or qsim.n < self.min_samples:
+            return False
+        return qsim.half_width(self.z) <= self.tolerance \
+            and self.same_title[pair].half_width(self.z) <= self.tolerance
+
+    def is_open(self, pair):
+        """
+        Whether more urls with pair are worth crawling
+        """
+        return self.scheduled.get(pair, 0) < self.max_per_pair \
+            and not self.converged(pair)
+
+    def iter_urls(self):
+        """
+        Generate the urls to crawl, in order, skipping urls whose pairs are
+        all capped or converged (and urls without params). Decisions use the
+        results added so far, so consume the generator lazily.
+        """
+        for url in self.urls:
+            pairs = self.pairs.get(url, [])
+            if not any(self.is_open(pair) for pair in pairs):
+                self.skipped += 1
+                continue
+            for pair in pairs:
+                self.scheduled[pair] = self.scheduled.get(pair, 0) + 1
+            yield url
+
+    def add_result(self, url, result):
+        """
+        :param url: STRING
+        :param result: list of crawl_results.URLResult, output of
+            URLComparison.process_one_url
+        """
+        domain = self.domains.get(url)
+        for row in result:
+            if row.key is None or not row.success:
+                continue
+            pair = (domain, row.key)
+            if pair not in self.qsim:
+                self.qsim[pair] = RunningMean()
+                self.same_title[pair] = RunningMean()
+            self.qsim[pair].add(float(row.dl_ratio))
+            self.same_title[pair].add(float(row.same_title))
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# Copyright (c) Facebook, Inc. and its affiliates. All Rights Reserved
+"""
+Dictionary encoding of string columns (domains, params, urls) as integer
+codes. Each column is hashed once, by value, so that merges and groupbys
+run on integers, and functions of the value (e.g. is the domain youtube)
+run once per distinct value instead of once per row.
+"""
+
+import numpy as np
+import pandas as pd
+
+
+class Dictionary(object):
+    def __init__(self, values=None):
+        """
+        :param values: initial values, coded in order of first appearance
+        """
+        self.values = pd.Index([], dtype=object)
+        if values is not None:
+            self.encode(values)
+
+    def __len__(self):
+        return len(self.values)
+
+    def encode(self, values, grow=True):
+        """
+        :param values: array-like of strings
+        :param grow: BOOL. Add the values not in the dictionary yet,
+            otherwise code them -1.
+        :return: np.array of int64 codes, -1 for missing values
+        """
+        codes, uniques = pd.factorize(values)
+        positions = self.values.get_indexer(uniques)
+        if grow:
+            new = positions < 0
+            if new.any():
+                positions[new] = np.arange(
+                    len(self.values), len(self.values) + new.sum())
+                self.values = self.values.append(
+                    pd.Index(uniques[new], dtype=object))
+        return np.where(codes < 0, -1, positions[codes])
+
+    def decode(self, codes):
+        """
+        :param codes: np.array of codes, without -1
+        :return: np.array of the values
+        """
+        return self.values.values[codes]
+
+    def apply(self, function, missing=False):
+        """
+        :return: np.array of bool(function(value)) for each value, in code
+            order, then missing: indexing it with codes gives missing for the
+            code -1
+        """
+        return np.array(
+            [bool(function(value)) for value in self.values] + [missing],
+            dtype=bool)
+
+
+def lookup(keys, table, columns):
+    """
+    Left join of keys on table, on (full_domain, param), coded with shared
+    dictionaries so that the join runs on integers. Same as
+    pd.merge(keys, table[['full_domain', 'param'] + columns], how='left'),
+    table having one row per (full_domain, param).
+
+    :param keys: pd.DataFrame with columns full_domain and param
+    :param table: pd.DataFrame with columns full_domain, param and columns
+    :return: pd.DataFrame of columns, one row per row of keys, with a
+        RangeIndex
+    """
+    domains = Dictionary()
+    params = Dictionary()
+    table_codes = pair_codes(
+        domains.encode(table['full_domain']),
+        params.encode(table['param']), len(params))
+    codes = pair_codes(
+        domains.encode(keys['full_domain'], grow=False),
+        params.encode(keys['param'], grow=False), len(params))
+    rows = pd.Index(table_codes).get_indexer(codes)
+    # pairs missing from the table, or with a missing domain or param, get
+    # NaN values, as with a merge
+    rows[codes < 0] = -1
+    return pd.DataFrame({
+        column: pd.api.extensions.take(
+            table[column].values, rows, allow_fill=True)
+        for column in columns})
+
+
+def pair_codes(domain_codes, param_codes, n_params):
+    """
+    :return: np.array of one int64 code per (domain, param) pair, -1 if
+        either code is -1
+    """
+    codes = domain_codes.astype('int64') * max(n_params, 1) + param_codes
+    return np.where((domain_codes < 0) | (param_codes < 0), -1, codes)
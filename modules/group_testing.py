@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# Copyright (c) Facebook, Inc. and its affiliates. All Rights Reserved
+"""
+Group testing of the query params of a url: instead of one fetch per param,
+strip a group of params at once. If the page does not change (beyond the
+change of the AA test), every param of the group is droppable and gets the
+comparison of the group as its row. Otherwise the group is split, known
+trackers apart from the other params first, then in halves, down to single
+params. Urls whose params are mostly trackers then cost a few fetches
+instead of one per param; in the worst case (every param changes the page)
+a url with N params costs 2N - 1 fetches instead of N.
+"""
+
+import urllib.parse as urlparse
+
+from param_matcher import ParamMatcher
+
+
+class GroupTest(object):
+    """
+    Group testing of one url, in rounds: fetch the fetchers of the current
+    round (see fetchers), then call step, until done.
+    """
+    def __init__(self, comparison, url, tolerance=0.02, trackers=None):
+        """
+        :param comparison: URLComparison, used to create fetchers and to
+            compare pages
+        :param url: STRING
+        :param tolerance: FLOAT. A group is unchanged if its dl_ratio is at
+            most that much below the dl_ratio of the AA test (the
+            mean_diff_gsim_lower_bound of keep_params) and the title is the
+            same.
+        :param trackers: Optional ParamMatcher of the known trackers,
+            defaults to ParamMatcher()
+        """
+        self.comparison = comparison
+        self.url = url
+        self.tolerance = tolerance
+        self.trackers = trackers if trackers is not None else ParamMatcher()
+        parsed = urlparse.urlparse(url)
+        self.parsed = parsed
+        self.query = urlparse.parse_qs(parsed.query)
+        self.keys = list(self.query.keys())
+        self.url_with_soup = comparison._fetcher(url)
+        # the AA test needs a second, fresh fetch of the original url
+        self.aa = (None, url, comparison._fetcher(url, refresh=True))
+        self.aa_result = None
+        self.rows = {}
+        # fetchers of the groups that were split, reported by no row
+        self.split_fetchers = []
+        self.groups = [self._group(self.keys)] if self.keys else []
+
+    def _group(self, keys):
+        """
+        :return: (keys, mod_url, fetcher) of the url without keys
+        """
+        query_mod = {
+            key: value for key, value in self.query.items()
+            if key not in keys}
+        mod_url = urlparse.urlunparse(self.parsed._replace(
+            query=urlparse.urlencode(query_mod, True)))
+        return keys, mod_url, self.comparison._fetcher(mod_url)
+
+    @property
+    def done(self):
+        return self.aa_result is not None and not self.groups
+
+    def fetchers(self):
+        """
+        Fetchers of the current round
+        """
+        fetchers = [fetcher for _keys, _mod_url, fetcher in self.groups]
+        if self.aa_result is None:
+            fetchers = [self.url_with_soup, self.aa[2]] + fetchers
+        return fetchers
+
+    def _split(self, keys):
+        trackers = [key for key in keys if self.trackers.match(key)]
+        others = [key for key in keys if not self.trackers.match(key)]
+        if trackers and others:
+            return [trackers, others]
+        half = len(keys) // 2
+        return [keys[:half], keys[half:]]
+
+    def _unchanged(self, result):
+        if not result.success or not self.aa_result.success:
+            return False
+        if result.dl_ratio < self.aa_result.dl_ratio - self.tolerance:
+            return False
+        return result.same_title
+
+    def step(self):
+        """
+        Compare the pages of the current round, and plan the next one
+        """
+        compare = self.comparison.compare_two_soups
+        if self.aa_result is None:
+            self.aa_result = compare(self.url_with_soup, self.aa[2])
+        groups = []
+        for keys, mod_url, fetcher in self.groups:
+            result = compare(self.url_with_soup, fetcher)
+            if len(keys) == 1 or self._unchanged(result):
+                for key in keys:
+                    self.rows[key] = (mod_url, result)
+            else:
+                self.split_fetchers.append(fetcher)
+                groups.extend(self._group(g) for g in self._split(keys))
+        self.groups = groups
+
+    def run(self):
+        """
+        Run every round, fetching as needed
+        """
+        while not self.done:
+            self.step()
+        return self.results()
+
+    def results(self):
+        """
+        :return: list of (key, mod_url, crawl_results.Comparison), the AA
+            test first and then one per key, in the order of the query
+        """
+        return [(None, self.url, self.aa_result)] + [
+            (key,) + self.rows[key] for key in self.keys]
+
+    def other_fetchers(self):
+        """
+        Fetchers whose fetch no row of results reports: the original url
+        and the groups that were split
+        """
+        return [self.url_with_soup] + self.split_fetchers
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+# Copyright (c) Facebook, Inc. and its affiliates. All Rights Reserved
+"""
+Politeness scheduler for the crawl: urls are queued per host and handed out
+round-robin across hosts, with at most max_per_host urls of a host in
+flight, at least min_interval seconds between two urls of a host, and an
+exponential backoff of hosts that answer 429 or 503. Other hosts keep being
+crawled while a host is held back. A url fetches several pages, so the
+fetches themselves are spaced by a HostRateLimiter shared by the workers.
+"""
+
+import time
+import threading
+import collections
+import urllib.parse as urlparse
+
+from url_content_fetcher import THROTTLE_STATUS_CODES
+
+
+class HostScheduler(object):
+    def __init__(
+            self,
+            max_per_host=2,
+            min_interval=0.0,
+            backoff=30.0,
+            max_backoff=600.0,
+            max_retries=3):
+        """
+        :param max_per_host: INT. Maximum number of urls of a host in flight.
+        :param min_interval: FLOAT. Minimum number of seconds between the
+            start of two urls of a host.
+        :param backoff: FLOAT. Seconds a host is held back after its first
+            throttled response, doubled on each throttled response in a row.
+        :param max_backoff: FLOAT. Maximum number of seconds a host is held
+            back.
+        :param max_retries: INT. Number of times a throttled url is queued
+            again before its result is kept as is.
+        """
+        self.max_per_host = max_per_host
+        self.min_interval = min_interval
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.max_retries = max_retries
+        self.queues = collections.OrderedDict()
+        self.in_flight = collections.Counter()
+        self.next_start = {}
+        self.delays = {}
+        self.retries = collections.Counter()
+        self.queued = 0
+
+    @staticmethod
+    def is_throttled(result):
+        """
+        Whether any fetch of a url was throttled
+
+        :param result: list of crawl_results.URLResult, output of
+            URLComparison.process_one_url
+        """
+        return any(
+            row.status_code in THROTTLE_STATUS_CODES for row in result)
+
+    @staticmethod
+    def host(url):
+        return urlparse.urlparse(url).netloc
+
+    def __len__(self):
+        """
+        Number of queued urls, not counting those in flight
+        """
+        return self.queued
+
+    def add(self, url):
+        self.queues.setdefault(self.host(url), collections.deque()).append(url)
+        self.queued += 1
+
+    def _ready(self, host, now):
+        return self.in_flight[host] < self.max_per_host \
+            and self.next_start.get(host, 0) <= now
+
+    def next_url(self, now=None):
+        """
+        Return the next url to start, from the first ready host in
+        round-robin order, or None if no host is ready.
+        """
+        now = time.time() if now is None else now
+        for host in list(self.queues):
+            if not self._ready(host, now):
+                continue
+            queue = self.queues.pop(host)
+            url = queue.popleft()
+            if queue:
+                # the host goes to the back of the round
+                self.queues[host] = queue
+            self.queued -= 1
+            self.in_flight[host] += 1
+            self.next_start[host] = max(
+                self.next_start.get(host, 0), now + self.min_interval)
+            return url
+        return None
+
+    def wait_time(self, now=None):
+        """
+        Seconds until a queued url may be ready (0 if one is ready now), or
+        None if every host with queued urls is waiting on urls in flight.
+        """
+        now = time.time() if now is None else now
+        wait_times = [
+            max(self.next_start.get(host, 0) - now, 0)
+            for host in self.queues
+            if self.in_flight[host] < self.max_per_host]
+        return min(wait_times) if wait_times else None
+
+    def finished(self, url, throttled=False, now=None):
+        """
+        Record that url is done. A throttled url holds its host back, and
+        is queued again (at the front of its host) unless it ran out of
+        retries.
+
+        :return: BOOL, whether url was queued again
+        """
+        now = time.time() if now is None else now
+        host = self.host(url)
+        self.in_flight[host] -= 1
+        if not throttled:
+            self.delays.pop(host, None)
+            self.retries.pop(url, None)
+            return False
+        delay = self.delays.get(host)
+        delay = self.backoff if delay is None \
+            else min(delay * 2, self.max_backoff)
+        self.delays[host] = delay
+        self.next_start[host] = max(self.next_start.get(host, 0), now + delay)
+        if self.retries[url] >= self.max_retries:
+            self.retries.pop(url, None)
+            return False
+        self.retries[url] += 1
+        self.queues.setdefault(host, collections.deque()).appendleft(url)
+        self.queued += 1
+        return True
+
+
+class HostRateLimiter(object):
+    """
+    At least min_interval seconds between two fetches of a host, across the
+    worker processes of a crawl: each fetch reserves the next free slot of
+    its host, then sleeps until that slot.
+    """
+    def __init__(self, min_interval, manager=None):
+        """
+        :param min_interval: FLOAT. Minimum number of seconds between the
+            start of two fetches of a host.
+        :param manager: Optional multiprocessing manager holding the slots,
+            so that the limiter can be shared with worker processes.
+            Without it, the limiter is only shared by threads.
+        """
+        self.min_interval = min_interval
+        if manager is None:
+            self.next_fetch = {}
+            self.lock = threading.Lock()
+        else:
+            self.next_fetch = manager.dict()
+            self.lock = manager.Lock()
+
+    def reserve(self, url, now=None):
+        """
+        Reserve the next free slot of the host of url
+
+        :return: FLOAT, seconds to wait until the slot
+        """
+        host = HostScheduler.host(url)
+        with self.lock:
+            now = time.time() if now is None else now
+            start = max(self.next_fetch.get(host, 0), now)
+            self.next_fetch[host] = start + self.min_interval
+        return start - now
+
+    def wait(self, url):
+        """
+        Block until url may be fetched
+        """
+        delay = self.reserve(url)
+        if delay > 0:
+            time.sleep(delay)
@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+# Copyright (c) Facebook, Inc. and its affiliates. All Rights Reserved
+"""
+Counters, histograms and stage timers for a run, written out through a
+pluggable sink: kept in memory (MemorySink), appended as JSON lines
+(JSONLinesSink) or written as a Prometheus text file (PrometheusTextSink)
+for the node exporter textfile collector.
+
+Worker processes do not record metrics: they return their timings as result
+columns, and the parent process records them.
+"""
+
+import os
+import json
+import time
+import bisect
+import contextlib
+
+# seconds
+DEFAULT_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+BYTES_BUCKETS = (
+    1024, 4 * 1024, 16 * 1024, 64 * 1024, 256 * 1024, 1024 * 1024,
+    4 * 1024 * 1024, 16 * 1024 * 1024)
+# label value shared by the domains beyond Metrics.max_domains
+OTHER_DOMAIN = 'other'
+
+_metrics = None
+
+
+class Histogram(object):
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        # one count per bucket, plus one for +Inf
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative_counts(self):
+        """
+        :return: list of (upper bound, number of values <= upper bound), the
+            last upper bound is '+Inf'
+        """
+        total = 0
+        cumulative = []
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            total += count
+            cumulative.append((bound, total))
+        return cumulative
+
+
+class Metrics(object):
+    def __init__(self, sink=None, max_domains=1000):
+        """
+        :param sink: Optional sink with a write(snapshot) method, see
+            MemorySink, JSONLinesSink and PrometheusTextSink. Without a sink
+            metrics are only kept in memory, see snapshot.
+        :param max_domains: INT. Number of distinct domains used as label
+            values, later domains are counted as OTHER_DOMAIN.
+        """
+        self.sink = sink
+        self.max_domains = max_domains
+        self.counters = {}
+        self.histograms = {}
+        self.domains = set()
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def domain(self, domain):
+        """
+        Label value of domain, bounded to max_domains distinct values
+        """
+        if domain in self.domains:
+            return domain
+        if len(self.domains) < self.max_domains:
+            self.domains.add(domain)
+            return domain
+        return OTHER_DOMAIN
+
+    def inc(self, name, value=1, **labels):
+        key = self._key(name, labels)
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, buckets=DEFAULT_BUCKETS, **labels):
+        key = self._key(name, labels)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = Histogram(buckets)
+            self.histograms[key] = histogram
+        histogram.observe(value)
+
+    @contextlib.contextmanager
+    def timer(self, name, **labels):
+        """
+        Add the wall time of the block, in seconds, to the counter name
+        """
+        start_time = time.time()
+        try:
+            yield
+        finally:
+            self.inc(name, time.time() - start_time, **labels)
+
+    def snapshot(self):
+        """
+        :return: dict of the current values, as written to sinks
+        """
+        return {
+            'time': time.time(),
+            'counters': [
+                {'name': name, 'labels': dict(labels), 'value': value}
+                for (name, labels), value in sorted(self.counters.items())],
+            'histograms': [
+                {'name': name, 'labels': dict(labels),
+                 'count': histogram.count, 'sum': histogram.sum,
+                 'buckets': histogram.cumulative_counts()}
+                for (name, labels), histogram
+                in sorted(self.histograms.items(), key=lambda x: x[0])],
+        }
+
+    def flush(self):
+        """
+        Write the current values to the sink, if any
+        """
+        if self.sink is not None:
+            self.sink.write(self.snapshot())
+
+
+class MemorySink(object):
+    """
+    Keep every snapshot written, e.g. to inspect them in a notebook
+    """
+    def __init__(self):
+        self.snapshots = []
+
+    def write(self, snapshot):
+        self.snapshots.append(snapshot)
+
+
+class JSONLinesSink(object):
+    """
+    Append each snapshot to a file, as one line of JSON
+    """
+    def __init__(self, path):
+        self.path = path
+
+    def write(self, snapshot):
+        with open(self.path, 'a') as f:
+            f.write(json.dumps(snapshot) + '\n')
+
+
+class PrometheusTextSink(object):
+    """
+    Write the last snapshot to a file in the Prometheus text format. The file
+    is replaced atomically, so a collector never reads it half written.
+    """
+    def __init__(self, path, prefix='url_sanitization_'):
+        self.path = path
+        self.prefix = prefix
+
+    def write(self, snapshot):
+        lines = []
+        typed = set()
+        for counter in snapshot['counters']:
+            name = self.prefix + counter['name']
+            if name not in typed:
+                lines.append('# TYPE {0} counter'.format(name))
+                typed.add(name)
+            lines.append('{0}{1} {2}'.format(
+                name, _format_labels(counter['labels']),
+                _format_value(counter['value'])))
+        for histogram in snapshot['histograms']:
+            name = self.prefix + histogram['name']
+            if name not in typed:
+                lines.append('# TYPE {0} histogram'.format(name))
+                typed.add(name)
+            for bound, count in histogram['buckets']:
+                labels = dict(histogram['labels'], le=_format_value(bound))
+                lines.append('{0}_bucket{1} {2}'.format(
+                    name, _format_labels(labels), count))
+            labels = _format_labels(histogram['labels'])
+            lines.append('{0}_sum{1} {2}'.format(
+                name, labels, _format_value(histogram['sum'])))
+            lines.append('{0}_count{1} {2}'.format(
+                name, labels, histogram['count']))
+        with open(self.path + '.tmp', 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+        os.replace(self.path + '.tmp', self.path)
+
+
+def _format_value(value):
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(
+        '{0}="{1}"'.format(
+            key, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+        for key, value in sorted(labels.items())) + '}'
+
+
+def get_metrics():
+    """
+    Return the Metrics of this process, used when none is passed explicitly
+    """
+    global _metrics
+    if _metrics is None:
+        _metrics = Metrics()
+    return _metrics
+
+
+def set_metrics(metrics):
+    """
+    Replace the Metrics of this process, e.g. to give it a sink
+    """
+    global _metrics
+    _metrics = metrics
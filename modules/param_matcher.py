@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+# Copyright (c) Facebook, Inc. and its affiliates. All Rights Reserved
+"""
+Match query parameter names against drop lists: exact names (hash set),
+prefixes (trie), tokens of the name and substrings (Aho-Corasick
+automaton). Each distinct name is classified once, so lists of thousands of
+names stay cheap on frames with millions of (url, param) rows.
+"""
+
+import re
+import numpy as np
+import pandas as pd
+
+# pii related parameters
+PII_PARAMS = [
+    'pw', 'pass', 'password', 'key', 'username', 'name', 'email',
+    'address', 'account', 'password', 'ssn', 'dob', 'zipcode',
+    'user_id', 'userid', 'accountid', 'account_id',
+]
+# words of a name that make it pii, wherever they appear: 'user_email',
+# 'newPassword', 'api-key'
+PII_TOKENS = [
+    'pw', 'pass', 'passwd', 'password', 'key', 'user', 'username', 'userid',
+    'name', 'email', 'address', 'account', 'accountid', 'ssn', 'dob',
+    'zipcode', 'phone',
+]
+# Parameters that we obviously need to remove
+DROP_PARAMS = PII_PARAMS + [
+    # commonly occuring tracking/token-related parameters
+    'utm_source', 'utm_medium', 'utm_campaign', 'utm_content', 'source',
+    'utm_term', 'usp', 'edit_requested', 'ogsrc', 'fbclid',
+    'entrypoint', 'redirect', 'platform', 'widgetTypeCall', 'logType',
+    'uuid', 'app_id', 'campaign', 'src', 'caption', 'fbrefresh',
+    'user', 'cp', 'desc', 'c_id', 'geo', 'cmpid', 'cHash', '_reff',
+    'pk_campaign', 'ctype', 's_src', 'referrer',
+    'channel', 'userid', 'uc_param_str', 'fb-share-results', 'cpidfb',
+    'content_type', 'tag', 'campaign_id', 'cID', 'channel_id',
+    'NONCE_TOKEN', 'reco_id', 'promo_id',
+]
+DROP_PREFIXES = ['utm_']
+
+_SEPARATORS = re.compile(r'[_\-.\s]+')
+# words of a camelCase part: 'APIKey' is 'API', 'Key'
+_WORDS = re.compile(r'[A-Z]+(?![a-z])|[A-Z]?[a-z]+|[0-9]+')
+
+
+def tokenize(name):
+    """
+    Split a param name into lower case words, on '_', '-', '.' and camelCase
+    boundaries: 'newPassword' gives ['new', 'password']
+    """
+    return [
+        word.lower()
+        for part in _SEPARATORS.split(name)
+        for word in _WORDS.findall(part)]
+
+
+class _Trie(object):
+    """
+    Trie of patterns, with Aho-Corasick failure links when built for
+    substring search.
+    """
+    def __init__(self, patterns, substrings=False):
+        self.goto = [{}]
+        self.output = [None]
+        for pattern in patterns:
+            node = 0
+            for char in pattern:
+                if char not in self.goto[node]:
+                    self.goto.append({})
+                    self.output.append(None)
+                    self.goto[node][char] = len(self.goto) - 1
+                node = self.goto[node][char]
+            if self.output[node] is None:
+                self.output[node] = pattern
+        self.fail = None
+        if substrings:
+            self._build_failure_links()
+
+    def _build_failure_links(self):
+        self.fail = [0] * len(self.goto)
+        queue = list(self.goto[0].values())
+        for node in queue:
+            for char, child in self.goto[node].items():
+                queue.append(child)
+                fail = self.fail[node]
+                while fail and char not in self.goto[fail]:
+                    fail = self.fail[fail]
+                fail_child = self.goto[fail].get(char, 0)
+                self.fail[child] = fail_child if fail_child != child else 0
+                if self.output[child] is None:
+                    self.output[child] = self.output[self.fail[child]]
+
+    def prefix(self, text):
+        """
+        Shortest pattern that text starts with, or None
+        """
+        node = 0
+        for char in text:
+            node = self.goto[node].get(char)
+            if node is None:
+                return None
+            if self.output[node] is not None:
+                return self.output[node]
+        return None
+
+    def search(self, text):
+        """
+        First pattern found in text, or None
+        """
+        node = 0
+        for char in text:
+            while node and char not in self.goto[node]:
+                node = self.fail[node]
+            node = self.goto[node].get(char, 0)
+            if self.output[node] is not None:
+                return self.output[node]
+        return None
+
+
+class ParamMatcher(object):
+    def __init__(
+            self,
+            exact=DROP_PARAMS,
+            prefixes=DROP_PREFIXES,
+            substrings=(),
+            ignore_case=False,
+            tokens=PII_TOKENS):
+        """
+        :param exact: list of param names to match exactly
+        :param prefixes: list of prefixes, e.g. 'utm_' matches 'utm_id'
+        :param tokens: list of words matched against the words of the name
+            (see tokenize), whatever the case: 'email' matches 'user_email'
+            and 'emailAddress', not 'emails'. The pii words by default, the
+            tracking params (e.g. 'tag') only match exactly.
+        :param substrings: list of substrings matched anywhere in the name.
+            Use sparingly, 'tag' would also match 'stage'.
+        :param ignore_case: BOOL. Compare names case-insensitively.
+        """
+        self.ignore_case = ignore_case
+        self.exact = frozenset(self._fold(p) for p in exact)
+        self.prefixes = _Trie(self._fold(p) for p in prefixes)
+        self.tokens = frozenset(t.lower() for t in tokens)
+        self.substrings = _Trie(
+            (self._fold(p) for p in substrings), substrings=True)
+
+    def _fold(self, name):
+        return name.lower() if self.ignore_case else name
+
+    def match(self, param):
+        """
+        :param param: STRING. Query parameter name
+        :return: the rule that matched, as 'exact:<name>',
+            'prefix:<prefix>', 'token:<token>' or 'substring:<substring>',
+            or None
+        """
+        name = self._fold(param)
+        if name in self.exact:
+            return 'exact:' + name
+        prefix = self.prefixes.prefix(name)
+        if prefix is not None:
+            return 'prefix:' + prefix
+        if self.tokens:
+            for token in tokenize(param):
+                if token in self.tokens:
+                    return 'token:' + token
+        substring = self.substrings.search(name)
+        if substring is not None:
+            return 'substring:' + substring
+        return None
+
+    def classify(self, params):
+        """
+        Classify a column of param names, each distinct name once.
+
+        :param params: pd.Series of param names
+        :return: pd.Series of the rule that matched each name (see match),
+            None if no rule matched, 'null' if the name is missing
+        """
+        codes, distinct = pd.factorize(params)
+        rules = np.array(
+            [self.match(str(param)) for param in distinct] + ['null'],
+            dtype=object)
+        # missing names have code -1, which picks the trailing 'null'
+        return pd.Series(rules[codes], index=params.index)
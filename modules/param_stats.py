@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+# Copyright (c) Facebook, Inc. and its affiliates. All Rights Reserved
+"""
+Per-domain parameter statistics kept across training runs: param_domain
+(see URLParametersRemoval.build_param_data) plus the number of samples each
+mean was computed from, so that a retrain only crawls the (domain, param)
+pairs that are new or under-sampled and merges its means into the stored
+ones.
+"""
+
+import numpy as np
+import pandas as pd
+
+from url_parameters_removal import URLParametersRemoval
+
+# means over the AB tests of a (domain, param) pair, and over the AA tests of
+# a domain
+PAIR_MEANS = ['qsim', 'same_title', 'body_length']
+DOMAIN_MEANS = ['gsim_mean', 'same_title_mean']
+STATS_COLUMNS = [
+    'full_domain', 'param'] + PAIR_MEANS + DOMAIN_MEANS + [
+    'diff_gsim', 'diff_same_title', 'n_samples', 'n_aa_samples']
+
+
+class ParamStats(object):
+    def __init__(self, stats=None):
+        """
+        :param stats: Optional pd.DataFrame with the columns STATS_COLUMNS.
+            Empty stats by default.
+        """
+        if stats is None:
+            stats = pd.DataFrame(columns=STATS_COLUMNS)
+        self.stats = stats[STATS_COLUMNS].reset_index(drop=True)
+
+    @classmethod
+    def from_url_data(cls, url_data_with_similarity):
+        """
+        :param url_data_with_similarity: output of
+            URLParametersRemoval.append_url_similarity
+        """
+        stats = URLParametersRemoval.build_param_data(url_data_with_similarity)
+        is_aa = URLParametersRemoval.is_aa_test(
+            url_data_with_similarity['param'])
+        n_samples = url_data_with_similarity[~is_aa].groupby(
+            ['full_domain', 'param']).size().rename('n_samples')
+        n_aa_samples = url_data_with_similarity[is_aa].groupby(
+            'full_domain').size().rename('n_aa_samples')
+        stats = stats.merge(
+            n_samples.reset_index(), on=['full_domain', 'param'])
+        stats = stats.merge(n_aa_samples.reset_index(), on='full_domain')
+        return cls(stats)
+
+    @property
+    def param_domain(self):
+        """
+        The stats in the format of URLParametersRemoval.build_param_data
+        """
+        return self.stats.drop(columns=['n_samples', 'n_aa_samples'])
+
+    def __len__(self):
+        return self.stats.shape[0]
+
+    def select_urls(self, url_data, min_samples=10):
+        """
+        Select the urls to crawl: those with at least one (domain, param)
+        pair that is not in the stats, or that has fewer than min_samples
+        samples.
+
+        :param url_data: pd.DataFrame with columns canonical_url, url_id and
+            full_domain
+        :return: the selected rows of url_data
+        """
+        url_params = URLParametersRemoval.extract_query_params(
+            url_data['canonical_url'], url_data['url_id'])
+        url_params = url_params.merge(
+            url_data[['url_id', 'full_domain']].drop_duplicates('url_id'),
+            on='url_id')
+        url_params = url_params.merge(
+            self.stats[['full_domain', 'param', 'n_samples']],
+            how='left', on=['full_domain', 'param'])
+        needed = url_params['n_samples'].isnull() \
+            | (url_params['n_samples'] < min_samples)
+        return url_data[
+            url_data['url_id'].isin(url_params['url_id'][needed])]
+
+    def merge(self, other):
+        """
+        Merge the stats of a new crawl into these ones, each mean weighted by
+        its number of samples.
+
+        :param other: ParamStats
+        :return: a new ParamStats
+        """
+        pairs = _merge_means(
+            self.stats, other.stats, ['full_domain', 'param'], PAIR_MEANS,
+            'n_samples')
+        domains = _merge_means(
+            self.stats.drop_duplicates('full_domain'),
+            other.stats.drop_duplicates('full_domain'),
+            ['full_domain'], DOMAIN_MEANS, 'n_aa_samples')
+        stats = pairs.merge(domains, on='full_domain')
+        stats['diff_gsim'] = stats['gsim_mean'] - stats['qsim']
+        stats['diff_same_title'] = \
+            stats['same_title_mean'] - stats['same_title'].astype('float64')
+        return ParamStats(stats)
+
+    def save(self, path):
+        """
+        Save as a TSV file (compressed if path ends with .gz).
+        """
+        self.stats.to_csv(path, index=False, sep='\t')
+
+    @classmethod
+    def load(cls, path):
+        return cls(pd.read_csv(
+            path, sep='\t', header=0,
+            dtype={'full_domain': str, 'param': str},
+            keep_default_na=False, na_values={
+                column: [''] for column in STATS_COLUMNS[2:]}))
+
+
+def _merge_means(old, new, keys, means, count):
+    """
+    Outer join the means of old and new on keys, as running means weighted by
+    the count column.
+    """
+    merged = old[keys + means + [count]].merge(
+        new[keys + means + [count]], how='outer', on=keys,
+        suffixes=('_old', '_new'))
+    n_old = merged[count + '_old'].fillna(0).values
+    n_new = merged[count + '_new'].fillna(0).values
+    n = n_old + n_new
+    for column in means:
+        old_mean = merged[column + '_old'].astype('float64').fillna(0).values
+        new_mean = merged[column + '_new'].astype('float64').fillna(0).values
+        with np.errstate(invalid='ignore', divide='ignore'):
+            merged[column] = (old_mean * n_old + new_mean * n_new) / n
+    merged[count] = n.astype('int64')
+    return merged[keys + means + [count]]
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+# Copyright (c) Facebook, Inc. and its affiliates. All Rights Reserved
+"""
+Detect phone numbers in query parameter values. phonenumbers is slow, so
+values are prefiltered on their number of digits and results are memoized:
+the same values (e.g. ref=home) repeat across millions of urls.
+"""
+
+import re
+import functools
+import phonenumbers
+
+DEFAULT_REGIONS = (
+    'IN', 'US', 'BR', 'ID', 'MX', 'PI',
+    'VN', 'TH', 'TR', 'GB', 'FR', 'DE')
+# no number of the default regions has fewer digits than that (up to 3 digits
+# were checked exhaustively), so shorter values are skipped
+MIN_PHONE_DIGITS = 3
+
+_DIGIT = re.compile(r'\d')
+_detectors = {}
+
+
+class PhoneNumberDetector(object):
+    def __init__(
+            self,
+            regions=DEFAULT_REGIONS,
+            min_digits=MIN_PHONE_DIGITS,
+            cache_size=1 << 16):
+        """
+        :param regions: list of regions whose phone number formats are
+            looked for
+        :param min_digits: INT. Values with fewer digits are not checked.
+        :param cache_size: INT. Number of values whose result is memoized.
+        """
+        self.regions = tuple(regions)
+        self.min_digits = min_digits
+        self._cached_has_phone = functools.lru_cache(maxsize=cache_size)(
+            self._has_phone)
+
+    def _has_phone(self, value):
+        for region in self.regions:
+            for _ in phonenumbers.PhoneNumberMatcher(value, region):
+                return True
+        return False
+
+    def has_phone(self, value):
+        """
+        Whether value contains a phone number of any of the regions
+        """
+        if len(_DIGIT.findall(value)) < self.min_digits:
+            return False
+        return self._cached_has_phone(value)
+
+    def has_phone_many(self, values):
+        """
+        Check many values, each distinct value once.
+
+        :param values: iterable of strings
+        :return: dict of value -> bool
+        """
+        return {value: self.has_phone(value) for value in set(values)}
+
+    def cache_info(self):
+        return self._cached_has_phone.cache_info()
+
+
+def get_detector(regions=None):
+    """
+    Return the PhoneNumberDetector of this process for regions (default
+    regions if None), so that its cache is shared by all callers.
+    """
+    regions = DEFAULT_REGIONS if regions is None else tuple(regions)
+    detector = _detectors.get(regions)
+    if detector is None:
+        detector = PhoneNumberDetector(regions)
+        _detectors[regions] = detector
+    return detector
@@ -1,65 +1,289 @@
 #!/usr/bin/env python3
 # Copyright (c) Facebook, Inc. and its affiliates. All Rights Reserved
 import pandas as pd
-import json
-import csv
+import os
+import functools
+import urllib.parse as urlparse
 
 from url_comparison import URLComparison
+from url_content_cache import URLContentCache
 from url_parameters_removal import URLParametersRemoval
+from url_rules import URLRules
+from param_stats import ParamStats
+from crawl_sampler import CrawlSampler
+from crawl_archive import CrawlArchive
+from crawl_queue import CrawlQueue, run_worker
+from metrics import get_metrics
+from table_io import read_url_data, CleanURLWriter
+
+# wall time of each step, by stage
+STAGE_SECONDS = 'stage_seconds_total'
 
 
 def process_urls(
         url_training_data_path,
         url_full_data_path,
         output_data_path,
-        proxies=None):
+        proxies=None,
+        cache_path=None,
+        rules_output_path=None,
+        apply_workers=None,
+        checkpoint_dir=None,
+        chunksize=None,
+        stats_path=None,
+        min_samples=10,
+        max_urls_per_param=None,
+        metrics=None,
+        archive_path=None,
+        replay=False,
+        queue_path=None,
+        queue_batch_size=200):
     """
     :param url_training_data_path: STRING. Path for a tsv file. Expect the file
         to have a header line with three columns (canonical_url, url_id,
         full_domain). Avoid csv type in purpose, since URL strings may contain
-        comma.
+        comma. Parquet (.parquet) and Arrow (.arrow, .feather) files with the
+        same columns are read too, see table_io.
     :param url_full_data_path: STRING. Path for a tsv file. Expect the file
         to have a header line with three columns (canonical_url, url_id,
         full_domain). Avoid csv type in purpose, since URL strings may contain
-        comma.
-    :param output_data_path: STRING. Path for the output file.
+        comma. Parquet and Arrow files are read too.
+    :param output_data_path: STRING. Path for the output file. Written as
+        Parquet or Arrow, with a full_domain column, if the path has one of
+        their extensions.
     :param proxies: Optional. This argument can be used to configure proxy
         settings for HTTP and/or HTTPS. See requests documentation for
         additional information.
+    :param cache_path: Optional. Path of a SQLite file used to cache fetched
+        pages, so that each distinct URL is only downloaded once.
+    :param rules_output_path: Optional. Path where the learned per-domain
+        rules are saved, to clean more URLs later with apply_rules.
+    :param apply_workers: Optional. Number of processes used to clean the
+        full data, see URLParametersRemoval.remove_pii_params_parallel.
+    :param checkpoint_dir: Optional. Directory where cleaned partitions are
+        saved as they complete, so that a rerun resumes (with apply_workers).
+    :param chunksize: Optional. Read, clean and write the full data this many
+        rows at a time, so that memory stays bounded whatever the size of
+        the file. Urls are then sorted within each chunk only, and a url
+        repeated across chunks is written once per chunk.
+    :param stats_path: Optional. Path of the per-domain statistics table
+        (see param_stats.ParamStats) for incremental training. If the file
+        exists, only the training urls with a (domain, param) pair that is
+        new or has fewer than min_samples samples are crawled, and their
+        statistics are merged into the stored ones. The table is then saved
+        back to stats_path.
+    :param min_samples: INT. See stats_path.
+    :param max_urls_per_param: Optional INT. Crawl at most that many training
+        urls per (domain, param) pair, and stop crawling a pair earlier once
+        its qsim and same_title means have converged, see
+        crawl_sampler.CrawlSampler.
+    :param metrics: Optional metrics.Metrics where the wall time of each
+        step (stage_seconds_total) and the crawl metrics are recorded, and
+        flushed to its sink at the end. Defaults to metrics.get_metrics().
+    :param archive_path: Optional. Path of a crawl_archive.CrawlArchive
+        where every fetched page is recorded.
+    :param replay: BOOL. Read the pages from archive_path instead of the
+        network, e.g. to tune the similarity thresholds offline.
+    :param queue_path: Optional. Path of a crawl_queue.CrawlQueue the
+        training urls are crawled through, in batches of queue_batch_size
+        urls saved as they complete. A rerun after a crash only crawls the
+        urls that are not done yet, and workers started on other hosts
+        (python crawl_queue.py queue_path) share the crawl, with the same
+        URLComparison options. Duplicated
+        training urls are crawled once. Not supported with
+        max_urls_per_param.
+    :param queue_batch_size: INT. See queue_path.
     """
-    input_data = pd.read_csv(
-        url_training_data_path,
-        dtype={'canonical_url': str, 'url_id': str, 'full_domain': str},
-        sep='\t',
-        header=0)
-    url_list = input_data['canonical_url'].values
+    if queue_path is not None and max_urls_per_param is not None:
+        raise ValueError("max_urls_per_param does not support queue_path")
+    if metrics is None:
+        metrics = get_metrics()
+    with metrics.timer(STAGE_SECONDS, stage='read'):
+        input_data = read_url_data(url_training_data_path)
+        stats = None
+        if stats_path is not None and os.path.exists(stats_path):
+            stats = ParamStats.load(stats_path)
+            # only crawl the urls with new or under-sampled (domain, param)
+            # pairs
+            input_data = stats.select_urls(input_data, min_samples)
+        url_list = input_data['canonical_url'].values
+
+        if chunksize is None:
+            url_data = read_url_data(url_full_data_path)
+    if stats is not None and len(url_list) == 0:
+        param_domain = stats.param_domain
+    else:
+        with metrics.timer(STAGE_SECONDS, stage='crawl'):
+            cache = None
+            if cache_path is not None:
+                cache = URLContentCache(cache_path)
+            archive = None
+            if archive_path is not None:
+                archive = CrawlArchive(archive_path)
+            run_batch = URLComparison(
+                proxies=proxies, cache=cache, metrics=metrics,
+                archive=archive, replay=replay)
+            sampler = None
+            if max_urls_per_param is not None:
+                sampler = CrawlSampler(
+                    input_data, max_per_pair=max_urls_per_param)
+            if queue_path is None:
+                url_info = run_batch.process_multiple_urls(
+                    url_list, sampler)
+            else:
+                queue = CrawlQueue(queue_path)
+                queue.add(url_list)
+                # workers started on other hosts crawl with the same options
+                queue.set_comparison(run_batch)
+                run_worker(queue, run_batch, queue_batch_size)
+                url_info = queue.collect()
+                if url_info is None:
+                    raise ValueError("no url of the queue was crawled")
+
+        with metrics.timer(STAGE_SECONDS, stage='similarity'):
+            if chunksize is None:
+                url_data_with_similarity = URLParametersRemoval(
+                    url_data).append_url_similarity(url_info)
+            else:
+                # first pass: only keep the rows of the training urls
+                url_data_with_similarity = pd.concat([
+                    URLParametersRemoval(url_data).append_url_similarity(
+                        url_info)
+                    for url_data in read_url_data(
+                        url_full_data_path, chunksize)])
+        with metrics.timer(STAGE_SECONDS, stage='param_data'):
+            if stats_path is None:
+                param_domain = URLParametersRemoval.build_param_data(
+                    url_data_with_similarity)
+            else:
+                new_stats = ParamStats.from_url_data(
+                    url_data_with_similarity)
+                if stats is not None:
+                    new_stats = stats.merge(new_stats)
+                new_stats.save(stats_path)
+                param_domain = new_stats.param_domain
+    if rules_output_path is not None:
+        with metrics.timer(STAGE_SECONDS, stage='rules'):
+            URLRules.from_param_domain(param_domain).save(rules_output_path)
+
+    drop_params = functools.partial(
+        URLParametersRemoval.drop_params_via_similarity,
+        param_domain=param_domain)
+    if chunksize is None:
+        clean_urls = _clean_url_data(
+            url_data, drop_params, apply_workers, checkpoint_dir, metrics)
+        with metrics.timer(STAGE_SECONDS, stage='write'):
+            _write_clean_urls(clean_urls, output_data_path)
+    else:
+        _clean_url_data_in_chunks(
+            url_full_data_path, output_data_path, chunksize, drop_params,
+            apply_workers, checkpoint_dir, metrics)
+    metrics.flush()
 
-    run_batch = URLComparison(
-        proxies=proxies)
-    url_info = run_batch.process_multiple_urls(url_list)
 
-    url_data = pd.read_csv(
+def apply_rules(
         url_full_data_path,
-        dtype={'canonical_url': str, 'url_id': str, 'full_domain': str},
-        sep='\t',
-        header=0)
-
-    removal = URLParametersRemoval(url_data)
-    url_data_with_params = removal.parse_urls_for_param()
-    url_data_with_similarity = removal.append_url_similarity(
-        url_info)
-    param_domain = URLParametersRemoval.build_param_data(
-        url_data_with_similarity)
-    url_data_with_params = url_data.merge(
-        url_data_with_params, how='inner')
-    urls = URLParametersRemoval.drop_params_via_similarity(
-        url_data_with_params, param_domain)
-
-    clean_urls = URLParametersRemoval.remove_pii_params(urls)
-    clean_urls['params_dropped'] = [
-        json.dumps(x) for x in clean_urls['params_dropped']]
-    clean_urls['params_kept'] = [
-        json.dumps(x) for x in clean_urls['params_kept']]
-    clean_urls.to_csv(
-        output_data_path, index=False, header=True, sep='\t',
-        quoting=csv.QUOTE_NONE)
+        rules_path,
+        output_data_path,
+        apply_workers=None,
+        checkpoint_dir=None,
+        chunksize=None,
+        metrics=None):
+    """
+    Clean URLs with rules saved by process_urls (rules_output_path), without
+    any network access.
+
+    :param url_full_data_path: STRING. Path for a tsv, Parquet or Arrow file,
+        same format as for process_urls.
+    :param rules_path: STRING. Path of a rule file.
+    :param output_data_path: STRING. Path for the output file.
+    :param apply_workers: Optional. Same as for process_urls.
+    :param checkpoint_dir: Optional. Same as for process_urls.
+    :param chunksize: Optional. Same as for process_urls.
+    :param metrics: Optional. Same as for process_urls.
+    """
+    if metrics is None:
+        metrics = get_metrics()
+    rules = URLRules.load(rules_path)
+    drop_params = functools.partial(
+        URLParametersRemoval.drop_params_via_rules, rules=rules.to_frame())
+    if chunksize is None:
+        with metrics.timer(STAGE_SECONDS, stage='read'):
+            url_data = read_url_data(url_full_data_path)
+        clean_urls = _clean_url_data(
+            url_data, drop_params, apply_workers, checkpoint_dir, metrics)
+        with metrics.timer(STAGE_SECONDS, stage='write'):
+            _write_clean_urls(clean_urls, output_data_path)
+    else:
+        _clean_url_data_in_chunks(
+            url_full_data_path, output_data_path, chunksize, drop_params,
+            apply_workers, checkpoint_dir, metrics)
+    metrics.flush()
+
+
+def _clean_url_data(
+        url_data, drop_params, apply_workers, checkpoint_dir, metrics):
+    """
+    Clean the urls of url_data, with drop_params deciding which params to
+    keep. Return None if no url has a query parameter.
+    """
+    with metrics.timer(STAGE_SECONDS, stage='parse_params'):
+        removal = URLParametersRemoval(url_data)
+        url_data_with_params = removal.parse_urls_for_param()
+        if 'full_domain' not in url_data:
+            url_data['full_domain'] = [
+                urlparse.urlparse(x).netloc
+                for x in url_data['canonical_url'].values
+            ]
+        url_data_with_params = url_data.merge(
+            url_data_with_params, how='inner')
+    metrics.inc('urls_read_total', url_data.shape[0])
+    if url_data_with_params.shape[0] == 0:
+        return None
+    with metrics.timer(STAGE_SECONDS, stage='drop_params'):
+        urls = drop_params(url_data_with_params)
+    with metrics.timer(STAGE_SECONDS, stage='remove_pii'):
+        clean_urls = _remove_pii_params(urls, apply_workers, checkpoint_dir)
+    metrics.inc('urls_cleaned_total', clean_urls.shape[0])
+    # only written to columnar outputs
+    clean_urls['full_domain'] = clean_urls['urlid'].map(
+        url_data.drop_duplicates('url_id').set_index('url_id')['full_domain'])
+    return clean_urls
+
+
+def _clean_url_data_in_chunks(
+        url_full_data_path, output_data_path, chunksize, drop_params,
+        apply_workers, checkpoint_dir, metrics):
+    """
+    Read, clean and write the full data chunksize rows at a time, so that
+    memory stays bounded. Urls are sorted within each chunk only, and a url
+    repeated in several chunks is written once per chunk.
+    """
+    with CleanURLWriter(output_data_path) as writer:
+        for i, url_data in enumerate(
+                read_url_data(url_full_data_path, chunksize)):
+            chunk_checkpoint_dir = None
+            if checkpoint_dir is not None:
+                chunk_checkpoint_dir = os.path.join(
+                    checkpoint_dir, "chunk-{0:05d}".format(i))
+            clean_urls = _clean_url_data(
+                url_data, drop_params, apply_workers, chunk_checkpoint_dir,
+                metrics)
+            if clean_urls is not None:
+                clean_urls['index'] += writer.rows
+                with metrics.timer(STAGE_SECONDS, stage='write'):
+                    writer.write(clean_urls)
+            metrics.flush()
+
+
+def _remove_pii_params(urls, apply_workers, checkpoint_dir):
+    if apply_workers is None:
+        return URLParametersRemoval.remove_pii_params(urls)
+    return URLParametersRemoval.remove_pii_params_parallel(
+        urls, max_worker=apply_workers, checkpoint_dir=checkpoint_dir)
+
+
+def _write_clean_urls(clean_urls, path):
+    with CleanURLWriter(path) as writer:
+        if clean_urls is not None:
+            writer.write(clean_urls)
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+# Copyright (c) Facebook, Inc. and its affiliates. All Rights Reserved
+"""
+Read url data and write cleaned urls as TSV, Parquet or Arrow (Feather v2)
+files, picked from the file extension. Columnar files are memory-mapped on
+read, and store params_dropped/params_kept as lists of strings and
+full_domain dictionary-encoded, instead of JSON strings.
+"""
+
+import csv
+import json
+import os
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+CLEAN_URL_COLUMNS = [
+    'index', 'urlid', 'canonical_url', 'clean_url', 'params_dropped',
+    'params_kept']
+URL_DATA_DTYPES = {'canonical_url': str, 'url_id': str, 'full_domain': str}
+PARQUET_EXTENSIONS = ('.parquet', '.pq')
+ARROW_EXTENSIONS = ('.arrow', '.feather')
+
+
+def table_format(path):
+    """
+    :return: 'parquet', 'arrow' or 'tsv', from the extension of path
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension in PARQUET_EXTENSIONS:
+        return 'parquet'
+    if extension in ARROW_EXTENSIONS:
+        return 'arrow'
+    return 'tsv'
+
+
+def _require_pyarrow(path):
+    if pa is None:
+        raise ImportError(
+            "reading or writing {0} requires the pyarrow module".format(path))
+
+
+def _to_url_data(table):
+    url_data = table.to_pandas()
+    # same column types as reading a TSV file
+    for column in URL_DATA_DTYPES:
+        if column not in url_data:
+            continue
+        if isinstance(url_data[column].dtype, pd.CategoricalDtype):
+            url_data[column] = url_data[column].astype(object)
+        elif url_data[column].dtype != object:
+            url_data[column] = url_data[column].astype(str)
+    return url_data
+
+
+def read_url_data(path, chunksize=None):
+    """
+    Read url data (canonical_url, url_id, full_domain columns).
+
+    :param path: STRING. Path of a TSV, Parquet or Arrow file.
+    :param chunksize: Optional. Return an iterator of DataFrames of that
+        many rows instead of a single DataFrame.
+    """
+    file_format = table_format(path)
+    if file_format == 'tsv':
+        return pd.read_csv(
+            path,
+            dtype=URL_DATA_DTYPES,
+            sep='\t',
+            header=0,
+            chunksize=chunksize)
+    _require_pyarrow(path)
+    if file_format == 'parquet':
+        if chunksize is None:
+            return _to_url_data(pq.read_table(path, memory_map=True))
+        parquet_file = pq.ParquetFile(path, memory_map=True)
+        return (
+            _to_url_data(pa.Table.from_batches([batch]))
+            for batch in parquet_file.iter_batches(batch_size=chunksize))
+    table = pa.ipc.open_file(pa.memory_map(path)).read_all()
+    if chunksize is None:
+        return _to_url_data(table)
+    # batches of a memory-mapped table are zero-copy views
+    return (
+        _to_url_data(pa.Table.from_batches([batch]))
+        for batch in table.to_batches(max_chunksize=chunksize))
+
+
+class CleanURLWriter(object):
+    """
+    Write cleaned urls (the output of remove_pii_params, plus full_domain
+    for columnar formats) to a file, one DataFrame at a time.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.format = table_format(path)
+        if self.format != 'tsv':
+            _require_pyarrow(path)
+            self.schema = pa.schema([
+                ('index', pa.int64()),
+                ('urlid', pa.string()),
+                ('canonical_url', pa.string()),
+                ('clean_url', pa.string()),
+                ('params_dropped', pa.list_(pa.string())),
+                ('params_kept', pa.list_(pa.string())),
+                ('full_domain', pa.dictionary(pa.int32(), pa.string())),
+            ])
+        self.domains = []
+        self.domain_codes = {}
+        self.writer = None
+        self.rows = 0
+
+    def _full_domain_array(self, full_domains):
+        # grow a single dictionary across writes, so that Arrow files only
+        # get dictionary deltas
+        codes = []
+        for full_domain in full_domains:
+            code = self.domain_codes.get(full_domain)
+            if code is None:
+                code = len(self.domains)
+                self.domains.append(full_domain)
+                self.domain_codes[full_domain] = code
+            codes.append(code)
+        return pa.DictionaryArray.from_arrays(
+            pa.array(codes, type=pa.int32()),
+            pa.array(self.domains, type=pa.string()))
+
+    def _open(self):
+        if self.format == 'parquet':
+            self.writer = pq.ParquetWriter(self.path, self.schema)
+        elif self.format == 'arrow':
+            self.writer = pa.ipc.new_file(
+                self.path, self.schema,
+                options=pa.ipc.IpcWriteOptions(emit_dictionary_deltas=True))
+
+    def write(self, clean_urls):
+        if self.format == 'tsv':
+            clean_urls = clean_urls[CLEAN_URL_COLUMNS].copy()
+            clean_urls['params_dropped'] = [
+                json.dumps(x) for x in clean_urls['params_dropped']]
+            clean_urls['params_kept'] = [
+                json.dumps(x) for x in clean_urls['params_kept']]
+            clean_urls.to_csv(
+                self.path, index=False, header=self.rows == 0, sep='\t',
+                quoting=csv.QUOTE_NONE, mode='a' if self.rows else 'w')
+        else:
+            if self.writer is None:
+                self._open()
+            columns = [
+                pa.array(clean_urls[column].values, type=field.type)
+                for column, field in zip(CLEAN_URL_COLUMNS, self.schema)]
+            columns.append(
+                self._full_domain_array(clean_urls['full_domain'].values))
+            self.writer.write_table(
+                pa.Table.from_arrays(columns, schema=self.schema))
+        self.rows += clean_urls.shape[0]
+
+    def close(self):
+        if self.rows == 0 and self.writer is None:
+            # always leave a (header only) file behind
+            if self.format == 'tsv':
+                pd.DataFrame(columns=CLEAN_URL_COLUMNS).to_csv(
+                    self.path, index=False, header=True, sep='\t')
+                return
+            self._open()
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
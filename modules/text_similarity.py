@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+# Copyright (c) Facebook, Inc. and its affiliates. All Rights Reserved
+"""
+Text similarity functions used to compare the body of a page with the body
+of the same page fetched without a query parameter. Each function takes two
+strings and returns a ratio in [0, 1], 1 meaning identical.
+
+'difflib' is the reference (difflib.SequenceMatcher ratio), the other
+functions are faster approximations of it. Use calibrate() to measure how far
+an approximation drifts from the reference on real pages before relying on
+the thresholds of drop_params_via_similarity.
+"""
+
+import time
+import zlib
+import difflib
+import functools
+import numpy as np
+import pandas as pd
+
+SHINGLE_SIZE = 3
+NUM_PERM = 128
+# shingles hashed at once by _minhash_signature
+MINHASH_BLOCK = 4096
+QUICK_RATIO_THRESHOLD = 0.9
+# Mersenne prime, small enough for a * x + b to fit in an int64
+_MERSENNE_PRIME = (1 << 31) - 1
+_rng = np.random.RandomState(1)
+_PERM_A = _rng.randint(1, _MERSENNE_PRIME, size=NUM_PERM).astype(np.int64)
+_PERM_B = _rng.randint(0, _MERSENNE_PRIME, size=NUM_PERM).astype(np.int64)
+
+
+def difflib_ratio(text_1, text_2):
+    """
+    difflib.SequenceMatcher ratio, 2.0 * M / T where M is the number of
+    matching characters and T the total number of characters. Quadratic in
+    the worst case.
+    """
+    return difflib.SequenceMatcher(None, text_1, text_2).ratio()
+
+
+def quick_ratio(text_1, text_2, threshold=QUICK_RATIO_THRESHOLD):
+    """
+    Return difflib's cheap upper bounds of the ratio (real_quick_ratio, then
+    quick_ratio) when they already fall below threshold, and the exact ratio
+    otherwise. Pairs that are clearly different never reach the quadratic
+    matcher; pairs that are close get the exact value.
+    """
+    matcher = difflib.SequenceMatcher(None, text_1, text_2)
+    upper_bound = matcher.real_quick_ratio()
+    if upper_bound < threshold:
+        return upper_bound
+    upper_bound = matcher.quick_ratio()
+    if upper_bound < threshold:
+        return upper_bound
+    return matcher.ratio()
+
+
+@functools.lru_cache(maxsize=8)
+def _shingles(text, size=SHINGLE_SIZE):
+    # cached, since the original page is compared to every modified page
+    tokens = text.split()
+    if len(tokens) < size:
+        return frozenset([tuple(tokens)]) if tokens else frozenset()
+    return frozenset(
+        tuple(tokens[i:i + size]) for i in range(len(tokens) - size + 1))
+
+
+def shingle_jaccard(text_1, text_2):
+    """
+    Jaccard similarity of the sets of word 3-shingles of both texts. Linear
+    in the length of the texts.
+    """
+    shingles_1 = _shingles(text_1)
+    shingles_2 = _shingles(text_2)
+    if not shingles_1 and not shingles_2:
+        return 1.0
+    return len(shingles_1 & shingles_2) / len(shingles_1 | shingles_2)
+
+
+@functools.lru_cache(maxsize=8)
+def _minhash_signature(text):
+    shingles = _shingles(text)
+    if not shingles:
+        return None
+    hashes = np.array(
+        [zlib.crc32(' '.join(s).encode('utf-8')) for s in shingles],
+        dtype=np.int64) % _MERSENNE_PRIME
+    # NUM_PERM x MINHASH_BLOCK hashes at a time, so that memory does not
+    # grow with the size of the page
+    signature = np.full(NUM_PERM, _MERSENNE_PRIME, dtype=np.int64)
+    for start in range(0, len(hashes), MINHASH_BLOCK):
+        block = hashes[None, start:start + MINHASH_BLOCK]
+        np.minimum(
+            signature,
+            ((_PERM_A[:, None] * block + _PERM_B[:, None])
+             % _MERSENNE_PRIME).min(axis=1),
+            out=signature)
+    return signature
+
+
+def minhash_jaccard(text_1, text_2):
+    """
+    MinHash estimate of shingle_jaccard with 128 permutations. The signature
+    of the original page is computed once and reused across comparisons.
+    """
+    signature_1 = _minhash_signature(text_1)
+    signature_2 = _minhash_signature(text_2)
+    if signature_1 is None or signature_2 is None:
+        return 1.0 if signature_1 is signature_2 else 0.0
+    return float(np.mean(signature_1 == signature_2))
+
+
+SIMILARITY_FUNCTIONS = {
+    'difflib': difflib_ratio,
+    'quick': quick_ratio,
+    'shingle': shingle_jaccard,
+    'minhash': minhash_jaccard,
+}
+
+
+def get_similarity_function(similarity):
+    """
+    :param similarity: name in SIMILARITY_FUNCTIONS, or a function taking
+        two strings and returning a ratio in [0, 1]
+    """
+    if callable(similarity):
+        return similarity
+    if similarity not in SIMILARITY_FUNCTIONS:
+        raise ValueError("unknown similarity: {0}".format(similarity))
+    return SIMILARITY_FUNCTIONS[similarity]
+
+
+def calibrate(text_pairs, similarity, threshold=0.98):
+    """
+    Compare a similarity function to the difflib reference on pairs of
+    texts.
+
+    :param text_pairs: iterable of (text_1, text_2)
+    :param similarity: name in SIMILARITY_FUNCTIONS, or a function
+    :param threshold: FLOAT. Ratio above which two pages are considered the
+        same, used to report how often both functions agree
+    :return: (pd.DataFrame with one row per pair, with columns dl_ratio,
+        similarity, drift, dl_time and similarity_time, dict of summary
+        statistics)
+    """
+    similarity = get_similarity_function(similarity)
+    rows = []
+    for text_1, text_2 in text_pairs:
+        start_time = time.time()
+        dl_ratio = difflib_ratio(text_1, text_2)
+        dl_time = time.time() - start_time
+        start_time = time.time()
+        ratio = similarity(text_1, text_2)
+        similarity_time = time.time() - start_time
+        rows.append((dl_ratio, ratio, dl_time, similarity_time))
+    result = pd.DataFrame(rows, columns=[
+        'dl_ratio', 'similarity', 'dl_time', 'similarity_time'])
+    result['drift'] = result['similarity'] - result['dl_ratio']
+    summary = {
+        'pairs': len(result),
+        'mean_drift': result['drift'].mean(),
+        'mean_abs_drift': result['drift'].abs().mean(),
+        'max_abs_drift': result['drift'].abs().max(),
+        'correlation': result['dl_ratio'].corr(result['similarity']),
+        'agreement': (
+            (result['dl_ratio'] >= threshold)
+            == (result['similarity'] >= threshold)).mean(),
+        'speedup': result['dl_time'].sum() / result['similarity_time'].sum()
+        if result['similarity_time'].sum() > 0 else None,
+    }
+    return result, summary
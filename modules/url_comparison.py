@@ -1,14 +1,24 @@
 #!/usr/bin/env python3
 # Copyright (c) Facebook, Inc. and its affiliates. All Rights Reserved
 import time
+import asyncio
 import logging
-import difflib
-import pandas as pd
+import contextlib
+import multiprocessing
 import urllib.parse as urlparse
 from pebble import ProcessPool
-import sys
+from concurrent.futures import wait, FIRST_COMPLETED, TimeoutError
 
-from url_content_fetcher import URLContentFetcher
+from url_content_fetcher import URLContentFetcher, MAX_BYTES, \
+    THROTTLE_STATUS_CODES, get_session
+from async_url_fetcher import AsyncURLFetcher
+from host_scheduler import HostScheduler, HostRateLimiter
+from group_testing import GroupTest
+from metrics import get_metrics, BYTES_BUCKETS
+from crawl_results import Comparison, Fetch, url_results, empty_result, \
+    ResultAccumulator
+
+from text_similarity import get_similarity_function, difflib_ratio
 
 
 class URLComparison(object):
@@ -20,7 +30,93 @@ class URLComparison(object):
             proxies=None,
             process_timeout=3600,
             chunksize=200,
-            max_worker=4):
+            max_worker=4,
+            cache=None,
+            backend='requests',
+            max_connections=500,
+            max_per_host=8,
+            max_bytes=MAX_BYTES,
+            similarity='difflib',
+            calibrate=False,
+            lightweight=False,
+            pool_connections=10,
+            pool_maxsize=10,
+            polite=False,
+            max_urls_per_host=2,
+            host_interval=0.0,
+            throttle_backoff=30.0,
+            host_lookahead=1000,
+            metrics=None,
+            strategy='each',
+            group_tolerance=0.02,
+            trackers=None,
+            archive=None,
+            replay=False):
+        """
+        :param cache: Optional URLContentCache shared by all workers, so
+            that each distinct URL is fetched once per run.
+        :param chunksize: INT. Progress is logged every chunksize urls. With
+            the 'asyncio' backend, also the number of urls in flight.
+        :param backend: 'requests' fetches with blocking requests in
+            max_worker pebble processes. 'asyncio' fetches with an
+            AsyncURLFetcher, keeping up to max_connections requests (at most
+            max_per_host per host) in flight, and compares in this process.
+        :param max_bytes: INT. Pages larger than that many bytes, or that are
+            not HTML, are abandoned as soon as the headers or the first
+            max_bytes are read.
+        :param similarity: name of a function in
+            text_similarity.SIMILARITY_FUNCTIONS ('difflib', 'quick',
+            'shingle', 'minhash'), or a function of two strings, used to
+            compute dl_ratio.
+        :param calibrate: BOOL. Also compute the difflib ratio of every
+            pair, as dl_ratio_reference, to measure the drift of similarity.
+        :param lightweight: BOOL. Keep only the body text and title of each
+            page instead of its parsed tree. Combine with parser='lxml' for
+            the cheapest parsing.
+        :param pool_connections: INT. Number of hosts each worker keeps
+            connections open to, see url_content_fetcher.get_session.
+        :param pool_maxsize: INT. Number of connections each worker keeps
+            open per host. None opens a new connection for every fetch.
+        :param polite: BOOL. With the 'requests' backend, hand urls out with
+            a host_scheduler.HostScheduler instead of in input order: hosts
+            are interleaved, at most max_urls_per_host urls of a host are
+            processed at once, every fetch of a host (each url fetches its
+            page, its AA test and its modified urls) starts at least
+            host_interval seconds after the previous one (see
+            host_scheduler.HostRateLimiter), and hosts answering 429/503
+            are held back for
+            throttle_backoff seconds (doubled on each throttled url in a
+            row) while their urls are retried. Not supported by the 'asyncio'
+            backend, which only limits connections per host with
+            max_per_host.
+        :param host_lookahead: INT. Number of urls read ahead of the input in
+            polite mode, to interleave hosts of inputs sorted by domain.
+        :param metrics: Optional metrics.Metrics where fetch, parse and diff
+            timings, sizes, timeouts and errors are recorded per domain.
+            Defaults to metrics.get_metrics().
+        :param strategy: 'each' fetches the url without each of its params,
+            one at a time. 'group' strips groups of params at once and only
+            splits the groups that change the page, see
+            group_testing.GroupTest. Both give one row per param.
+        :param group_tolerance: FLOAT. With the 'group' strategy, how much
+            lower than the AA test the similarity of a group can be for the
+            group to be unchanged.
+        :param trackers: Optional param_matcher.ParamMatcher of the known
+            trackers, tested apart from the other params by the 'group'
+            strategy. Defaults to ParamMatcher().
+        :param archive: Optional crawl_archive.CrawlArchive where the body
+            text, title, status and headers of every fetch are recorded.
+        :param replay: BOOL. Read every page from archive instead of the
+            network, to recompute the comparisons (e.g. with another
+            similarity) of a recorded crawl. Urls missing from the archive
+            are errors.
+        """
+        if backend not in ('requests', 'asyncio'):
+            raise ValueError("unknown backend: {0}".format(backend))
+        if strategy not in ('each', 'group'):
+            raise ValueError("unknown strategy: {0}".format(strategy))
+        if polite and backend == 'asyncio':
+            raise ValueError("polite is not supported by the asyncio backend")
         self.timeout = timeout
         self.verbose = verbose
         self.parser = parser
@@ -29,16 +125,96 @@ class URLComparison(object):
         self.process_timeout = process_timeout
         self.chunksize = chunksize
         self.max_worker = max_worker
+        self.cache = cache
+        self.backend = backend
+        self.max_connections = max_connections
+        self.max_per_host = max_per_host
+        self.max_bytes = max_bytes
+        self.similarity = similarity
+        self.similarity_function = get_similarity_function(similarity)
+        self.calibrate = calibrate
+        self.lightweight = lightweight
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.polite = polite
+        self.max_urls_per_host = max_urls_per_host
+        self.host_interval = host_interval
+        self.throttle_backoff = throttle_backoff
+        self.host_lookahead = host_lookahead
+        self.metrics = metrics
+        self.strategy = strategy
+        self.group_tolerance = group_tolerance
+        self.trackers = trackers
+        if replay and archive is None:
+            raise ValueError("replay needs an archive")
+        self.archive = archive
+        self.replay = replay
+        # shared by the workers during a polite crawl, see _rate_limit
+        self.rate_limiter = None
+
+    def __getstate__(self):
+        # metrics are recorded by the parent process only
+        state = self.__dict__.copy()
+        state['metrics'] = None
+        return state
+
+    def _metrics(self):
+        return self.metrics if self.metrics is not None else get_metrics()
+
+    def record_metrics(self, url, result):
+        """
+        Record the timings, sizes and errors of the fetches of url
+
+        :param url: STRING
+        :param result: list of crawl_results.URLResult, output of
+            process_one_url
+        """
+        metrics = self._metrics()
+        domain = metrics.domain(urlparse.urlparse(url).netloc)
+        metrics.inc('urls_total', domain=domain)
+        # rows of a group of params (strategy 'group') share one fetch
+        seen = set()
+        fetches = []
+        for row in result:
+            fetches.extend(row.other_fetches)
+            if row.mod_url is not None and row.mod_url in seen:
+                continue
+            seen.add(row.mod_url)
+            fetches.append(row)
+            if row.diff_time is not None:
+                metrics.observe(
+                    'diff_seconds', row.diff_time, domain=domain)
+        for fetch in fetches:
+            if fetch.status_code in THROTTLE_STATUS_CODES:
+                metrics.inc('throttled_total', domain=domain)
+            if fetch.fetch_time is None:
+                if fetch.timed_out:
+                    metrics.inc('timeouts_total', domain=domain)
+                else:
+                    metrics.inc('errors_total', domain=domain)
+                continue
+            metrics.inc('fetches_total', domain=domain)
+            metrics.observe('fetch_seconds', fetch.fetch_time, domain=domain)
+            metrics.observe('parse_seconds', fetch.parse_time, domain=domain)
+            metrics.observe(
+                'response_bytes', fetch.response_bytes,
+                buckets=BYTES_BUCKETS, domain=domain)
 
     def compare_two_soups(self, soup_1, soup_2):
         """
         Compare content returned by a pair of urls.
-        Use difflib.SequenceMatcher to get the ratio of similar text,
+        Use the similarity function (difflib.SequenceMatcher by default) to
+        get the ratio of similar text,
         record whether the titles are the same. Measure total time to fetch and
         parse URLs. difflib.SequenceMatcher ratio is equal to 2.0 * M/T, where
         M is the number of matches and T is the number of elements in both
         sequences.
         See https://docs.python.org/2/library/difflib.html.
+        fetch_time, parse_time and response_bytes are those of the fetch of
+        soup_2 (None if it failed), diff_time the time to compute dl_ratio,
+        timed_out whether that fetch failed with a timeout.
+
+        :return: crawl_results.Comparison
         """
 
         assert isinstance(soup_1, URLContentFetcher)
@@ -46,38 +222,64 @@ class URLComparison(object):
 
         try:
             start_time = time.time()
+            body_1 = soup_1.get_body()
+            body_2 = soup_2.get_body()
             if self.verbose:
-                logging.info("soup1: " + soup_1.get_body())
-                logging.info("soup2: " + soup_2.get_body())
-            dl_ratio = difflib.SequenceMatcher(
-                None,
-                soup_1.get_body(),
-                soup_2.get_body(),
-            ).ratio()
-            body_length = len(soup_1.get_body())
+                logging.info("soup1: " + body_1)
+                logging.info("soup2: " + body_2)
+            diff_start_time = time.time()
+            dl_ratio = self.similarity_function(body_1, body_2)
+            diff_time = time.time() - diff_start_time
+            body_length = len(body_1)
+            # as strings, so that parsed and lightweight (or replayed)
+            # titles compare the same way
             same_title = \
-                soup_1.get_title() == soup_1.get_title()
+                str(soup_1.get_title()) == str(soup_2.get_title())
             end_time = time.time()
             running_time = end_time - start_time
-            return pd.Series({
-                "success": True,
-                "message": None,
-                "dl_ratio": dl_ratio,
-                "running_time": running_time,
-                "body_length": body_length,
-                "same_title": same_title
-            })
+            dl_ratio_reference = None
+            if self.calibrate:
+                dl_ratio_reference = difflib_ratio(body_1, body_2)
+            return Comparison(
+                success=True,
+                message=None,
+                dl_ratio=dl_ratio,
+                running_time=running_time,
+                body_length=body_length,
+                same_title=same_title,
+                status_code=self._status_code(soup_1, soup_2),
+                fetch_time=soup_2.fetch_time,
+                parse_time=soup_2.parse_time,
+                response_bytes=soup_2.content_bytes,
+                diff_time=diff_time,
+                timed_out=soup_2.timed_out,
+                dl_ratio_reference=dl_ratio_reference)
         except Exception as e:
             message = str(e) + ", url: {0}".format(soup_1.url)
             logging.error(message)
-            return pd.Series({
-                "success": False,
-                "message": message,
-                "dl_ratio": None,
-                "running_time": None,
-                "body_length": None,
-                "same_title": None
-            })
+            return Comparison(
+                success=False,
+                message=message,
+                dl_ratio=None,
+                running_time=None,
+                body_length=None,
+                same_title=None,
+                status_code=self._status_code(soup_1, soup_2),
+                fetch_time=soup_2.fetch_time,
+                parse_time=soup_2.parse_time,
+                response_bytes=soup_2.content_bytes,
+                diff_time=None,
+                timed_out=soup_2.timed_out)
+
+    @staticmethod
+    def _status_code(soup_1, soup_2):
+        """
+        HTTP status of the modified url, or of the original url if it was
+        throttled
+        """
+        if soup_1.status_code in THROTTLE_STATUS_CODES:
+            return soup_1.status_code
+        return soup_2.status_code
 
     def generate_modified_urls(self, url):
         """
@@ -101,6 +303,78 @@ class URLComparison(object):
             modified_urls.append((key, mod_url))
         return modified_urls
 
+    def _fetcher(self, url, refresh=False):
+        session = None
+        if self.pool_maxsize is not None:
+            session = get_session(self.pool_connections, self.pool_maxsize)
+        return URLContentFetcher(
+            url,
+            timeout=self.timeout, parser=self.parser, proxies=self.proxies,
+            cache=self.cache, refresh=refresh, max_bytes=self.max_bytes,
+            lightweight=self.lightweight, session=session,
+            archive=self.archive, replay=self.replay,
+            rate_limiter=self.rate_limiter)
+
+    @contextlib.contextmanager
+    def _rate_limit(self):
+        """
+        In polite mode, space the fetches of each host by host_interval
+        seconds across the worker processes, for the duration of the block
+        """
+        if not self.polite or self.host_interval <= 0:
+            yield
+            return
+        with multiprocessing.Manager() as manager:
+            self.rate_limiter = HostRateLimiter(self.host_interval, manager)
+            try:
+                yield
+            finally:
+                self.rate_limiter = None
+
+    def _modified_fetchers(self, url):
+        """
+        Fetchers for the original url and for each of its modified urls,
+        as (url_with_soup, [(key, mod_url, mod_url_with_soup), ...])
+        """
+        url_with_soup = self._fetcher(url)
+        # the AA test needs a second, fresh fetch of the original url
+        modified = [
+            (key, mod_url, self._fetcher(mod_url, refresh=key is None))
+            for key, mod_url in self.generate_modified_urls(url)]
+        return url_with_soup, modified
+
+    def compare_modified_urls(self, url, url_with_soup, modified):
+        """
+        Compare the original url to each of its modified urls.
+
+        :param url: STRING
+        :param url_with_soup: URLContentFetcher of the original url
+        :param modified: list of (key, mod_url, URLContentFetcher)
+        :return: list of crawl_results.URLResult, one per modified url
+        """
+        # Compare urls and save output:
+        # how similar would a URL would be to its original form if
+        # a particular query string was removed? Use content similarity
+        # and whether it has the same title as metrics.
+        return url_results(url, [
+            (key, mod_url,
+             self.compare_two_soups(url_with_soup, mod_url_with_soup))
+            for key, mod_url, mod_url_with_soup in modified],
+            [self._fetch(url_with_soup)])
+
+    @staticmethod
+    def _fetch(fetcher):
+        """
+        :return: crawl_results.Fetch of the fetch of fetcher
+        """
+        return Fetch(
+            fetcher.fetch_time, fetcher.parse_time, fetcher.content_bytes,
+            fetcher.status_code, fetcher.timed_out)
+
+    def _group_test(self, url):
+        return GroupTest(
+            self, url, tolerance=self.group_tolerance, trackers=self.trackers)
+
     def process_one_url(self, url):
         """
         Function to iterate over query params in a particular url,
@@ -110,54 +384,114 @@ class URLComparison(object):
         positives.
 
         :param url: STRING
-        :return: dict containing each param, the difference ratio
-        """
-        url_withs_soup = URLContentFetcher(
-            url, timeout=self.timeout, parser=self.parser, proxies=self.proxies)
-        modified_urls = self.generate_modified_urls(url)
-        compare_result = []
-        for key, mod_url in modified_urls:
-            # Compare urls and save output:
-            # how similar would a URL would be to its original form if
-            # a particular query string was removed? Use content similarity
-            # and whether it has the same title as metrics.
-            mod_url_with_soup = URLContentFetcher(
-                mod_url,
-                timeout=self.timeout, parser=self.parser, proxies=self.proxies)
-            comp = self.compare_two_soups(url_withs_soup, mod_url_with_soup)
-
-            current = pd.concat(
-                (pd.Series({'url': url, 'key': key, 'mod_url': mod_url}), comp))
-            compare_result.append(current)
-
-        compare_result = pd.DataFrame(compare_result)
-        return compare_result
-
-    def process_one_url_empty_result(self, url, message):
+        :return: list of crawl_results.URLResult, one per param and one for
+            the AA test (key None), so that workers send back plain tuples
+        """
+        if self.strategy == 'group':
+            test = self._group_test(url)
+            return url_results(url, test.run(), [
+                self._fetch(fetcher) for fetcher in test.other_fetchers()])
+        url_with_soup, modified = self._modified_fetchers(url)
+        return self.compare_modified_urls(url, url_with_soup, modified)
+
+    def process_one_url_empty_result(self, url, message, timed_out=False):
         """
         Function to process one row of results so we can return
-        pandas dataframe output and save any errors.
+        the same output and save any errors.
         :param url: STRING
         :param message: STRING
-        :return: DataFrame
-        """
-        return pd.DataFrame({
-            'url': [url],
-            'key': [None],
-            'mod_url': [None],
-            "success": [False],
-            "message": [message],
-            "dl_ratio": [None],
-            "running_time": [None],
-            "body_length": [None],
-            "same_title": [None]
-        })
+        :param timed_out: BOOL. The url was abandoned after process_timeout.
+        :return: list of one crawl_results.URLResult
+        """
+        return empty_result(url, message, timed_out)
 
-    @staticmethod
-    def _chunker(seq, size, start_idx=0):
-        return (seq[pos: pos + size] for pos in range(start_idx, len(seq), size))
+    def iter_process_urls(self, url_list):
+        """
+        Process urls in a single pebble pool that lives for the whole run.
+        The pool queue is kept topped up with max_worker * 2 urls, so a slow
+        url only holds up its own worker. Each url still gets its own
+        process_timeout. In polite mode, urls are handed out by a
+        HostScheduler, which interleaves hosts and holds back hosts that
+        throttle us; throttled urls are retried before being yielded. The
+        fetches of each host are spaced by a HostRateLimiter.
 
-    def process_multiple_urls(self, url_list):
+        :param url_list: list, where each element is an URL in string
+        :return: generator of (url, list of crawl_results.URLResult), in
+            completion order
+        """
+        url_iter = iter(url_list)
+        max_pending = self.max_worker * 2
+        scheduler = None
+        if self.polite:
+            scheduler = HostScheduler(
+                max_per_host=self.max_urls_per_host,
+                min_interval=self.host_interval,
+                backoff=self.throttle_backoff)
+        with self._rate_limit(), \
+                ProcessPool(max_workers=self.max_worker) as pool:
+            pending = {}
+
+            def next_url():
+                if scheduler is None:
+                    return next(url_iter, None)
+                # read ahead, so that urls of other hosts can be interleaved
+                while len(scheduler) < self.host_lookahead:
+                    url = next(url_iter, None)
+                    if url is None:
+                        break
+                    scheduler.add(url)
+                return scheduler.next_url()
+
+            def schedule():
+                while len(pending) < max_pending:
+                    url = next_url()
+                    if url is None:
+                        break
+                    future = pool.schedule(
+                        self.process_one_url,
+                        args=[url],
+                        timeout=self.process_timeout)
+                    pending[future] = url
+
+            schedule()
+            while pending or (scheduler is not None and len(scheduler)):
+                if not pending:
+                    # every host with queued urls is held back
+                    time.sleep(scheduler.wait_time())
+                    schedule()
+                    continue
+                timeout = None
+                if scheduler is not None and len(pending) < max_pending:
+                    # wake up when a held back host is ready again
+                    timeout = scheduler.wait_time()
+                done, _not_done = wait(
+                    pending, timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in done:
+                    url = pending.pop(future)
+                    # if a computation timed out log it and continue to
+                    # the next result
+                    try:
+                        result = future.result()
+                    except TimeoutError as error:
+                        message = \
+                            "Function took longer than %d seconds" \
+                            % error.args[1]
+                        logging.error(message)
+                        result = self.process_one_url_empty_result(
+                            url, message, timed_out=True)
+                    except Exception as e:
+                        message = "other error: " + str(e)
+                        logging.error(message)
+                        result = self.process_one_url_empty_result(
+                            url, message)
+                    self.record_metrics(url, result)
+                    if scheduler is not None and scheduler.finished(
+                            url, HostScheduler.is_throttled(result)):
+                        continue
+                    yield url, result
+                schedule()
+
+    def process_multiple_urls(self, url_list, sampler=None):
         """
         Function to multithread URL procesing, by parceling
         out jobs to various pebble multithreading 'workers'.
@@ -166,68 +500,153 @@ class URLComparison(object):
         for hours.
 
         input: list of URLs
-        output: dataframe with processed output
+        output: dataframe with processed output, in completion order
 
         :param url_list: list, where each element is an URL in string
+        :param sampler: Optional crawl_sampler.CrawlSampler built from
+            url_list, to only crawl the urls it selects as results come in.
         :return: pd.DataFrame, where each row contains the comparison result
             for one pair of URLs.
         """
         if len(url_list) == 0:
             raise ValueError("empty list!")
-        start_idx = 0
+        if self.backend == 'asyncio':
+            return self.process_multiple_urls_async(url_list, sampler)
         i = 0
-        results = []
+        results = ResultAccumulator(self.calibrate)
 
         start = time.time()
 
-        for partial_url_list in self._chunker(
-                url_list, self.chunksize, start_idx):
-            print(
-                str(float(i) / len(url_list) * 100) + " percent complete",
-                file=sys.stderr)
-            print(
-                "Elapsed Time: " + str(time.time() - start),
-                file=sys.stderr)
-            with ProcessPool(max_workers=self.max_worker) as pool:
-                future = pool.map(
-                    self.process_one_url,
-                    partial_url_list,
-                    timeout=self.process_timeout
-                )
-                iterator = future.result()
-                # iterate over all results, if a computation timed out
-                # print it and continue to the next result
-                for index in range(len(partial_url_list)):
-                    try:
-                        result = next(iterator)
-                        results.append(result)
-                    except StopIteration:
+        urls = url_list if sampler is None else sampler.iter_urls()
+        for url, result in self.iter_process_urls(urls):
+            if sampler is not None:
+                sampler.add_result(url, result)
+            results.add(result)
+            i += 1
+            self._log_progress(i, len(url_list), start)
+
+        self._log_rate(len(url_list), start)
+
+        # built once, from columns of plain values
+        return results.to_frame()
+
+    def _log_progress(self, i, n_urls, start):
+        """
+        Report progress every chunksize completed urls
+        """
+        if i % self.chunksize == 0 or i == n_urls:
+            elapsed = time.time() - start
+            logging.info(
+                "%.1f percent complete, elapsed time: %.1f, ETA: %.1f",
+                float(i) / n_urls * 100, elapsed,
+                elapsed / i * (n_urls - i))
+            self._metrics().flush()
+
+    def _log_rate(self, n_urls, start):
+        elapsed = time.time() - start
+        logging.info(
+            "Elapsed time: %.1f, rate: %.1f urls per second",
+            elapsed, n_urls / elapsed)
+        self._metrics().flush()
+
+    async def _process_one_url_async(self, fetcher, url):
+        """
+        Same as process_one_url, fetching with an AsyncURLFetcher: the pages
+        of the url (of each round of its group test) are fetched
+        concurrently, and compared as soon as they are all in.
+
+        :param fetcher: AsyncURLFetcher
+        """
+        if self.strategy == 'group':
+            test = self._group_test(url)
+            while not test.done:
+                await fetcher.fetch(test.fetchers())
+                test.step()
+            return url_results(url, test.results(), [
+                self._fetch(fetcher) for fetcher in test.other_fetchers()])
+        url_with_soup, modified = self._modified_fetchers(url)
+        await fetcher.fetch([url_with_soup] + [m[2] for m in modified])
+        return self.compare_modified_urls(url, url_with_soup, modified)
+
+    async def iter_process_urls_async(self, url_list):
+        """
+        Same as iter_process_urls, with one AsyncURLFetcher (one session)
+        for the whole run. Up to chunksize urls are in flight, a new url
+        starting as soon as one is done, so a slow url only holds up itself.
+        Requests are abandoned after process_timeout seconds.
+
+        :param url_list: iterable of URLs in string
+        :return: async generator of (url, list of crawl_results.URLResult),
+            in completion order
+        """
+        url_iter = iter(url_list)
+        async with AsyncURLFetcher(
+                timeout=self.timeout,
+                proxies=self.proxies,
+                max_connections=self.max_connections,
+                max_per_host=self.max_per_host,
+                total_timeout=self.process_timeout) as fetcher:
+            pending = {}
+
+            def schedule():
+                while len(pending) < self.chunksize:
+                    url = next(url_iter, None)
+                    if url is None:
                         break
-                    except TimeoutError as error:
-                        message = \
-                            "Function took longer than %d seconds" \
-                            % error.args[1]
-                        logging.error(message)
-                        results.append(
-                            self.process_one_url_empty_result(
-                                partial_url_list[index], message))
+                    task = asyncio.ensure_future(
+                        self._process_one_url_async(fetcher, url))
+                    pending[task] = url
+
+            schedule()
+            while pending:
+                done, _not_done = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    url = pending.pop(task)
+                    try:
+                        result = task.result()
                     except Exception as e:
                         message = "other error: " + str(e)
                         logging.error(message)
-                        results.append(
-                            self.process_one_url_empty_result(
-                                partial_url_list[index], message))
-            i += len(partial_url_list)
-
-        print(
-            "Elapsed Time: " + str(time.time() - start),
-            file=sys.stderr)
-        print(
-            "Rate: "
-            + str(len(url_list) / (time.time() - start))
-            + " urls per second",
-            file=sys.stderr
-        )
-
-        url_info = pd.concat(results, axis=0).reset_index()
-        return url_info
+                        result = self.process_one_url_empty_result(
+                            url, message)
+                    self.record_metrics(url, result)
+                    yield url, result
+                # the results are consumed (e.g. by a sampler) before the
+                # next urls are read
+                schedule()
+
+    def process_multiple_urls_async(self, url_list, sampler=None):
+        """
+        Same as process_multiple_urls, fetching with an AsyncURLFetcher and
+        comparing in this process, see iter_process_urls_async.
+
+        :param url_list: list, where each element is an URL in string
+        :param sampler: Optional crawl_sampler.CrawlSampler, see
+            process_multiple_urls.
+        :return: pd.DataFrame, where each row contains the comparison result
+            for one pair of URLs.
+        """
+        if len(url_list) == 0:
+            raise ValueError("empty list!")
+        return asyncio.run(
+            self._process_multiple_urls_async(url_list, sampler))
+
+    async def _process_multiple_urls_async(self, url_list, sampler):
+        i = 0
+        results = ResultAccumulator(self.calibrate)
+
+        start = time.time()
+
+        urls = url_list if sampler is None else sampler.iter_urls()
+        async for url, result in self.iter_process_urls_async(urls):
+            if sampler is not None:
+                sampler.add_result(url, result)
+            results.add(result)
+            i += 1
+            self._log_progress(i, len(url_list), start)
+
+        self._log_rate(len(url_list), start)
+
+        # built once, from columns of plain values
+        return results.to_frame()
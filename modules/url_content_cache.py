@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+# Copyright (c) Facebook, Inc. and its affiliates. All Rights Reserved
+"""
+Content cache for fetched URLs, keyed by normalized URL. The cache lives in
+a SQLite database on disk so that every pebble worker of a run (and later
+runs, until the entries expire) can share it.
+"""
+
+import os
+import time
+import zlib
+import sqlite3
+import logging
+import urllib.parse as urlparse
+
+
+class URLContentCache(object):
+    def __init__(self, path, max_entries=100000, ttl=86400,
+                 evict_every=1000):
+        """
+        :param path: STRING. Path of the SQLite database file. It is created
+            if it does not exist.
+        :param max_entries: INT. Maximum number of cached pages. The least
+            recently used pages are evicted beyond that.
+        :param ttl: Seconds a cached page stays valid. None disables expiry.
+        :param evict_every: INT. Run eviction once every that many writes
+            (per process), rather than on every write.
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.evict_every = evict_every
+        self._conn = None
+        self._pid = None
+        self._writes = 0
+
+    def __getstate__(self):
+        # sqlite connections can not cross the process boundary, each
+        # worker reconnects lazily
+        state = self.__dict__.copy()
+        state['_conn'] = None
+        state['_pid'] = None
+        return state
+
+    def _connect(self):
+        if self._conn is None or self._pid != os.getpid():
+            conn = sqlite3.connect(
+                self.path, timeout=60, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS pages ("
+                "key TEXT PRIMARY KEY, "
+                "content BLOB, "
+                "fetched_at REAL, "
+                "accessed_at REAL)")
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS pages_accessed_at "
+                "ON pages (accessed_at)")
+            self._conn = conn
+            self._pid = os.getpid()
+        return self._conn
+
+    @staticmethod
+    def normalize_url(url):
+        """
+        Normalize an url so that trivially different spellings of the same
+        page share a cache entry: lower-case scheme and host, drop default
+        ports and the fragment, and sort the query parameters.
+        """
+        parsed = urlparse.urlparse(url.strip())
+        scheme = parsed.scheme.lower()
+        netloc = parsed.netloc.lower()
+        if (scheme == 'http' and netloc.endswith(':80')) \
+                or (scheme == 'https' and netloc.endswith(':443')):
+            netloc = netloc.rsplit(':', 1)[0]
+        query = sorted(urlparse.parse_qsl(
+            parsed.query, keep_blank_values=True))
+        return urlparse.urlunparse((
+            scheme, netloc, parsed.path or '/', parsed.params,
+            urlparse.urlencode(query), ''))
+
+    def get(self, url):
+        """
+        Return the cached content of an url, or None if the url is not
+        cached or its entry expired.
+        """
+        key = self.normalize_url(url)
+        now = time.time()
+        try:
+            conn = self._connect()
+            row = conn.execute(
+                "SELECT content, fetched_at FROM pages WHERE key = ?",
+                (key,)).fetchone()
+            if row is None:
+                return None
+            content, fetched_at = row
+            if self.ttl is not None and fetched_at < now - self.ttl:
+                return None
+            conn.execute(
+                "UPDATE pages SET accessed_at = ? WHERE key = ?", (now, key))
+            return zlib.decompress(content).decode('utf-8')
+        except sqlite3.Error as e:
+            logging.error(repr(e) + ", cache get: {0}".format(url))
+            return None
+
+    def put(self, url, content):
+        """
+        Store the content of an url.
+        """
+        key = self.normalize_url(url)
+        now = time.time()
+        try:
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO pages "
+                "(key, content, fetched_at, accessed_at) "
+                "VALUES (?, ?, ?, ?)",
+                (key, zlib.compress(content.encode('utf-8')), now, now))
+            self._writes += 1
+            if self._writes % self.evict_every == 0:
+                self.evict()
+        except sqlite3.Error as e:
+            logging.error(repr(e) + ", cache put: {0}".format(url))
+
+    def evict(self):
+        """
+        Remove expired entries, then the least recently used ones until the
+        cache holds at most max_entries pages.
+        """
+        conn = self._connect()
+        if self.ttl is not None:
+            conn.execute(
+                "DELETE FROM pages WHERE fetched_at < ?",
+                (time.time() - self.ttl,))
+        if self.max_entries is not None:
+            conn.execute(
+                "DELETE FROM pages WHERE key IN ("
+                "SELECT key FROM pages ORDER BY accessed_at DESC "
+                "LIMIT -1 OFFSET ?)",
+                (self.max_entries,))
+
+    def clear(self):
+        self._connect().execute("DELETE FROM pages")
+
+    def __len__(self):
+        return self._connect().execute(
+            "SELECT COUNT(*) FROM pages").fetchone()[0]
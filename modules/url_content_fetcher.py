@@ -5,92 +5,334 @@ Given an URL in string, make a request, fetch its content,
 and parse using BeautifulSoup.
 """
 
+import os
 import time
 import requests
+import http.cookiejar
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ReadTimeoutError
 import logging
 import urllib.parse as urlparse
 from bs4 import BeautifulSoup
 
-
-class URLContentFetcher(object):
-    def __init__(self, url, timeout=3, parser='html5lib', proxies=None):
-        self.url = url
-        self.soup = None
-        self.success = None
-        self.message = None
-        self.timeout = timeout
-        self.parser = parser
-        self.proxies = proxies
-        self.running_time = 0
-
-    def read_and_soup(self):
-        """
-        Fetch content from a url
-        """
-        user_agent_list = [
-            'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_9_3) \
+USER_AGENT_LIST = [
+    'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_9_3) \
             AppleWebKit/537.36 (KHTML, like Gecko) \
             Chrome/35.0.1916.47 Safari/537.36',
-            'Mozilla/5.0 (Windows NT 10.0; Win64; x64) \
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) \
             AppleWebKit/537.36 (KHTML, like Gecko) \
             Chrome/60.0.3112.113 Safari/537.36',
-            'Mozilla/5.0 (Windows NT 6.1; Win64; x64) \
+    'Mozilla/5.0 (Windows NT 6.1; Win64; x64) \
             AppleWebKit/537.36 (KHTML, like Gecko) \
             Chrome/60.0.3112.90 Safari/537.36',
-            'Mozilla/5.0 (X11; Linux x86_64) \
+    'Mozilla/5.0 (X11; Linux x86_64) \
             AppleWebKit/537.36 (KHTML, like Gecko) \
             Chrome/44.0.2403.157 Safari/537.36',
-            'Mozilla/5.0 (Windows NT 6.3; Win64; x64) \
+    'Mozilla/5.0 (Windows NT 6.3; Win64; x64) \
             AppleWebKit/537.36 (KHTML, like Gecko) \
             Chrome/60.0.3112.113 Safari/537.36',
-            'Mozilla/5.0 (Windows NT 10.0; Win64; x64) \
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) \
             AppleWebKit/537.36 (KHTML, like Gecko) \
             Chrome/57.0.2987.133 Safari/537.36',
-        ]
+]
+
+# stop reading responses beyond 10MB, pages worth comparing are much smaller
+MAX_BYTES = 10 * 1024 * 1024
+CHUNK_SIZE = 64 * 1024
+HTML_CONTENT_TYPES = ('text/html', 'application/xhtml+xml')
+# the host asks us to slow down, see host_scheduler.HostScheduler
+THROTTLE_STATUS_CODES = (429, 503)
+
+_sessions = {}
+
+
+def is_timeout(e):
+    """
+    Whether a fetch failed with a timeout: requests.Timeout, or a
+    TimeoutError (see AsyncURLFetcher). A read timeout while streaming the
+    body is raised by requests as a ConnectionError.
+    """
+    if isinstance(e, (requests.Timeout, TimeoutError)):
+        return True
+    return isinstance(e, requests.ConnectionError) and len(e.args) > 0 \
+        and isinstance(e.args[0], ReadTimeoutError)
 
+
+def get_session(pool_connections=10, pool_maxsize=10):
+    """
+    Return the requests.Session of this process, so that fetches to the
+    same host reuse open connections (HTTP keep-alive) instead of paying a
+    new TCP/TLS handshake each time. Cookies are never stored, so a fetch can
+    not change the content of the next one.
+
+    :param pool_connections: INT. Number of hosts to keep connections to.
+    :param pool_maxsize: INT. Number of connections kept open per host.
+    """
+    key = (os.getpid(), pool_connections, pool_maxsize)
+    session = _sessions.get(key)
+    if session is None:
+        session = requests.Session()
+        session.cookies.set_policy(
+            http.cookiejar.DefaultCookiePolicy(allowed_domains=[]))
+        adapter = HTTPAdapter(
+            pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        _sessions[key] = session
+    return session
+
+
+class URLContentFetcher(object):
+    def __init__(self, url, timeout=3, parser='html5lib', proxies=None,
+                 cache=None, refresh=False, max_bytes=MAX_BYTES,
+                 lightweight=False, session=None, archive=None,
+                 replay=False, rate_limiter=None):
+        """
+        :param cache: Optional URLContentCache. Content is read from it when
+            available and stored in it after a successful fetch.
+        :param refresh: BOOL. Always fetch from the network, even if the url
+            is cached. The fresh content is still written to the cache.
+        :param archive: Optional CrawlArchive. Every fetch (or failure) is
+            recorded in it, unless replay is set.
+        :param replay: BOOL. Read the body text and title from the archive
+            instead of fetching, without any network access.
+        :param rate_limiter: Optional host_scheduler.HostRateLimiter,
+            waited on before fetching from the network.
+        """
+        self.url = url
+        self.soup = None
+        self.body = None
+        self.title = None
+        self.success = None
+        self.message = None
+        self.timed_out = False
+        self.timeout = timeout
+        self.parser = parser
+        self.proxies = proxies
+        self.cache = cache
+        self.refresh = refresh
+        self.max_bytes = max_bytes
+        self.lightweight = lightweight
+        self.session = session
+        self.running_time = 0
+        self.status_code = None
+        # timings and size of the response, reported by URLComparison
+        self.fetch_time = None
+        self.parse_time = None
+        self.content_bytes = 0
+        self.from_cache = False
+        self.headers = None
+        self.archive = archive
+        self.replay = replay
+        self.rate_limiter = rate_limiter
+
+    def request_headers(self):
+        """
+        Headers sent with the request, with a user agent picked from the
+        url so that repeated fetches of a page look the same
+        """
         parsed = urlparse.urlparse(self.url)
-        headers = {
-            "User-Agent": user_agent_list[
-                hash(parsed.netloc + parsed.path) % len(user_agent_list)],
+        return {
+            "User-Agent": USER_AGENT_LIST[
+                hash(parsed.netloc + parsed.path) % len(USER_AGENT_LIST)],
             "X-Requested-With": "XMLHttpRequest",
             "Accept-Encoding": "gzip",
         }
+
+    def check_response_headers(self, headers):
+        """
+        Raise ValueError before reading the body of a response that is not
+        HTML or that is larger than max_bytes
+        """
+        self.headers = dict(headers)
+        content_type = headers.get('Content-Type')
+        if content_type is not None:
+            media_type = content_type.split(';')[0].strip().lower()
+            if media_type not in HTML_CONTENT_TYPES:
+                raise ValueError(
+                    "Non-HTML content type: {0}".format(media_type))
+        content_length = headers.get('Content-Length')
+        if self.max_bytes is not None and content_length is not None \
+                and content_length.isdigit() \
+                and int(content_length) > self.max_bytes:
+            raise ValueError(
+                "Content length {0} exceeds {1} bytes".format(
+                    content_length, self.max_bytes))
+
+    def check_status(self, status_code):
+        """
+        Record the HTTP status of the response, raise ValueError if the host
+        throttles us, so that its error page is not compared or cached
+        """
+        self.status_code = status_code
+        if status_code in THROTTLE_STATUS_CODES:
+            raise ValueError("Throttled: HTTP {0}".format(status_code))
+
+    def check_size(self, size):
+        """
+        Raise ValueError once more than max_bytes have been read
+        """
+        if self.max_bytes is not None and size > self.max_bytes:
+            raise ValueError(
+                "Content exceeds {0} bytes".format(self.max_bytes))
+
+    def read_from_cache(self):
+        """
+        Load content from the cache, return whether the url was cached
+        """
+        if self.cache is None or self.refresh:
+            return False
+        start_time = time.time()
+        url_data = self.cache.get(self.url)
+        if url_data is None:
+            return False
+        self.from_cache = True
+        self.load_content(url_data, start_time)
+        return True
+
+    def parse(self, url_data):
+        """
+        Parse HTML content. In lightweight mode only keep the body text and
+        the title.
+        """
+        soup = BeautifulSoup(url_data, self.parser)
+        self.body = None
+        if self.lightweight:
+            self.body = "" if soup.body is None else soup.body.getText()
+            self.title = None if soup.title is None else str(soup.title)
+            soup.decompose()
+            soup = None
+        self.soup = soup
+
+    def load_content(self, url_data, start_time):
+        """
+        Parse content fetched for the url, started at start_time
+        """
+        parse_start_time = time.time()
+        self.fetch_time = parse_start_time - start_time
+        self.parse(url_data)
+        end_time = time.time()
+        self.parse_time = end_time - parse_start_time
+        self.running_time = end_time - start_time
+        self.success = True
+        if self.cache is not None and not self.from_cache:
+            self.cache.put(self.url, url_data)
+        self.write_to_archive()
+
+    def set_error(self, e):
+        logging.error(repr(e) + ", url: {0}".format(self.url))
+        self.success = False
+        self.message = "Modified URL error: " + str(e)
+        self.timed_out = is_timeout(e)
+        self.write_to_archive()
+
+    def write_to_archive(self):
+        """
+        Record the outcome of the fetch in the archive, if any
+        """
+        if self.archive is None or self.replay:
+            return
+        record = {
+            'url': self.url,
+            'refresh': self.refresh,
+            'status': self.status_code,
+            'headers': self.headers,
+            'fetch_time': self.fetch_time,
+            'parse_time': self.parse_time,
+            'content_bytes': self.content_bytes,
+            'from_cache': self.from_cache,
+            'error': None if self.success else self.message,
+            'body': None,
+            'title': None,
+        }
+        if self.success:
+            record['body'] = self.get_body()
+            title = self.get_title()
+            record['title'] = None if title == "" else str(title)
+        self.archive.put(record)
+
+    def read_from_archive(self):
+        """
+        Load the body text and title recorded for the url
+        """
+        record = self.archive.get(self.url, self.refresh)
+        if record is None:
+            self.set_error(KeyError("not in the archive"))
+            return
+        self.status_code = record['status']
+        self.headers = record['headers']
+        # the timings and size of the recorded fetch
+        self.fetch_time = record['fetch_time']
+        self.parse_time = record['parse_time']
+        self.content_bytes = record['content_bytes']
+        if record['error'] is not None:
+            self.success = False
+            self.message = record['error']
+            return
+        self.body = record['body']
+        self.title = record['title']
+        self.success = True
+
+    def read_and_soup(self):
+        """
+        Fetch content from a url
+        """
+        if self.replay:
+            self.read_from_archive()
+            return
+        if self.read_from_cache():
+            return
+        if self.rate_limiter is not None:
+            self.rate_limiter.wait(self.url)
+
         try:
             start_time = time.time()
-            r = requests.get(
+            with (self.session or requests).get(
                 self.url,
-                headers=headers,
+                headers=self.request_headers(),
                 timeout=self.timeout,
                 stream=True,
                 proxies=self.proxies
-            )
-            url_data = r.content.decode('utf-8', 'ignore')
-            soup = BeautifulSoup(url_data, self.parser)
-            end_time = time.time()
-            self.running_time = end_time - start_time
-            self.soup = soup
-            self.success = True
+            ) as r:
+                self.check_status(r.status_code)
+                self.check_response_headers(r.headers)
+                chunks = []
+                size = 0
+                for chunk in r.iter_content(CHUNK_SIZE):
+                    size += len(chunk)
+                    self.content_bytes = size
+                    self.check_size(size)
+                    chunks.append(chunk)
+            url_data = b''.join(chunks).decode('utf-8', 'ignore')
+            self.load_content(url_data, start_time)
         except Exception as e:
-            logging.error(repr(e) + ", url: {0}".format(self.url))
-            self.success = False
-            self.message = "Modified URL error: " + str(e)
+            self.set_error(e)
 
     def get_body(self):
         """
         Get the body of a HTML content
         """
-        if self.soup is None:
+        if self.success is None:
             self.read_and_soup()
-        if not self.success or self.soup.body is None:
+        if not self.success:
             return ""
-        return self.soup.body.getText()
+        if self.body is None:
+            # only walk the tree once
+            self.body = "" if self.soup.body is None \
+                else self.soup.body.getText()
+        return self.body
 
     def get_title(self):
         """
         Get the title from a HTML content
         """
-        if self.soup is None:
+        if self.success is None:
             self.read_and_soup()
-        if not self.success or self.soup.title is None:
+        if not self.success:
+            return ""
+        if self.soup is None:
+            # lightweight or replayed, only the title was kept
+            return "" if self.title is None else self.title
+        if self.soup.title is None:
             return ""
         return self.soup.title
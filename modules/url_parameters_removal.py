@@ -3,15 +3,27 @@
 import pandas as pd
 import numpy as np
 import urllib.parse as urlparse
-import phonenumbers
 import re
-import sys
+import itertools
+import logging
+import os
+import json
+import hashlib
+from pebble import ProcessPool
+
+from param_matcher import ParamMatcher, DROP_PARAMS
+from pii_detection import get_detector
+from dictionary_encoding import Dictionary, lookup
 
 
 class URLParametersRemoval(object):
     """
     Build out parameter-level dataframe with param similarity, same_title
     """
+    # Add these parameters + others that we obviously need to remove to
+    # our drop list:
+    DROP_PARAMS = DROP_PARAMS
+
     def __init__(
             self,
             url_data,
@@ -39,10 +51,12 @@ class URLParametersRemoval(object):
         if 'canonical_url' not in self.url_data:
             raise ValueError('missing column canonical_url')
         if 'full_domain' not in self.url_data:
-            self.url_data['full_domain'] = [
-                urlparse.urlparse(x).netloc
-                for x in self.url_data['canonical_url'].values
-            ]
+            # parse each distinct url once, missing urls (code -1) get None
+            urls = Dictionary()
+            codes = urls.encode(self.url_data['canonical_url'])
+            self.url_data['full_domain'] = np.array([
+                urlparse.urlparse(x).netloc for x in urls.values
+            ] + [None], dtype=object)[codes]
         if 'url_id' not in self.url_data:
             self.url_data['url_id'] = [
                 hash(x)
@@ -63,46 +77,80 @@ class URLParametersRemoval(object):
 
         return url_data_with_similarity
 
+    @staticmethod
+    def is_aa_test(params):
+        """
+        Which rows of url_data_with_similarity are AA tests (the url
+        compared to itself): the crawl gives them no param (key None), which
+        is null once in a DataFrame. An empty param is a real one, as in
+        '?=1'.
+
+        :param params: pd.Series, the param column
+        :return: np.array of bool
+        """
+        return params.isnull().values
+
     @staticmethod
     def build_param_data(url_data_with_similarity):
         """
         For each domain, take the average of query similarity, title similarity,
         body length so we can create domain-specific rules
         """
-        param_dat_aa = url_data_with_similarity[
-            url_data_with_similarity['param'] == ''].copy()
-        param_dat_ab = url_data_with_similarity[
-            url_data_with_similarity['param'] != ''].copy()
+        is_aa = URLParametersRemoval.is_aa_test(
+            url_data_with_similarity['param'])
+        param_dat_aa = url_data_with_similarity[is_aa].copy()
+        param_dat_ab = url_data_with_similarity[~is_aa].copy()
+
+        # code domains and params once: the special cases below are checked
+        # once per distinct value, and the groupbys run on integers
+        domains = Dictionary()
+        params = Dictionary()
+        ab_domains = domains.encode(param_dat_ab["full_domain"])
+        ab_params = params.encode(param_dat_ab["param"])
+        aa_domains = domains.encode(param_dat_aa["full_domain"])
 
         # fix a few difficult but popular cases:
-        youtube_rows = param_dat_ab[
-            "full_domain"].str.contains("www.youtube.com")
+        youtube_rows = domains.apply(
+            re.compile("www.youtube.com").search)[ab_domains]
         param_dat_ab["same_title"] = np.where(
-            youtube_rows & (param_dat_ab["param"] == "v"),
+            youtube_rows & params.apply(lambda p: p == "v")[ab_params],
             False, param_dat_ab["same_title"])
 
-        google_rows = param_dat_ab[
-            "full_domain"].str.contains("www.google.com")
+        google_rows = domains.apply(
+            re.compile("www.google.com").search)[ab_domains]
         param_dat_ab["same_title"] = np.where(
-            google_rows & (param_dat_ab.param == "url"),
+            google_rows & params.apply(lambda p: p == "url")[ab_params],
             False, param_dat_ab['same_title'])
 
         # take the average of query similarity, title similarity, body length
-        param_domain = param_dat_ab.groupby(["full_domain", "param"])[
-            "qsim", "same_title", "body_length"
+        valid = (ab_domains >= 0) & (ab_params >= 0)
+        param_domain = param_dat_ab[valid].groupby(
+            [ab_domains[valid], ab_params[valid]])[
+            ["qsim", "same_title", "body_length"]
         ].mean()
-        param_domain = param_domain.reset_index()
+        domain_codes = param_domain.index.get_level_values(0).values
+        param_codes = param_domain.index.get_level_values(1).values
+        param_domain = param_domain.reset_index(drop=True)
+        param_domain.insert(0, "full_domain", domains.decode(domain_codes))
+        param_domain.insert(1, "param", params.decode(param_codes))
+        param_domain["domain_code"] = domain_codes
+        # codes are in order of appearance, sort as strings
+        param_domain = param_domain.sort_values(
+            ["full_domain", "param"], kind="mergesort")
 
         # subtract AA test similarity from difference
-        same_url_means = param_dat_aa.groupby(
-            ["full_domain"])["qsim", "same_title"].mean()
-        same_url_means = same_url_means.reset_index()
-        same_url_means.columns = ["full_domain", "gsim_mean", "same_title_mean"]
+        valid = aa_domains >= 0
+        same_url_means = param_dat_aa[valid].groupby(aa_domains[valid])[
+            ["qsim", "same_title"]].mean()
+        same_url_means.columns = ["gsim_mean", "same_title_mean"]
         same_url_means = same_url_means.astype({
             "same_title_mean": "float64"})
 
         # Join it back together
-        param_domain = pd.merge(param_domain, same_url_means)
+        param_domain = param_domain.join(
+            same_url_means, on="domain_code", how="inner")
+        param_domain = param_domain.drop(
+            columns="domain_code").reset_index(drop=True)
         param_domain["diff_gsim"] = \
             param_domain["gsim_mean"] - param_domain["qsim"]
         param_domain["diff_same_title"] = \
@@ -111,40 +159,84 @@ class URLParametersRemoval(object):
         return param_domain
 
     def parse_urls_for_param(self):
-        urls_id_list = []
-        urls_param_list = []
-        for i in range(self.url_data.shape[0]):
-            row_i = self.url_data.loc[i]
-            parsed = urlparse.urlparse(row_i['canonical_url'])
-            query = urlparse.parse_qs(parsed.query)
-            params = list(query.keys())
-            urls_id_list.extend([row_i['url_id']] * len(params))
-            urls_param_list.extend(params)
-            if i % 100000 == 0:
-                print("progress: {} / {}".format(i, self.url_data.shape[0]),
-                      file=sys.stderr)
+        """
+        Explode urls into one row per query parameter, with columns url_id
+        and param, in the order of self.url_data.
+        """
+        return URLParametersRemoval.extract_query_params(
+            self.url_data['canonical_url'], self.url_data['url_id'])
+
+    @staticmethod
+    def extract_query_params(canonical_urls, url_ids):
+        """
+        Vectorized equivalent of taking the keys of
+        urlparse.parse_qs(urlparse.urlparse(url).query) for each url: params
+        with a blank value are skipped, repeated params are listed once per
+        url, and names are unquoted.
+
+        :param canonical_urls: pd.Series (or array) of urls in string
+        :param url_ids: pd.Series (or array) of the matching url ids
+        :return: pd.DataFrame with columns url_id and param
+        """
+        # keep the string dtype of the input, pandas string methods run on
+        # arrow string arrays as well as on object arrays
+        urls = pd.Series(canonical_urls).reset_index(drop=True)
+        url_ids = pd.Series(url_ids).reset_index(drop=True)
+        # same as urlsplit: the query runs from the first '?' to the
+        # fragment, with tabs and newlines removed
+        query = urls.str.extract(r'^[^#?]*\?([^#]*)', expand=False)
+        query = query[query.notnull() & (query != '')]
+        if query.empty:
+            return pd.DataFrame({
+                'url_id': url_ids.values[:0],
+                'param': np.array([], dtype=object)})
+        unsafe = query.str.contains(r'[\t\r\n]', regex=True)
+        if unsafe.any():
+            query[unsafe] = query[unsafe].str.replace(
+                r'[\t\r\n]', '', regex=True)
+        pairs = query.str.split('&').explode()
+        # same as parse_qsl: pairs with a blank value (or without '=') are
+        # dropped when keep_blank_values is False
+        names = pairs.str.extract(r'^([^=]*)=.', expand=False).dropna()
+        # unquote each distinct name once
+        codes, distinct = pd.factorize(names)
+        distinct = np.array([
+            urlparse.unquote(name.replace('+', ' '))
+            if '+' in name or '%' in name else name
+            for name in distinct], dtype=object)
         urls_with_param = pd.DataFrame({
-            'url_id': urls_id_list,
-            'param': urls_param_list
+            'position': names.index,
+            'param': distinct[codes]})
+        # parse_qs returns a dict: each param once, at its first position
+        urls_with_param = urls_with_param.drop_duplicates()
+        return pd.DataFrame({
+            'url_id': url_ids.values[urls_with_param['position'].values],
+            'param': urls_with_param['param'].values
         })
-        return urls_with_param
 
+    # function to check values in query parameters
     @staticmethod
-    def _check_ph_num(text, region=None):
-        for _ in phonenumbers.PhoneNumberMatcher(text, region):
-            return True
+    def _qp_no_phone(v, countries=None, phones=None):
+        """
+        :param phones: Optional dict of value -> whether it has a phone
+            number, checked in a batch (see remove_pii_params)
+        """
+        if phones is not None and v in phones:
+            return not phones[v]
+        return not get_detector(countries).has_phone(v)
 
-    # function to check values in query parameters
     @staticmethod
-    def _qp_no_phone(v, countries=None):
-        if countries is None:
-            countries = [
-                'IN', 'US', 'BR', 'ID', 'MX', 'PI',
-                'VN', 'TH', 'TR', 'GB', 'FR', 'DE']
-        any_phone = any(
-            URLParametersRemoval._check_ph_num(v, region=c)
-            for c in countries)
-        return not any_phone
+    def _kept_param_values(url_group):
+        """
+        Values (as checked by drop_query_params) of the params of a url
+        that are kept
+        """
+        kept = set(url_group['param'][url_group['keep'].values])
+        if not kept:
+            return []
+        query = urlparse.parse_qs(
+            urlparse.urlparse(url_group['url'].values[0]).query)
+        return [str(v) for qp, v in query.items() if qp in kept]
 
     @staticmethod
     def drop_params_via_similarity(
@@ -152,16 +244,64 @@ class URLParametersRemoval(object):
             same_title_upper_bound=0.95,
             mean_diff_gsim_lower_bound=0.02,
             mean_diff_gsim_upper_bound=0.98,
-            body_length_lower_bound=100):
+            body_length_lower_bound=100,
+            matcher=None):
+        """
+        Decide which params to keep on each url. The drop_rule column tells
+        which rule of the matcher (see param_matcher.ParamMatcher) forced a
+        param to be dropped, if any.
+        """
+        if matcher is None:
+            matcher = ParamMatcher()
+        urls = urls_with_param[
+            ['url_id', 'full_domain', 'canonical_url', 'param']]
+        urls = _left_join(urls, param_domain)
+        urls['url'] = urls['canonical_url']
+        urls['drop_rule'] = matcher.classify(urls['param'])
+        urls['keep'] = URLParametersRemoval.keep_params(
+            urls,
+            matcher=matcher,
+            same_title_upper_bound=same_title_upper_bound,
+            mean_diff_gsim_lower_bound=mean_diff_gsim_lower_bound,
+            mean_diff_gsim_upper_bound=mean_diff_gsim_upper_bound,
+            body_length_lower_bound=body_length_lower_bound)
+        return urls
+
+    @staticmethod
+    def drop_params_via_rules(urls_with_param, rules):
+        """
+        Same as drop_params_via_similarity, with the keep decisions taken
+        from a rule table (see url_rules.URLRules.to_frame) instead of
+        being computed from param_domain. Params without a rule are dropped.
+        """
         urls = urls_with_param[
             ['url_id', 'full_domain', 'canonical_url', 'param']]
-        urls = pd.merge(
-            urls, param_domain, how="left", on=["full_domain", "param"])
+        urls = _left_join(urls, rules[['full_domain', 'param', 'keep']])
         urls['url'] = urls['canonical_url']
+        urls['keep'] = urls['keep'].fillna(False).astype(bool)
+        return urls
+
+    @staticmethod
+    def keep_params(
+            urls,
+            same_title_upper_bound=0.95,
+            mean_diff_gsim_lower_bound=0.02,
+            mean_diff_gsim_upper_bound=0.98,
+            body_length_lower_bound=100,
+            matcher=None):
+        """
+        Decide which params to keep, given their similarity statistics.
 
+        :param urls: pd.DataFrame with columns param, same_title, diff_gsim
+            and body_length, as built by build_param_data
+        :param matcher: Optional ParamMatcher of the params to always drop,
+            defaults to ParamMatcher()
+        :return: np.array of bool, True for the params to keep
+        """
+        if matcher is None:
+            matcher = ParamMatcher()
         # keep list of parameters to remove for each URL, defaults to False
-        if 'keep' not in urls:
-            urls['keep'] = False
+        keep = np.zeros(len(urls), dtype=bool)
 
         # THIS IS WHERE THE RUBBER MEETS THE ROAD.
         # Keep params that when removed result in a webpage with a different title or
@@ -177,49 +317,27 @@ class URLParametersRemoval(object):
             & (urls['body_length'] > body_length_lower_bound))
 
         # keep_idx.mean() # 0.21376656596720206, old result
-        urls['keep'] = np.where(keep_idx, True, urls['keep'])
+        keep = np.where(keep_idx, True, keep)
 
         # ^^ THIS SHOULD EVENTUALLY BE DONE VIA ML
         # - Training outcome, something like:
 
-        # Add these parameters + others that we obviously need to remove to
-        # our drop list:
-        drop = [
-            # pii related parameters:
-            'pw', 'pass', 'password', 'key', 'username', 'name', 'email',
-            'address', 'account', 'password', 'ssn', 'dob', 'zipcode',
-            'user_id', 'userid', 'accountid', 'account_id',
-            # commonly occuring tracking/token-related parameters
-            'utm_source', 'utm_medium', 'utm_campaign', 'utm_content', 'source',
-            'utm_term', 'usp', 'edit_requested', 'ogsrc', 'fbclid',
-            'entrypoint', 'redirect', 'platform', 'widgetTypeCall', 'logType',
-            'uuid', 'app_id', 'campaign', 'src', 'caption', 'fbrefresh',
-            'user', 'cp', 'desc', 'c_id', 'geo', 'cmpid', 'cHash', '_reff',
-            'pk_campaign', 'ctype', 's_src', 'referrer',
-            'channel', 'userid', 'uc_param_str', 'fb-share-results', 'cpidfb',
-            'content_type', 'tag', 'campaign_id', 'cID', 'channel_id',
-            'NONCE_TOKEN', 'reco_id', 'promo_id',
-        ]
-
-        # Add params to a drop index if they match:
-        drop_str = '|'.join(drop)
-        drop_idx = urls['param'].str.contains(drop_str, regex=True)
-
-        # NOTE: if drop_idx is null, it means that we couldn't reach the website to
+        # Add params to a drop index if they match our drop list. If the
+        # param is null, it means that we couldn't reach the website to
         # check query params, so add all params to the drop list.
-        drop_idx[pd.isnull(drop_idx)] = True
+        drop_idx = matcher.classify(urls['param']).notnull()
 
         # Note that our parameter keep-list should shrink a touch in response to
         # this filtering.
-        urls['keep'] = np.where(drop_idx, False, urls['keep'])
+        keep = np.where(drop_idx, False, keep)
 
-        return urls
+        return keep.astype(bool)
 
     # function to iterate over query params and drop if they don't meet condition
     # 'keep'. Eventually could set keep based on ML.
     # Function will be applied to a dataframe grouped by URL.
     @staticmethod
-    def drop_query_params(url_group):
+    def drop_query_params(url_group, countries=None, phones=None):
         params_dropped = []
         params_kept = []
         url = url_group['url'].values[0]
@@ -233,7 +351,8 @@ class URLParametersRemoval(object):
             if qp in set(url_group['param']):
                 if url_group['keep'][
                     url_group['param'] == qp].values[0] \
-                        & URLParametersRemoval._qp_no_phone(str(v)):
+                        and URLParametersRemoval._qp_no_phone(
+                            str(v), countries, phones):
                     params_kept.append(qp)
                 else:
                     params_dropped.append(qp)
@@ -254,26 +373,27 @@ class URLParametersRemoval(object):
             params_kept)
 
     @staticmethod
-    def remove_pii_params(urls, lower=None, upper=None):
+    def remove_pii_params(urls, lower=None, upper=None, countries=None):
         """
         Now group by URL and check each parameter against the list and against
-        common phone number patterns for countries in the list above. Save output
-        as we go in case the process dies.
+        common phone number patterns for countries (see
+        pii_detection.DEFAULT_REGIONS). Save output as we go in case the
+        process dies.
         """
         urls_grouped = urls.groupby('canonical_url')
+        url_groups = [
+            url_group for _idx, url_group in itertools.islice(
+                urls_grouped, lower, upper)]
+        # look for phone numbers in each distinct value of a kept param once
+        phones = get_detector(countries).has_phone_many(
+            value for url_group in url_groups
+            for value in URLParametersRemoval._kept_param_values(url_group))
         results = []
-        i = 0
-        for _idx, url_group in urls_grouped:
+        for i, url_group in enumerate(url_groups):
             if i % 10000 == 0:
-                print("progress: {} / {}".format(i, len(urls_grouped)),
-                      file=sys.stderr)
-            if lower is not None and i < lower:
-                i = i + 1
-                continue
-            if upper is not None and i >= upper:
-                break
-            results.append(URLParametersRemoval.drop_query_params(url_group))
-            i = i + 1
+                logging.info("progress: %d / %d", i, len(url_groups))
+            results.append(URLParametersRemoval.drop_query_params(
+                url_group, countries, phones))
         urls_params_dropped = pd.Series(results)
 
         # parse out url and params dropped from output
@@ -290,3 +410,109 @@ class URLParametersRemoval(object):
             clean_urls['clean_url'].replace(
                 email_pattern, '<EMAIL>', regex=True)
         return clean_urls
+
+    @staticmethod
+    def remove_pii_params_parallel(
+            urls, n_partitions=64, max_worker=4, checkpoint_dir=None,
+            countries=None):
+        """
+        Same output as remove_pii_params, computed in a pebble process pool.
+        Urls are partitioned by a hash of canonical_url, so that all rows of a
+        url land in the same partition. With a checkpoint_dir, the output of
+        each partition is saved there as it completes, and partitions already
+        saved are loaded instead of being computed again: rerun with the same
+        checkpoint_dir (and n_partitions) to resume a run that died. Each
+        checkpoint has a manifest with the number of rows and a hash of the
+        urls (and keep decisions) of its input partition: a checkpoint of
+        other input, e.g. from another run or chunk, is computed again.
+        """
+        partition = pd.util.hash_pandas_object(
+            urls['canonical_url'], index=False).values % n_partitions
+        if checkpoint_dir is not None:
+            os.makedirs(checkpoint_dir, exist_ok=True)
+        results = []
+        with ProcessPool(max_workers=max_worker) as pool:
+            futures = []
+            for i in range(n_partitions):
+                checkpoint_path = None
+                if checkpoint_dir is not None:
+                    checkpoint_path = os.path.join(
+                        checkpoint_dir,
+                        "part-{0:05d}-of-{1:05d}.pkl".format(i, n_partitions))
+                urls_partition = urls[partition == i]
+                if checkpoint_path is not None and _checkpoint_matches(
+                        checkpoint_path, urls_partition):
+                    results.append(pd.read_pickle(checkpoint_path))
+                    continue
+                if urls_partition.shape[0] == 0:
+                    continue
+                futures.append(pool.schedule(
+                    _remove_pii_partition,
+                    args=[urls_partition, countries, checkpoint_path]))
+            for i, future in enumerate(futures):
+                results.append(future.result())
+                logging.info(
+                    "progress: %d / %d partitions", i + 1, len(futures))
+
+        # merge back in the order of remove_pii_params: sorted by url
+        clean_urls = pd.concat(results, axis=0)
+        clean_urls = clean_urls.sort_values('canonical_url', kind='mergesort')
+        clean_urls['index'] = np.arange(clean_urls.shape[0])
+        return clean_urls.reset_index(drop=True)
+
+
+def _left_join(urls, table):
+    """
+    Same as pd.merge(urls, table, how='left', on=['full_domain', 'param']),
+    joining on integer codes, for a table with one row per (full_domain,
+    param)
+    """
+    columns = [
+        column for column in table.columns
+        if column not in ('full_domain', 'param')]
+    return pd.concat(
+        [urls.reset_index(drop=True), lookup(urls, table, columns)], axis=1)
+
+
+def _partition_manifest(urls):
+    """
+    Number of rows and hash of the urls and keep decisions of a partition
+    """
+    columns = [c for c in ('canonical_url', 'param', 'keep') if c in urls]
+    hashes = pd.util.hash_pandas_object(urls[columns], index=False).values
+    return {
+        'rows': int(urls.shape[0]),
+        'hash': hashlib.sha1(hashes.tobytes()).hexdigest(),
+    }
+
+
+def _checkpoint_matches(checkpoint_path, urls):
+    """
+    Whether the checkpoint exists and was computed from urls
+    """
+    manifest_path = checkpoint_path + '.json'
+    if not os.path.exists(checkpoint_path) \
+            or not os.path.exists(manifest_path):
+        return False
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    if manifest != _partition_manifest(urls):
+        logging.info(
+            "ignoring checkpoint %s: computed from other urls",
+            checkpoint_path)
+        return False
+    return True
+
+
+def _remove_pii_partition(urls, countries, checkpoint_path):
+    clean_urls = URLParametersRemoval.remove_pii_params(
+        urls, countries=countries)
+    if checkpoint_path is not None:
+        # write then rename, so that a checkpoint is never partially written,
+        # and the manifest last, so that a checkpoint without one is ignored
+        clean_urls.to_pickle(checkpoint_path + '.tmp')
+        os.replace(checkpoint_path + '.tmp', checkpoint_path)
+        with open(checkpoint_path + '.json.tmp', 'w') as f:
+            json.dump(_partition_manifest(urls), f)
+        os.replace(checkpoint_path + '.json.tmp', checkpoint_path + '.json')
+    return clean_urls
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# Copyright (c) Facebook, Inc. and its affiliates. All Rights Reserved
+"""
+Per-domain rules learned from the training crawl: for each domain, which
+query parameters are kept. Rules are saved as a small versioned JSON file
+(gzipped if the path ends with .gz), so that new URLs can be cleaned without
+crawling again.
+"""
+
+import gzip
+import json
+import time
+import pandas as pd
+
+from url_parameters_removal import URLParametersRemoval
+
+RULES_FORMAT = 'url-sanitization-rules'
+RULES_VERSION = 1
+
+
+class URLRules(object):
+    def __init__(self, domains, bounds=None, created_at=None):
+        """
+        :param domains: dict of full_domain -> dict of param -> keep (bool)
+        :param bounds: Optional dict of the thresholds the rules were built
+            with, kept for reference.
+        :param created_at: Optional. Unix time the rules were built at.
+        """
+        self.domains = domains
+        self.bounds = bounds or {}
+        self.created_at = created_at if created_at is not None \
+            else time.time()
+
+    @classmethod
+    def from_param_domain(cls, param_domain, **bounds):
+        """
+        Build rules from the output of URLParametersRemoval.build_param_data,
+        with the same decisions as drop_params_via_similarity.
+
+        :param bounds: thresholds (and matcher) passed on to
+            URLParametersRemoval.keep_params
+        """
+        keep = URLParametersRemoval.keep_params(param_domain, **bounds)
+        bounds.pop('matcher', None)
+        domains = {}
+        for full_domain, param, keep_param in zip(
+                param_domain['full_domain'], param_domain['param'], keep):
+            domains.setdefault(full_domain, {})[param] = bool(keep_param)
+        return cls(domains, bounds=bounds)
+
+    def keep(self, full_domain, param):
+        """
+        Whether to keep param on urls of full_domain. Params without a rule
+        are dropped.
+        """
+        return self.domains.get(full_domain, {}).get(param, False)
+
+    def to_frame(self):
+        """
+        :return: pd.DataFrame with columns full_domain, param and keep
+        """
+        rows = [
+            (full_domain, param, keep)
+            for full_domain, params in self.domains.items()
+            for param, keep in params.items()]
+        return pd.DataFrame(
+            rows, columns=['full_domain', 'param', 'keep']).astype(
+            {'keep': bool})
+
+    def save(self, path):
+        rules = {
+            'format': RULES_FORMAT,
+            'version': RULES_VERSION,
+            'created_at': self.created_at,
+            'bounds': self.bounds,
+            'domains': self.domains,
+        }
+        opener = gzip.open if path.endswith('.gz') else open
+        with opener(path, 'wt', encoding='utf-8') as f:
+            json.dump(rules, f, separators=(',', ':'), sort_keys=True)
+
+    @classmethod
+    def load(cls, path):
+        opener = gzip.open if path.endswith('.gz') else open
+        with opener(path, 'rt', encoding='utf-8') as f:
+            rules = json.load(f)
+        if rules.get('format') != RULES_FORMAT:
+            raise ValueError("not a rule file: {0}".format(path))
+        if rules.get('version') != RULES_VERSION:
+            raise ValueError(
+                "unsupported rule file version {0}: {1}".format(
+                    rules.get('version'), path))
+        return cls(
+            rules['domains'],
+            bounds=rules.get('bounds'),
+            created_at=rules.get('created_at'))
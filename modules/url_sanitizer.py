@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+# Copyright (c) Facebook, Inc. and its affiliates. All Rights Reserved
+"""
+Clean single URLs in memory with learned rules, without building
+DataFrames. Gives the same results as process_urls.apply_rules: the keep
+decisions of the rule file are applied as they are.
+"""
+
+import re
+import urllib.parse as urlparse
+
+from url_parameters_removal import URLParametersRemoval
+from url_rules import URLRules
+
+
+class URLSanitizer(object):
+    def __init__(self, rules, countries=None):
+        """
+        :param rules: URLRules
+        :param countries: Optional list of regions to look for phone numbers
+            in, see URLParametersRemoval._qp_no_phone.
+        """
+        self.countries = countries
+        # only keep the params to keep
+        self.keep_params = {
+            full_domain: frozenset(
+                param for param, keep in params.items() if keep)
+            for full_domain, params in rules.domains.items()}
+        self.email_pattern = re.compile(
+            r'[a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]+')
+
+    @classmethod
+    def from_rule_file(cls, path, countries=None):
+        return cls(URLRules.load(path), countries=countries)
+
+    def sanitize(self, url, full_domain=None):
+        """
+        :param url: STRING
+        :param full_domain: Optional. Domain whose rules apply, defaults to
+            the netloc of url.
+        :return: (clean_url, params_dropped, params_kept)
+        """
+        parsed = urlparse.urlparse(url)
+        if full_domain is None:
+            full_domain = parsed.netloc
+        keep_params = self.keep_params.get(full_domain, frozenset())
+        query = urlparse.parse_qs(parsed.query)
+        params_dropped = []
+        params_kept = []
+        for qp, v in list(query.items()):
+            if qp in keep_params \
+                    and URLParametersRemoval._qp_no_phone(
+                        str(v), self.countries):
+                params_kept.append(qp)
+            else:
+                params_dropped.append(qp)
+                del query[qp]
+        clean_url = urlparse.urlunparse(parsed._replace(
+            query=urlparse.urlencode(query, True)))
+        clean_url = self.email_pattern.sub('<EMAIL>', clean_url)
+        return clean_url, params_dropped, params_kept
+
+    def sanitize_many(self, urls, full_domains=None):
+        """
+        :param urls: iterable of urls in string
+        :param full_domains: Optional iterable of the matching domains
+        :return: list of (clean_url, params_dropped, params_kept)
+        """
+        if full_domains is None:
+            return [self.sanitize(url) for url in urls]
+        return [
+            self.sanitize(url, full_domain)
+            for url, full_domain in zip(urls, full_domains)]
@@ -0,0 +1,13 @@
+#!/usr/bin/env python3
+# Copyright (c) Facebook, Inc. and its affiliates. All Rights Reserved
+"""
+The modules use flat imports: put modules/ and benchmarks/ on the path, as
+the scripts of benchmarks/ do.
+"""
+
+import os
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+for directory in ('modules', 'benchmarks'):
+    sys.path.insert(0, os.path.join(ROOT, directory))
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# Copyright (c) Facebook, Inc. and its affiliates. All Rights Reserved
+"""
+CrawlArchive records, and record/replay of a crawl.
+"""
+
+import gzip
+import json
+import pickle
+import warnings
+import pytest
+
+import fake_server
+from crawl_archive import CrawlArchive
+from url_comparison import URLComparison
+
+COLUMNS = ['url', 'key', 'success', 'dl_ratio', 'status_code', 'message']
+
+
+def test_get_last_record(tmp_path):
+    archive = CrawlArchive(str(tmp_path / 'crawl.arc'))
+    archive.put({'url': 'http://h/p?b=2&a=1', 'body': 'first'})
+    archive.put({'url': 'http://H/p?a=1&b=2', 'body': 'second'})
+    archive.put({'url': 'http://h/p?a=1&b=2', 'refresh': True, 'body': 'aa'})
+    archive = CrawlArchive(archive.path)
+    assert len(archive) == 3
+    # urls are normalized as in the cache
+    assert 'http://h/p?b=2&a=1' in archive
+    assert 'http://h/q' not in archive
+    assert archive.get('http://h/p?a=1&b=2')['body'] == 'second'
+    assert archive.get('http://h/p?a=1&b=2', refresh=True)['body'] == 'aa'
+    assert archive.get('http://h/q') is None
+    assert archive.get('http://h/p?a=1&b=2')['fetched_at'] > 0
+
+
+def test_refresh_fallback(tmp_path):
+    archive = CrawlArchive(str(tmp_path / 'crawl.arc'))
+    archive.put({'url': 'http://h/p', 'body': 'only'})
+    assert archive.get('http://h/p', refresh=True)['body'] == 'only'
+
+
+def test_records(tmp_path):
+    archive = CrawlArchive(str(tmp_path / 'crawl.arc'))
+    for i in range(5):
+        archive.put({'url': 'http://h/p?id={0}'.format(i), 'body': str(i)})
+    assert [r['body'] for r in archive.records()] == list('01234')
+    # the data file is a valid gzip file of JSON records
+    with gzip.open(archive.path, 'rt') as f:
+        data = f.read()
+    assert json.loads(data[:data.index('}') + 1])['body'] == '0'
+
+
+def test_pickle(tmp_path):
+    archive = CrawlArchive(str(tmp_path / 'crawl.arc'))
+    archive.put({'url': 'http://h/p', 'body': 'x'})
+    assert archive.get('http://h/p')['body'] == 'x'
+    copy = pickle.loads(pickle.dumps(archive))
+    assert copy.get('http://h/p')['body'] == 'x'
+
+
+def crawl(urls, **kwargs):
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        url_info = URLComparison(
+            max_worker=2, **kwargs).process_multiple_urls(urls)
+    return url_info[COLUMNS].sort_values(['url', 'key'], na_position='first')\
+        .reset_index(drop=True)
+
+
+@pytest.mark.parametrize('backend', ['requests', 'asyncio'])
+def test_replay(tmp_path, backend):
+    server = fake_server.start(words=50)
+    urls = [
+        '{0}/site{1}/item?id={1}&utm_source=fb'.format(server.base_url, i)
+        for i in range(3)] + ['http://127.0.0.1:1/site0/item?id=1']
+    archive = CrawlArchive(str(tmp_path / 'crawl.arc'))
+    try:
+        recorded = crawl(urls, backend=backend, archive=archive)
+    finally:
+        server.shutdown()
+        server.server_close()
+    # every fetch, failed ones included: 4 per url of the server, 3 for the
+    # unreachable one
+    assert len(archive) == 15
+    # the server is down, every page comes from the archive
+    replayed = crawl(
+        urls, backend=backend, archive=CrawlArchive(archive.path),
+        replay=True)
+    assert replayed.equals(recorded)
+
+
+def test_replay_needs_archive():
+    with pytest.raises(ValueError):
+        URLComparison(replay=True)
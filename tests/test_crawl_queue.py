@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+# Copyright (c) Facebook, Inc. and its affiliates. All Rights Reserved
+"""
+Leases, expiry, retries and shards of the CrawlQueue.
+"""
+
+import time
+import pickle
+import pandas as pd
+
+from crawl_queue import CrawlQueue, run_worker
+from url_comparison import URLComparison
+
+URLS = ['http://a.com/{0}?id=1'.format(i) for i in range(5)]
+
+
+def queue(tmp_path, **kwargs):
+    return CrawlQueue(str(tmp_path / 'crawl.db'), **kwargs)
+
+
+def url_info(urls):
+    return pd.DataFrame({'url': urls, 'key': [None] * len(urls)})
+
+
+class FakeComparison(object):
+    """
+    Crawls every url into one AA row, or fails on the urls of fail
+    """
+    def __init__(self, fail=()):
+        self.fail = set(fail)
+        self.batches = []
+
+    def process_multiple_urls(self, urls):
+        self.batches.append(list(urls))
+        if self.fail & set(urls):
+            raise ValueError("failed")
+        return url_info(urls)
+
+
+def test_add_is_idempotent(tmp_path):
+    crawl = queue(tmp_path)
+    assert crawl.add(URLS) == 5
+    assert crawl.add(URLS[:2] + ['http://b.com/']) == 1
+    assert len(crawl) == 6
+    assert crawl.counts() == {
+        'pending': 6, 'leased': 0, 'done': 0, 'failed': 0}
+
+
+def test_lease_and_complete(tmp_path):
+    crawl = queue(tmp_path)
+    crawl.add(URLS)
+    batch_id, urls = crawl.lease('w1', 3)
+    assert urls == URLS[:3]
+    other_id, other_urls = crawl.lease('w2', 3)
+    assert other_id != batch_id
+    assert other_urls == URLS[3:]
+    assert crawl.lease('w3', 3) == (None, [])
+    assert crawl.complete(batch_id, url_info(urls)) == 3
+    assert crawl.counts()['done'] == 3
+    assert not crawl.finished
+    crawl.complete(other_id, url_info(other_urls))
+    assert crawl.finished
+    assert sorted(crawl.collect()['url']) == URLS
+
+
+def test_expired_lease_is_handed_out_again(tmp_path):
+    crawl = queue(tmp_path, lease_seconds=0.05)
+    crawl.add(URLS[:2])
+    batch_id, urls = crawl.lease('w1', 2)
+    time.sleep(0.1)
+    new_id, new_urls = crawl.lease('w2', 2)
+    assert new_urls == urls
+    # the first worker lost its lease, its results are not kept
+    assert not crawl.renew(batch_id)
+    assert crawl.complete(batch_id, url_info(urls)) == 0
+    assert crawl.complete(new_id, url_info(new_urls)) == 2
+    assert len(crawl.collect()) == 2
+
+
+def test_renew_keeps_the_lease(tmp_path):
+    crawl = queue(tmp_path, lease_seconds=0.2)
+    crawl.add(URLS[:2])
+    batch_id, _urls = crawl.lease('w1', 2)
+    for _i in range(3):
+        time.sleep(0.1)
+        assert crawl.renew(batch_id)
+    assert crawl.lease('w2', 2) == (None, [])
+
+
+def test_attempts(tmp_path):
+    crawl = queue(tmp_path, max_attempts=2)
+    crawl.add(URLS[:1])
+    batch_id, _urls = crawl.lease('w1', 1)
+    crawl.release(batch_id)
+    assert crawl.counts()['pending'] == 1
+    batch_id, _urls = crawl.lease('w1', 1)
+    crawl.release(batch_id)
+    assert crawl.counts()['failed'] == 1
+    assert crawl.finished
+    assert crawl.collect() is None
+
+
+def test_comparison_and_pickling(tmp_path):
+    crawl = queue(tmp_path)
+    crawl.add(URLS)
+    crawl.set_comparison(URLComparison(timeout=7, max_worker=3))
+    copy = pickle.loads(pickle.dumps(crawl))
+    comparison = copy.get_comparison()
+    assert (comparison.timeout, comparison.max_worker) == (7, 3)
+    assert len(copy) == 5
+
+
+def test_run_worker(tmp_path):
+    crawl = queue(tmp_path, max_attempts=2)
+    crawl.add(URLS)
+    comparison = FakeComparison(fail=URLS[4:])
+    assert run_worker(crawl, comparison, batch_size=2, wait=False) == 4
+    # the failing url is crawled again once, then given up
+    assert comparison.batches == [URLS[:2], URLS[2:4], URLS[4:], URLS[4:]]
+    assert crawl.counts() == {
+        'pending': 0, 'leased': 0, 'done': 4, 'failed': 1}
+    assert sorted(crawl.collect()['url']) == URLS[:4]
+    # rerunning only crawls what is left
+    assert run_worker(crawl, FakeComparison(), wait=False) == 0
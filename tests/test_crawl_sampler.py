@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# Copyright (c) Facebook, Inc. and its affiliates. All Rights Reserved
+"""
+Sampling the training urls: caps per (domain, param) pair, convergence, and
+a sampled crawl of a local fake_server.
+"""
+
+import warnings
+import numpy as np
+import pandas as pd
+import pytest
+
+import fake_server
+from crawl_results import Comparison, url_results
+from crawl_sampler import CrawlSampler, RunningMean
+from url_comparison import URLComparison
+
+
+def url_data(urls):
+    return pd.DataFrame({'canonical_url': urls})
+
+
+def result(url, dl_ratio=1.0, same_title=True):
+    """
+    Crawl result of url: the AA test, and the same comparison for each of
+    its params
+    """
+    comparison = Comparison(
+        success=True, message=None, dl_ratio=dl_ratio, running_time=0.0,
+        body_length=1000, same_title=same_title, status_code=200,
+        fetch_time=0.0, parse_time=0.0, response_bytes=1000, diff_time=0.0)
+    keys = [None] + [
+        param.split('=')[0] for param in url.split('?')[1].split('&')]
+    return url_results(url, [(key, url, comparison) for key in keys])
+
+
+def test_running_mean():
+    values = [0.1, 0.5, 0.2, 0.9, 0.4]
+    running = RunningMean()
+    assert running.half_width() == float('inf')
+    for value in values:
+        running.add(value)
+    assert running.mean == pytest.approx(np.mean(values))
+    assert running.variance == pytest.approx(np.var(values, ddof=1))
+    assert running.half_width(z=2) == pytest.approx(
+        2 * np.std(values, ddof=1) / np.sqrt(len(values)))
+
+
+def test_cap_per_pair():
+    urls = ['http://a.com/x?id={0}'.format(i) for i in range(10)]
+    # a new pair makes a url worth crawling again
+    urls.append('http://a.com/x?id=10&page=2')
+    # as does another domain
+    urls.append('http://b.com/x?id=1')
+    # urls without params have nothing to test
+    urls.append('http://a.com/x')
+    sampler = CrawlSampler(url_data(urls), max_per_pair=3)
+    assert list(sampler.iter_urls()) == urls[:3] + urls[10:12]
+    assert sampler.skipped == 8
+    assert sampler.scheduled[('a.com', 'id')] == 4
+
+
+def test_converged_pairs_are_skipped():
+    urls = ['http://a.com/x?id={0}'.format(i) for i in range(20)]
+    sampler = CrawlSampler(url_data(urls), min_samples=5)
+    crawled = []
+    for url in sampler.iter_urls():
+        crawled.append(url)
+        # every url gives the same comparison, the means are known at once
+        sampler.add_result(url, result(url))
+    assert crawled == urls[:5]
+    assert sampler.converged(('a.com', 'id'))
+
+
+def test_noisy_pairs_are_crawled():
+    urls = ['http://a.com/x?id={0}'.format(i) for i in range(20)]
+    sampler = CrawlSampler(url_data(urls), min_samples=5, tolerance=0.01)
+    for i, url in enumerate(sampler.iter_urls()):
+        sampler.add_result(url, result(url, dl_ratio=i % 2))
+    assert sampler.skipped == 0
+    assert not sampler.converged(('a.com', 'id'))
+
+
+def test_failed_rows_are_ignored():
+    url = 'http://a.com/x?id=1'
+    sampler = CrawlSampler(url_data([url]))
+    failed = [row._replace(success=False) for row in result(url)]
+    sampler.add_result(url, failed)
+    assert sampler.qsim == {}
+
+
+def test_sampled_crawl():
+    server = fake_server.start(words=50)
+    urls = [
+        '{0}/site0/item?id={1}'.format(server.base_url, i)
+        for i in range(12)]
+    sampler = CrawlSampler(url_data(urls), max_per_pair=4)
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            url_info = URLComparison(max_worker=2).process_multiple_urls(
+                urls, sampler)
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert sorted(url_info['url'].unique()) == sorted(urls[:4])
+    host = server.base_url.split('://')[1]
+    assert sampler.qsim[(host, 'id')].n == 4
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+# Copyright (c) Facebook, Inc. and its affiliates. All Rights Reserved
+"""
+Group testing against one fetch per param, on a local fake_server.
+"""
+
+import warnings
+import pytest
+
+import fake_server
+from url_comparison import URLComparison
+
+BACKENDS = ['requests', 'asyncio']
+
+
+@pytest.fixture(scope='module')
+def server():
+    server = fake_server.start(words=50)
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def crawl(server, urls, **kwargs):
+    """
+    :return: (rows of the crawl sorted by url and key, number of requests)
+    """
+    before = server.requests
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        url_info = URLComparison(
+            max_worker=2, **kwargs).process_multiple_urls(urls)
+    url_info = url_info.sort_values(['url', 'key'], na_position='first')\
+        .reset_index(drop=True)
+    return url_info, server.requests - before
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_group_of_trackers(server, backend):
+    urls = [
+        '{0}/site{1}/item?utm_source=a&id={1}&fbclid=b&src=c&cp=d'.format(
+            server.base_url, i)
+        for i in range(3)]
+    each, each_requests = crawl(server, urls, backend=backend)
+    group, group_requests = crawl(
+        server, urls, backend=backend, strategy='group')
+    # one row per param and the AA test, as with one fetch per param
+    assert group[['url', 'key']].equals(each[['url', 'key']])
+    assert group['same_title'].equals(each['same_title'])
+    assert group['key'][~group['same_title']].unique().tolist() == ['id']
+    changed = group['key'] == 'id'
+    assert (group['dl_ratio'][~changed] == 1).all()
+    assert (group['dl_ratio'][changed] < 0.5).all()
+    # the url, the AA test, every param, then the trackers and id apart,
+    # instead of the url, the AA test and one fetch per param
+    assert each_requests == 3 * 7
+    assert group_requests == 3 * 5
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_group_splits_in_halves(server, backend):
+    url = '{0}/site0/item?id=1&page=2&utm_source=a'.format(server.base_url)
+    group, _requests = crawl(server, [url], backend=backend, strategy='group')
+    each, _requests = crawl(server, [url], backend=backend)
+    assert group[['key', 'same_title']].equals(each[['key', 'same_title']])
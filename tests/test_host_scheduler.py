@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+# Copyright (c) Facebook, Inc. and its affiliates. All Rights Reserved
+"""
+Politeness: the HostScheduler, the HostRateLimiter, and a polite crawl of a
+local fake_server.
+"""
+
+import time
+import warnings
+import threading
+import multiprocessing
+import pytest
+
+import fake_server
+from crawl_results import empty_result
+from host_scheduler import HostScheduler, HostRateLimiter
+from url_comparison import URLComparison
+
+
+def urls(host, n):
+    return ['http://{0}/page?id={1}'.format(host, i) for i in range(n)]
+
+
+def test_round_robin():
+    scheduler = HostScheduler(max_per_host=10)
+    for url in urls('a', 3) + urls('b', 2):
+        scheduler.add(url)
+    assert len(scheduler) == 5
+    order = [HostScheduler.host(scheduler.next_url(now=0)) for _i in range(5)]
+    assert order == ['a', 'b', 'a', 'b', 'a']
+    assert scheduler.next_url(now=0) is None
+    assert len(scheduler) == 0
+
+
+def test_max_per_host():
+    scheduler = HostScheduler(max_per_host=2)
+    for url in urls('a', 3):
+        scheduler.add(url)
+    first = scheduler.next_url(now=0)
+    scheduler.next_url(now=0)
+    assert scheduler.next_url(now=0) is None
+    # waiting on the urls in flight
+    assert scheduler.wait_time(now=0) is None
+    assert not scheduler.finished(first, now=0)
+    assert scheduler.next_url(now=0) is not None
+
+
+def test_min_interval():
+    scheduler = HostScheduler(max_per_host=10, min_interval=1.0)
+    for url in urls('a', 2) + urls('b', 1):
+        scheduler.add(url)
+    assert HostScheduler.host(scheduler.next_url(now=0)) == 'a'
+    assert HostScheduler.host(scheduler.next_url(now=0)) == 'b'
+    assert scheduler.next_url(now=0.5) is None
+    assert scheduler.wait_time(now=0.5) == 0.5
+    assert HostScheduler.host(scheduler.next_url(now=1.0)) == 'a'
+
+
+def test_throttled_backoff():
+    scheduler = HostScheduler(
+        max_per_host=1, backoff=10.0, max_backoff=15.0, max_retries=2)
+    url = urls('a', 1)[0]
+    scheduler.add(url)
+    now = 0
+    # queued again twice, held back 10 then 15 seconds
+    for delay in (10.0, 15.0):
+        assert scheduler.next_url(now=now) == url
+        assert scheduler.finished(url, throttled=True, now=now)
+        assert scheduler.next_url(now=now + delay - 1) is None
+        assert scheduler.wait_time(now=now) == delay
+        now += delay
+    assert scheduler.next_url(now=now) == url
+    # out of retries
+    assert not scheduler.finished(url, throttled=True, now=now)
+    assert len(scheduler) == 0
+
+
+def test_is_throttled():
+    url = urls('a', 1)[0]
+    row = empty_result(url, 'error')[0]
+    assert not HostScheduler.is_throttled([row])
+    assert HostScheduler.is_throttled([row._replace(status_code=429)])
+
+
+def test_rate_limiter_reserve():
+    limiter = HostRateLimiter(1.0)
+    a, b = urls('a', 1)[0], urls('b', 1)[0]
+    assert limiter.reserve(a, now=0) == 0
+    assert limiter.reserve(a, now=0) == 1.0
+    assert limiter.reserve(a, now=0.5) == 1.5
+    # hosts are independent
+    assert limiter.reserve(b, now=0.5) == 0
+    assert limiter.reserve(a, now=10) == 0
+
+
+def _reserve(limiter, url, delays):
+    delays.append(limiter.reserve(url))
+
+
+def test_rate_limiter_across_processes():
+    with multiprocessing.Manager() as manager:
+        limiter = HostRateLimiter(10.0, manager)
+        delays = manager.list()
+        processes = [
+            multiprocessing.Process(
+                target=_reserve, args=(limiter, urls('a', 1)[0], delays))
+            for _i in range(3)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        delays = sorted(delays)
+    # one slot each, 10 seconds apart
+    assert delays[0] == pytest.approx(0, abs=1)
+    assert delays[1] == pytest.approx(10, abs=1)
+    assert delays[2] == pytest.approx(20, abs=1)
+
+
+class TimedSiteServer(fake_server.FakeSiteServer):
+    """
+    Records the time of every request
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.times = []
+
+    def page(self, site, query):
+        self.times.append(time.time())
+        return super().page(site, query)
+
+
+def test_polite_crawl_spaces_fetches():
+    server = TimedSiteServer(words=50)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    crawl_urls = [
+        '{0}/site0/item?id={1}&utm_source=fb'.format(server.base_url, i)
+        for i in range(2)]
+    comparison = URLComparison(
+        max_worker=2, polite=True, max_urls_per_host=2, host_interval=0.2)
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            url_info = comparison.process_multiple_urls(crawl_urls)
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert url_info['success'].all()
+    assert comparison.rate_limiter is None
+    # per url: the url, its AA test and its 2 modified urls
+    times = sorted(server.times)
+    assert len(times) == 2 * 4
+    gaps = [b - a for a, b in zip(times, times[1:])]
+    assert min(gaps) > 0.15
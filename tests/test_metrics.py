@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+# Copyright (c) Facebook, Inc. and its affiliates. All Rights Reserved
+"""
+Metrics, their sinks, and the counters of a crawl of a local fake_server.
+"""
+
+import time
+import json
+import warnings
+import threading
+import pytest
+
+import fake_server
+from metrics import Histogram, Metrics, MemorySink, JSONLinesSink, \
+    PrometheusTextSink, OTHER_DOMAIN
+from url_comparison import URLComparison
+
+BACKENDS = ['requests', 'asyncio']
+
+
+@pytest.fixture(autouse=True)
+def quiet():
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        yield
+
+
+def total(metrics, name):
+    return sum(
+        value for (counter, _labels), value in metrics.counters.items()
+        if counter == name)
+
+
+def test_histogram():
+    histogram = Histogram(buckets=(1, 10))
+    for value in (0.5, 1, 5, 50):
+        histogram.observe(value)
+    assert histogram.count == 4
+    assert histogram.sum == 56.5
+    assert histogram.cumulative_counts() == [(1, 2), (10, 3), ('+Inf', 4)]
+
+
+def test_domains_are_bounded():
+    metrics = Metrics(max_domains=2)
+    assert [metrics.domain(d) for d in ('a', 'b', 'c', 'a')] == [
+        'a', 'b', OTHER_DOMAIN, 'a']
+
+
+def test_memory_sink():
+    sink = MemorySink()
+    metrics = Metrics(sink)
+    metrics.inc('urls_total', domain='a')
+    metrics.inc('urls_total', 2, domain='a')
+    metrics.flush()
+    metrics.flush()
+    assert len(sink.snapshots) == 2
+    assert sink.snapshots[-1]['counters'] == [
+        {'name': 'urls_total', 'labels': {'domain': 'a'}, 'value': 3}]
+
+
+def test_jsonlines_sink(tmp_path):
+    path = str(tmp_path / 'metrics.jsonl')
+    metrics = Metrics(JSONLinesSink(path))
+    with metrics.timer('stage_seconds', stage='read'):
+        pass
+    metrics.flush()
+    metrics.observe('fetch_seconds', 0.2)
+    metrics.flush()
+    with open(path) as f:
+        snapshots = [json.loads(line) for line in f]
+    assert len(snapshots) == 2
+    assert snapshots[0]['counters'][0]['labels'] == {'stage': 'read'}
+    assert snapshots[0]['histograms'] == []
+    assert snapshots[1]['histograms'][0]['count'] == 1
+
+
+def test_prometheus_text_sink(tmp_path):
+    path = str(tmp_path / 'metrics.prom')
+    metrics = Metrics(PrometheusTextSink(path))
+    metrics.inc('fetches_total', domain='a"b')
+    metrics.observe('fetch_seconds', 0.2, buckets=(0.1, 1), domain='a')
+    metrics.flush()
+    with open(path) as f:
+        lines = f.read().splitlines()
+    assert lines == [
+        '# TYPE url_sanitization_fetches_total counter',
+        'url_sanitization_fetches_total{domain="a\\"b"} 1',
+        '# TYPE url_sanitization_fetch_seconds histogram',
+        'url_sanitization_fetch_seconds_bucket{domain="a",le="0.1"} 0',
+        'url_sanitization_fetch_seconds_bucket{domain="a",le="1"} 1',
+        'url_sanitization_fetch_seconds_bucket{domain="a",le="+Inf"} 1',
+        'url_sanitization_fetch_seconds_sum{domain="a"} 0.2',
+        'url_sanitization_fetch_seconds_count{domain="a"} 1',
+    ]
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_crawl_counts_every_fetch(backend):
+    server = fake_server.start(words=50)
+    urls = [
+        '{0}/site{1}/item?id={1}&page=2&utm_source=fb&fbclid=x'.format(
+            server.base_url, i)
+        for i in range(2)]
+    metrics = Metrics()
+    try:
+        URLComparison(
+            max_worker=2, backend=backend, metrics=metrics
+        ).process_multiple_urls(urls)
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert total(metrics, 'urls_total') == 2
+    # per url: the url, its AA test and its 4 modified urls
+    assert total(metrics, 'fetches_total') == 2 * 6
+    assert total(metrics, 'errors_total') == 0
+    count = sum(
+        histogram.count for (name, _labels), histogram
+        in metrics.histograms.items() if name == 'fetch_seconds')
+    assert count == 2 * 6
+
+
+def test_group_test_counts_split_groups():
+    server = fake_server.start(words=50)
+    url = '{0}/site0/item?id=1&utm_source=fb'.format(server.base_url)
+    metrics = Metrics()
+    try:
+        URLComparison(
+            max_worker=1, strategy='group', metrics=metrics
+        ).process_multiple_urls([url])
+        requests = server.requests
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert total(metrics, 'fetches_total') == requests
+
+
+class HangingSiteServer(fake_server.FakeSiteServer):
+    """
+    Answers every page after 1 second
+    """
+    def page(self, site, query):
+        time.sleep(1.0)
+        return super().page(site, query)
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_fetch_timeouts(backend):
+    server = HangingSiteServer(words=50)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    metrics = Metrics()
+    try:
+        URLComparison(
+            max_worker=1, backend=backend, timeout=0.2, metrics=metrics
+        ).process_multiple_urls(
+            ['{0}/site0/item?id=1'.format(server.base_url)])
+    finally:
+        server.shutdown()
+        server.server_close()
+    # the url, its AA test and the url without id
+    assert total(metrics, 'timeouts_total') == 3
+    assert total(metrics, 'errors_total') == 0
+    assert total(metrics, 'fetches_total') == 0
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_unreachable_url_is_an_error(backend):
+    metrics = Metrics()
+    URLComparison(
+        max_worker=1, backend=backend, metrics=metrics
+    ).process_multiple_urls(['http://127.0.0.1:1/site0/item?id=1'])
+    assert total(metrics, 'errors_total') == 3
+    assert total(metrics, 'timeouts_total') == 0
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+# Copyright (c) Facebook, Inc. and its affiliates. All Rights Reserved
+"""
+ParamMatcher against brute force matching.
+"""
+
+import random
+import pandas as pd
+
+from param_matcher import ParamMatcher, tokenize
+
+PATTERNS = ['ab', 'b', 'abc', 'bca', 'caab', 'aaa', 'cb']
+
+
+def random_names(n, seed=0):
+    rng = random.Random(seed)
+    return [
+        ''.join(rng.choice('abc') for _ in range(rng.randrange(8)))
+        for _ in range(n)]
+
+
+def test_substrings():
+    matcher = ParamMatcher(
+        exact=(), prefixes=(), tokens=(), substrings=PATTERNS)
+    for name in random_names(2000):
+        rule = matcher.match(name)
+        found = [p for p in PATTERNS if p in name]
+        if not found:
+            assert rule is None
+            continue
+        # the pattern that ends first in the name
+        substring = rule[len('substring:'):]
+        assert rule.startswith('substring:') and substring in found
+        assert name.index(substring) + len(substring) == min(
+            name.index(p) + len(p) for p in found)
+
+
+def test_prefixes():
+    matcher = ParamMatcher(exact=(), prefixes=PATTERNS, tokens=())
+    for name in random_names(2000):
+        found = [p for p in PATTERNS if name.startswith(p)]
+        expected = 'prefix:' + min(found, key=len) if found else None
+        assert matcher.match(name) == expected
+
+
+def test_tokenize():
+    assert tokenize('newPassword') == ['new', 'password']
+    assert tokenize('APIKey') == ['api', 'key']
+    assert tokenize('user_email.address-2') == [
+        'user', 'email', 'address', '2']
+
+
+def test_default_rules():
+    matcher = ParamMatcher()
+    assert matcher.match('fbclid') == 'exact:fbclid'
+    assert matcher.match('utm_id') == 'prefix:utm_'
+    assert matcher.match('user_email') == 'token:user'
+    assert matcher.match('newPassword') == 'token:password'
+    assert matcher.match('api-key') == 'token:key'
+    # whole words only, and tracking params only match exactly
+    assert matcher.match('emails') is None
+    assert matcher.match('keyword') is None
+    assert matcher.match('stage') is None
+    assert matcher.match('id') is None
+
+
+def test_ignore_case():
+    assert ParamMatcher(ignore_case=True).match('FBCLID') == 'exact:fbclid'
+    assert ParamMatcher().match('FBCLID') is None
+
+
+def test_classify():
+    params = pd.Series(['id', 'fbclid', None, 'id'], index=[3, 5, 7, 9])
+    rules = ParamMatcher().classify(params)
+    assert rules.index.tolist() == [3, 5, 7, 9]
+    assert rules.tolist() == [None, 'exact:fbclid', 'null', None]
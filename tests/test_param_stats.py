@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+# Copyright (c) Facebook, Inc. and its affiliates. All Rights Reserved
+"""
+Per-domain statistics built from a crawl of a local fake_server.
+"""
+
+import warnings
+import pandas as pd
+import pytest
+
+import fake_server
+from generate_data import generate
+from param_stats import ParamStats
+from url_comparison import URLComparison
+from url_parameters_removal import URLParametersRemoval
+
+
+@pytest.fixture(scope='module')
+def url_data():
+    server = fake_server.start(words=50)
+    try:
+        url_data = generate(12, 2, server.base_url, pii_share=0)
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            url_info = URLComparison(max_worker=2).process_multiple_urls(
+                url_data['canonical_url'].values)
+    finally:
+        server.shutdown()
+        server.server_close()
+    return url_data, URLParametersRemoval(
+        url_data.copy()).append_url_similarity(url_info)
+
+
+@pytest.fixture(scope='module')
+def stats(url_data):
+    return ParamStats.from_url_data(url_data[1])
+
+
+def test_from_url_data(url_data, stats):
+    url_data, url_data_with_similarity = url_data
+    assert len(stats) > 0
+    # one AA test per url of the domain, one AB test per url with id
+    by_domain = stats.stats.set_index(['full_domain', 'param'])
+    n_urls = url_data.groupby('full_domain').size()
+    for domain, n in n_urls.items():
+        assert by_domain.loc[(domain, 'id'), 'n_aa_samples'] == n
+        assert by_domain.loc[(domain, 'id'), 'n_samples'] == n
+    # the stats keep the format of build_param_data
+    assert list(stats.param_domain.columns) == list(
+        URLParametersRemoval.build_param_data(url_data_with_similarity)
+        .columns)
+
+
+def test_merge_with_itself(stats):
+    merged = stats.merge(stats)
+    keys = ['full_domain', 'param']
+    left = stats.stats.sort_values(keys).reset_index(drop=True)
+    right = merged.stats.sort_values(keys).reset_index(drop=True)
+    assert (right['n_samples'] == 2 * left['n_samples']).all()
+    assert (right['n_aa_samples'] == 2 * left['n_aa_samples']).all()
+    for column in ['qsim', 'same_title', 'body_length', 'gsim_mean']:
+        assert right[column].astype('float64').values == pytest.approx(
+            left[column].astype('float64').values)
+
+
+def test_merge_weights_means(stats):
+    pair = stats.stats.iloc[[0]].copy()
+    old = pair.copy()
+    old['qsim'] = 0.0
+    old['n_samples'] = 1
+    new = pair.copy()
+    new['qsim'] = 1.0
+    new['n_samples'] = 3
+    merged = ParamStats(old).merge(ParamStats(new)).stats
+    assert merged['qsim'].iloc[0] == pytest.approx(0.75)
+    assert merged['n_samples'].iloc[0] == 4
+
+
+def test_merge_keeps_new_pairs(stats):
+    first = stats.stats.iloc[[0]]
+    rest = stats.stats[
+        stats.stats['full_domain'] != first['full_domain'].iloc[0]]
+    merged = ParamStats(first).merge(ParamStats(rest))
+    assert len(merged) == len(first) + len(rest)
+
+
+def test_select_urls(url_data, stats):
+    url_data, _ = url_data
+    assert len(stats.select_urls(url_data, min_samples=1)) == 0
+    assert len(stats.select_urls(url_data, min_samples=1000)) == len(
+        url_data)
+    assert len(ParamStats().select_urls(url_data)) == len(url_data)
+
+
+def test_save_load(stats, tmp_path):
+    path = str(tmp_path / 'stats.tsv.gz')
+    stats.save(path)
+    loaded = ParamStats.load(path)
+    pd.testing.assert_frame_equal(
+        loaded.stats, stats.stats, check_dtype=False)
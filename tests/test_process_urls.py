@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+# Copyright (c) Facebook, Inc. and its affiliates. All Rights Reserved
+"""
+Train on a crawl of a local fake_server and clean urls, end to end.
+"""
+
+import warnings
+import urllib.parse as urlparse
+import pandas as pd
+import pytest
+
+import fake_server
+from generate_data import generate
+from process_urls import process_urls
+from url_rules import URLRules
+
+
+@pytest.fixture(scope='module')
+def server():
+    server = fake_server.start(words=50)
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture(autouse=True)
+def quiet():
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        yield
+
+
+def write_url_data(server, path, n_urls=40, seed=0):
+    url_data = generate(n_urls, 3, server.base_url, seed=seed, pii_share=0)
+    url_data.to_csv(path, sep='\t', index=False)
+    return url_data
+
+
+def clean_params(clean_urls):
+    return set(
+        param for url in clean_urls['clean_url']
+        for param in urlparse.parse_qs(urlparse.urlparse(url).query))
+
+
+def test_process_urls(server, tmp_path):
+    data_path = str(tmp_path / 'urls.tsv')
+    output_path = str(tmp_path / 'clean.tsv')
+    rules_path = str(tmp_path / 'rules.json')
+    url_data = write_url_data(server, data_path)
+    process_urls(
+        data_path, data_path, output_path, rules_output_path=rules_path)
+    clean_urls = pd.read_csv(output_path, sep='\t')
+    assert len(clean_urls) == len(url_data)
+    # the content params of fake_server are kept, the trackers dropped
+    assert clean_params(clean_urls) == set(fake_server.CONTENT_PARAMS)
+    assert clean_urls['clean_url'].str.contains('id=').all()
+    rules = URLRules.load(rules_path)
+    kept = set(
+        param for param, keep in rules.domains['site0.example.com'].items()
+        if keep)
+    assert kept == set(fake_server.CONTENT_PARAMS)
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+# Copyright (c) Facebook, Inc. and its affiliates. All Rights Reserved
+"""
+Reading url data and writing cleaned urls as TSV, Parquet and Arrow.
+"""
+
+import json
+import pandas as pd
+import pytest
+
+from table_io import CleanURLWriter, read_url_data, table_format, \
+    CLEAN_URL_COLUMNS
+
+FORMATS = ['urls.tsv', 'urls.parquet', 'urls.arrow']
+
+
+def url_data():
+    return pd.DataFrame({
+        'canonical_url': [
+            'http://a.com/x?id={0}'.format(i) for i in range(5)],
+        'url_id': [str(1000 + i) for i in range(5)],
+        'full_domain': ['a.com'] * 3 + ['b.com'] * 2,
+    })
+
+
+def clean_urls(start, n):
+    return pd.DataFrame({
+        'index': range(start, start + n),
+        'urlid': [str(i) for i in range(start, start + n)],
+        'canonical_url': [
+            'http://a.com/x?id={0}&utm_source=fb'.format(i)
+            for i in range(start, start + n)],
+        'clean_url': [
+            'http://a.com/x?id={0}'.format(i)
+            for i in range(start, start + n)],
+        'params_dropped': [['utm_source']] * n,
+        'params_kept': [['id']] * n,
+        'full_domain': ['a.com', 'b.com'] * (n // 2) + ['a.com'] * (n % 2),
+    })
+
+
+def write_url_data(path, data):
+    if table_format(path) == 'tsv':
+        data.to_csv(path, sep='\t', index=False)
+        return
+    pa = pytest.importorskip('pyarrow')
+    # integer ids and a dictionary-encoded domain, as other tools write them
+    data = data.astype({'url_id': 'int64', 'full_domain': 'category'})
+    table = pa.Table.from_pandas(data, preserve_index=False)
+    if table_format(path) == 'parquet':
+        import pyarrow.parquet as pq
+        pq.write_table(table, path)
+    else:
+        with pa.ipc.new_file(path, table.schema) as writer:
+            writer.write_table(table)
+
+
+def test_table_format():
+    assert table_format('a/b.TSV') == 'tsv'
+    assert table_format('a/b.tsv.gz') == 'tsv'
+    assert table_format('a/b.pq') == 'parquet'
+    assert table_format('a/b.parquet') == 'parquet'
+    assert table_format('a/b.feather') == 'arrow'
+    assert table_format('a/b.arrow') == 'arrow'
+
+
+@pytest.mark.parametrize('name', FORMATS)
+def test_read_url_data(tmp_path, name):
+    path = str(tmp_path / name)
+    write_url_data(path, url_data())
+    data = read_url_data(path)
+    pd.testing.assert_frame_equal(data, url_data())
+    # same column types whatever the format
+    assert (data.dtypes == object).all()
+
+
+@pytest.mark.parametrize('name', FORMATS)
+def test_read_url_data_in_chunks(tmp_path, name):
+    path = str(tmp_path / name)
+    write_url_data(path, url_data())
+    chunks = list(read_url_data(path, chunksize=2))
+    assert [len(chunk) for chunk in chunks] == [2, 2, 1]
+    pd.testing.assert_frame_equal(
+        pd.concat(chunks, ignore_index=True), url_data())
+
+
+def read_clean_urls(path):
+    if table_format(path) == 'tsv':
+        data = pd.read_csv(path, sep='\t', dtype={'urlid': str})
+        for column in ('params_dropped', 'params_kept'):
+            data[column] = [json.loads(x) for x in data[column]]
+        return data
+    pa = pytest.importorskip('pyarrow')
+    if table_format(path) == 'parquet':
+        import pyarrow.parquet as pq
+        table = pq.read_table(path)
+    else:
+        table = pa.ipc.open_file(path).read_all()
+    assert pa.types.is_dictionary(table.schema.field('full_domain').type)
+    data = table.to_pandas()
+    for column in ('params_dropped', 'params_kept'):
+        data[column] = [list(x) for x in data[column]]
+    data['full_domain'] = data['full_domain'].astype(object)
+    return data
+
+
+@pytest.mark.parametrize('name', FORMATS)
+def test_clean_url_writer(tmp_path, name):
+    path = str(tmp_path / name)
+    if table_format(path) != 'tsv':
+        pytest.importorskip('pyarrow')
+    with CleanURLWriter(path) as writer:
+        writer.write(clean_urls(0, 3))
+        # new domains in a later write
+        writer.write(clean_urls(3, 2).assign(full_domain='c.com'))
+        assert writer.rows == 5
+    data = read_clean_urls(path)
+    expected = pd.concat(
+        [clean_urls(0, 3), clean_urls(3, 2).assign(full_domain='c.com')],
+        ignore_index=True)
+    columns = CLEAN_URL_COLUMNS
+    if table_format(path) != 'tsv':
+        columns = columns + ['full_domain']
+    pd.testing.assert_frame_equal(
+        data[columns], expected[columns], check_dtype=False)
+
+
+@pytest.mark.parametrize('name', FORMATS)
+def test_clean_url_writer_without_rows(tmp_path, name):
+    path = str(tmp_path / name)
+    if table_format(path) != 'tsv':
+        pytest.importorskip('pyarrow')
+    with CleanURLWriter(path):
+        pass
+    data = read_clean_urls(path)
+    assert len(data) == 0
+    assert list(data.columns[:len(CLEAN_URL_COLUMNS)]) == CLEAN_URL_COLUMNS
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+# Copyright (c) Facebook, Inc. and its affiliates. All Rights Reserved
+"""
+Similarity functions against the difflib reference, and calibrate.
+"""
+
+import random
+import zlib
+import numpy as np
+import pytest
+
+import text_similarity
+from text_similarity import SIMILARITY_FUNCTIONS, calibrate, \
+    get_similarity_function
+
+
+def random_text(rng, n_words, vocabulary=200):
+    return ' '.join(
+        'w{0}'.format(rng.randrange(vocabulary)) for _ in range(n_words))
+
+
+@pytest.mark.parametrize('name', sorted(SIMILARITY_FUNCTIONS))
+def test_bounds(name):
+    similarity = SIMILARITY_FUNCTIONS[name]
+    text = random_text(random.Random(0), 300)
+    assert similarity(text, text) == 1.0
+    assert similarity('', '') == 1.0
+    assert similarity(text, 'other words entirely here') < 0.2
+    assert 0.0 <= similarity(text, text[:len(text) // 2]) <= 1.0
+
+
+def test_quick_ratio():
+    rng = random.Random(0)
+    for _ in range(50):
+        text_1 = random_text(rng, 50, 20)
+        text_2 = random_text(rng, 50, 20)
+        ratio = text_similarity.difflib_ratio(text_1, text_2)
+        quick = text_similarity.quick_ratio(text_1, text_2)
+        # an upper bound below the threshold, the exact ratio above it
+        assert quick >= ratio
+        if quick >= text_similarity.QUICK_RATIO_THRESHOLD:
+            assert quick == ratio
+
+
+def test_minhash_signature_blocks():
+    # more shingles than a block
+    text = random_text(random.Random(0), 3 * text_similarity.MINHASH_BLOCK,
+                       vocabulary=10 ** 6)
+    hashes = np.array([
+        zlib.crc32(' '.join(s).encode('utf-8'))
+        for s in text_similarity._shingles(text)], dtype=np.int64) \
+        % text_similarity._MERSENNE_PRIME
+    expected = (
+        (text_similarity._PERM_A[:, None] * hashes[None, :]
+         + text_similarity._PERM_B[:, None])
+        % text_similarity._MERSENNE_PRIME).min(axis=1)
+    assert (text_similarity._minhash_signature(text) == expected).all()
+
+
+def test_minhash_estimates_jaccard():
+    rng = random.Random(0)
+    words = random_text(rng, 2000, vocabulary=10 ** 6).split()
+    text_1 = ' '.join(words[:1500])
+    text_2 = ' '.join(words[500:])
+    jaccard = text_similarity.shingle_jaccard(text_1, text_2)
+    assert abs(text_similarity.minhash_jaccard(text_1, text_2) - jaccard) \
+        < 0.15
+
+
+def test_get_similarity_function():
+    assert get_similarity_function('shingle') \
+        is text_similarity.shingle_jaccard
+    function = len
+    assert get_similarity_function(function) is function
+    with pytest.raises(ValueError):
+        get_similarity_function('unknown')
+
+
+def test_calibrate():
+    rng = random.Random(0)
+    pairs = []
+    for _ in range(20):
+        text = random_text(rng, 100)
+        words = text.split()
+        # a page and the same page with a few changed words
+        for i in rng.sample(range(len(words)), rng.randrange(3)):
+            words[i] = 'changed'
+        pairs.append((text, ' '.join(words)))
+    pairs.append(('a b c', 'x y z'))
+    result, summary = calibrate(pairs, 'difflib')
+    assert list(result.columns) == [
+        'dl_ratio', 'similarity', 'dl_time', 'similarity_time', 'drift']
+    assert len(result) == summary['pairs'] == 21
+    assert (result['drift'] == 0).all()
+    assert summary['agreement'] == 1.0
+    # quick_ratio only drifts up, on pairs it tells apart anyway
+    result, summary = calibrate(pairs, 'quick')
+    assert (result['drift'] >= 0).all()
+    assert (result['drift'][result['dl_ratio'] >= 0.9] == 0).all()
+    assert summary['max_abs_drift'] == result['drift'].abs().max()
+    assert summary['agreement'] == 1.0
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+# Copyright (c) Facebook, Inc. and its affiliates. All Rights Reserved
+"""
+Crawl a local fake_server with both backends.
+"""
+
+import time
+import asyncio
+import warnings
+import threading
+import pytest
+
+import fake_server
+from url_comparison import URLComparison
+from url_content_cache import URLContentCache
+
+BACKENDS = ['requests', 'asyncio']
+COLUMNS = ['url', 'key', 'success', 'same_title', 'dl_ratio', 'status_code']
+
+
+@pytest.fixture(scope='module')
+def server():
+    server = fake_server.start(words=50)
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture(autouse=True)
+def quiet():
+    # html5lib and pebble warn on every page
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        yield
+
+
+def site_urls(base_url):
+    return [
+        '{0}/site{1}/item?id={1}&utm_source=fb&page=2'.format(base_url, i)
+        for i in range(3)]
+
+
+def crawl(urls, **kwargs):
+    url_info = URLComparison(max_worker=2, **kwargs).process_multiple_urls(
+        urls)
+    return url_info[COLUMNS].sort_values(['url', 'key'], na_position='first')\
+        .reset_index(drop=True)
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_content_params(server, backend):
+    url_info = crawl(site_urls(server.base_url), backend=backend)
+    # one row per param and one for the AA test, per url
+    assert url_info.shape[0] == 12
+    assert url_info['success'].all()
+    assert (url_info['status_code'] == 200).all()
+    # the fake server only changes the page for its content params
+    dl_ratio = url_info.set_index('key')['dl_ratio']
+    assert (dl_ratio.loc['id'] < 0.5).all()
+    assert (dl_ratio.loc['page'] < 0.5).all()
+    assert (dl_ratio.loc['utm_source'] == 1).all()
+    same_title = url_info.set_index('key')['same_title']
+    assert not same_title.loc['id'].any()
+    assert not same_title.loc['page'].any()
+    assert same_title.loc['utm_source'].all()
+    assert url_info[url_info['key'].isnull()]['same_title'].all()
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_lightweight_titles(server, backend):
+    urls = site_urls(server.base_url)
+    assert crawl(urls, backend=backend, lightweight=True, parser='lxml')\
+        .equals(crawl(urls, backend=backend))
+
+
+def test_backends_agree(server):
+    urls = site_urls(server.base_url)
+    assert crawl(urls, backend='requests').equals(
+        crawl(urls, backend='asyncio'))
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_unreachable_url(backend):
+    url_info = crawl(['http://127.0.0.1:1/site0/item?id=1'], backend=backend)
+    # the AA test and the url without id, neither fetched
+    assert url_info.shape[0] == 2
+    assert url_info['status_code'].isnull().all()
+
+
+class SlowSiteServer(fake_server.FakeSiteServer):
+    """
+    Serves the pages of site0 slowly, the other sites at once
+    """
+    def page(self, site, query):
+        if site == 'site0':
+            time.sleep(1.0)
+        return super().page(site, query)
+
+
+def test_slow_url_does_not_hold_up_others():
+    server = SlowSiteServer(words=50)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    urls = [
+        '{0}/site{1}/item?id={1}'.format(server.base_url, i)
+        for i in range(12)]
+
+    async def completion_order():
+        comparison = URLComparison(backend='asyncio', chunksize=3)
+        return [
+            url async for url, _result
+            in comparison.iter_process_urls_async(urls)]
+
+    try:
+        order = asyncio.run(completion_order())
+    finally:
+        server.shutdown()
+        server.server_close()
+    # the other urls go through the free slots while site0 is fetched
+    assert order[-1] == urls[0]
+    assert sorted(order) == sorted(urls)
+
+
+def test_cache_shares_fetches(server, tmp_path):
+    urls = [site_urls(server.base_url)[0]] * 4
+    cache = URLContentCache(str(tmp_path / 'cache.db'))
+    before = server.requests
+    url_info = crawl(urls, backend='asyncio', cache=cache)
+    # the url and its 3 modified urls once, the AA test of each url
+    assert server.requests - before == 4 + 4
+    assert url_info.shape[0] == 16
+    assert url_info['success'].all()
+    assert (url_info['status_code'] == 200).all()
+    assert url_info.drop_duplicates().shape[0] == 4
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+# Copyright (c) Facebook, Inc. and its affiliates. All Rights Reserved
+"""
+Equivalence of the vectorized and parallel paths of URLParametersRemoval
+with the plain ones, and resume of remove_pii_params_parallel.
+"""
+
+import os
+import glob
+import random
+import warnings
+import urllib.parse as urlparse
+import numpy as np
+import pandas as pd
+import pytest
+
+from generate_data import generate
+from run_benchmarks import similarity_data
+from url_parameters_removal import URLParametersRemoval
+
+NAMES = ['id', 'a', 'utm_source', 'a+b', 'a%20b', 'caf%C3%A9', '%zz', '']
+VALUES = ['1', '', 'x=y', '%2B1-650-253-0000', 'a b']
+
+
+def random_url(rng):
+    pairs = []
+    for _ in range(rng.randrange(6)):
+        name = rng.choice(NAMES)
+        if rng.random() < 0.1:
+            pairs.append(name)
+        else:
+            pairs.append('{0}={1}'.format(name, rng.choice(VALUES)))
+    url = 'http://h/p'
+    if rng.random() < 0.9:
+        url += '?' + '&'.join(pairs)
+    if rng.random() < 0.1:
+        url += '#f?id=1'
+    if rng.random() < 0.05:
+        url = url.replace('=', '=\t', 1)
+    return url
+
+
+def test_extract_query_params():
+    rng = random.Random(0)
+    urls = [random_url(rng) for _ in range(2000)]
+    url_params = URLParametersRemoval.extract_query_params(
+        pd.Series(urls), pd.Series(range(len(urls))))
+    expected = [
+        (url_id, param) for url_id, url in enumerate(urls)
+        for param in urlparse.parse_qs(urlparse.urlparse(url).query)]
+    assert list(zip(url_params['url_id'], url_params['param'])) == expected
+
+
+def test_extract_query_params_empty():
+    url_params = URLParametersRemoval.extract_query_params(
+        pd.Series(['http://h/p', 'http://h/p?']), pd.Series(['1', '2']))
+    assert url_params.empty
+    assert list(url_params.columns) == ['url_id', 'param']
+
+
+def pii_urls(n_urls, seed=0):
+    """
+    Output of drop_params_via_similarity for synthetic urls, trained on
+    synthetic crawl output, with the contact param (phone numbers and
+    emails) kept, so that it is checked
+    """
+    url_data = generate(n_urls, 10, 'http://h', seed=seed, pii_share=0.2)
+    param_domain = URLParametersRemoval.build_param_data(
+        similarity_data(url_data))
+    urls_with_param = url_data.merge(
+        URLParametersRemoval(url_data).parse_urls_for_param())
+    urls = URLParametersRemoval.drop_params_via_similarity(
+        urls_with_param, param_domain)
+    urls.loc[urls['param'] == 'contact', 'keep'] = True
+    return urls
+
+
+def test_is_aa_test():
+    params = pd.Series(['id', None, '', np.nan])
+    assert URLParametersRemoval.is_aa_test(params).tolist() == [
+        False, True, False, True]
+
+
+def test_build_param_data():
+    url_data = generate(200, 5, 'http://h')
+    param_domain = URLParametersRemoval.build_param_data(
+        similarity_data(url_data))
+    # every (domain, param) pair of the data, with the AA test of its domain
+    pairs = url_data.merge(
+        URLParametersRemoval(url_data).parse_urls_for_param())[
+        ['full_domain', 'param']].drop_duplicates()
+    assert len(param_domain) == len(pairs)
+    assert (param_domain['gsim_mean'] == 1).all()
+    content = param_domain['param'].isin(['id', 'page'])
+    assert (param_domain['diff_gsim'][content] > 0.5).all()
+    assert (param_domain['diff_gsim'][~content] == 0).all()
+    assert (param_domain['same_title'][content] == 0).all()
+
+
+@pytest.fixture(autouse=True)
+def quiet():
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        yield
+
+
+def test_remove_pii_params_drops_phone_numbers():
+    clean_urls = URLParametersRemoval.remove_pii_params(pii_urls(300))
+    phone = clean_urls['canonical_url'].str.contains('650-253')
+    email = clean_urls['canonical_url'].str.contains('example.com')
+    assert phone.any() and email.any()
+    # a kept param is still dropped when its value has a phone number
+    assert not clean_urls['clean_url'][phone].str.contains('contact').any()
+    assert clean_urls['clean_url'][email].str.contains('contact').all()
+    assert clean_urls['params_kept'].apply(lambda p: 'id' in p).all()
+
+
+def test_remove_pii_params_parallel():
+    urls = pii_urls(300)
+    assert URLParametersRemoval.remove_pii_params_parallel(
+        urls, n_partitions=4, max_worker=2).equals(
+        URLParametersRemoval.remove_pii_params(urls))
+
+
+def test_remove_pii_params_parallel_resume(tmp_path):
+    checkpoint_dir = str(tmp_path)
+    urls = pii_urls(300)
+    expected = URLParametersRemoval.remove_pii_params(urls)
+    clean_urls = URLParametersRemoval.remove_pii_params_parallel(
+        urls, n_partitions=4, max_worker=2, checkpoint_dir=checkpoint_dir)
+    assert clean_urls.equals(expected)
+    checkpoints = sorted(glob.glob(os.path.join(checkpoint_dir, '*.pkl')))
+    assert len(checkpoints) == 4
+    assert len(glob.glob(os.path.join(checkpoint_dir, '*.json'))) == 4
+
+    # a checkpoint without its manifest (the run died in between) is
+    # computed again, the others are loaded
+    os.remove(checkpoints[0] + '.json')
+    for checkpoint in checkpoints:
+        os.utime(checkpoint, (0, 0))
+    resumed = URLParametersRemoval.remove_pii_params_parallel(
+        urls, n_partitions=4, max_worker=2, checkpoint_dir=checkpoint_dir)
+    assert resumed.equals(expected)
+    assert os.path.getmtime(checkpoints[0]) > 0
+    assert all(os.path.getmtime(c) == 0 for c in checkpoints[1:])
+    assert os.path.exists(checkpoints[0] + '.json')
+
+
+def test_remove_pii_params_parallel_other_input(tmp_path):
+    checkpoint_dir = str(tmp_path)
+    URLParametersRemoval.remove_pii_params_parallel(
+        pii_urls(300), n_partitions=4, max_worker=2,
+        checkpoint_dir=checkpoint_dir)
+    # checkpoints of other urls in the same directory are not reused
+    other_urls = pii_urls(300, seed=1)
+    assert URLParametersRemoval.remove_pii_params_parallel(
+        other_urls, n_partitions=4, max_worker=2,
+        checkpoint_dir=checkpoint_dir).equals(
+        URLParametersRemoval.remove_pii_params(other_urls))
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+# Copyright (c) Facebook, Inc. and its affiliates. All Rights Reserved
+"""
+Rule files: building, saving and loading, and cleaning urls with them.
+"""
+
+import gzip
+import json
+import pandas as pd
+import pytest
+
+from process_urls import apply_rules
+from url_rules import URLRules, RULES_FORMAT, RULES_VERSION
+
+DOMAINS = {
+    'a.com': {'id': True, 'page': False, 'utm_source': False},
+    'b.com': {'q': True},
+}
+
+
+def test_from_param_domain():
+    param_domain = pd.DataFrame({
+        'full_domain': ['a.com', 'a.com', 'a.com'],
+        'param': ['id', 'page', 'utm_source'],
+        'same_title': [0.0, 1.0, 0.0],
+        'diff_gsim': [0.5, 0.0, 0.5],
+        'body_length': [1000, 1000, 1000],
+    })
+    rules = URLRules.from_param_domain(
+        param_domain, body_length_lower_bound=10)
+    # utm_source changes the page but is a known tracker
+    assert rules.domains == {
+        'a.com': {'id': True, 'page': False, 'utm_source': False}}
+    assert rules.bounds == {'body_length_lower_bound': 10}
+
+
+def test_keep():
+    rules = URLRules(DOMAINS)
+    assert rules.keep('a.com', 'id')
+    assert not rules.keep('a.com', 'page')
+    # params and domains without a rule are dropped
+    assert not rules.keep('a.com', 'q')
+    assert not rules.keep('c.com', 'id')
+
+
+def test_to_frame():
+    frame = URLRules(DOMAINS).to_frame()
+    assert list(frame.columns) == ['full_domain', 'param', 'keep']
+    assert frame['keep'].dtype == bool
+    assert frame.shape[0] == 4
+
+
+@pytest.mark.parametrize('name', ['rules.json', 'rules.json.gz'])
+def test_save_load(tmp_path, name):
+    path = str(tmp_path / name)
+    URLRules(DOMAINS, bounds={'same_title_upper_bound': 0.9},
+             created_at=1.0).save(path)
+    rules = URLRules.load(path)
+    assert rules.domains == DOMAINS
+    assert rules.bounds == {'same_title_upper_bound': 0.9}
+    assert rules.created_at == 1.0
+    if name.endswith('.gz'):
+        with gzip.open(path, 'rt') as f:
+            assert json.load(f)['version'] == RULES_VERSION
+
+
+@pytest.mark.parametrize('header', [
+    {'format': 'other', 'version': RULES_VERSION},
+    {'format': RULES_FORMAT, 'version': RULES_VERSION + 1},
+])
+def test_load_rejects_other_files(tmp_path, header):
+    path = str(tmp_path / 'rules.json')
+    with open(path, 'w') as f:
+        json.dump(dict(header, domains={}), f)
+    with pytest.raises(ValueError):
+        URLRules.load(path)
+
+
+def test_apply_rules(tmp_path):
+    rules_path = str(tmp_path / 'rules.json')
+    data_path = str(tmp_path / 'urls.tsv')
+    output_path = str(tmp_path / 'clean.tsv')
+    URLRules(DOMAINS).save(rules_path)
+    pd.DataFrame({
+        'canonical_url': [
+            'http://a.com/x?id=1&utm_source=fb&page=2',
+            'http://b.com/y?q=shoes&id=3',
+        ],
+        'url_id': ['1', '2'],
+        'full_domain': ['a.com', 'b.com'],
+    }).to_csv(data_path, sep='\t', index=False)
+    apply_rules(data_path, rules_path, output_path)
+    clean_urls = pd.read_csv(output_path, sep='\t', dtype={'urlid': str})
+    assert dict(zip(clean_urls['urlid'], clean_urls['clean_url'])) == {
+        '1': 'http://a.com/x?id=1',
+        '2': 'http://b.com/y?q=shoes',
+    }
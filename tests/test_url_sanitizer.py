@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+# Copyright (c) Facebook, Inc. and its affiliates. All Rights Reserved
+"""
+URLSanitizer cleans single urls the same way as apply_rules.
+"""
+
+import json
+import pandas as pd
+
+from process_urls import apply_rules
+from url_rules import URLRules
+from url_sanitizer import URLSanitizer
+
+# the rule file keeps utm_source on a.com, although it is a known tracker
+DOMAINS = {
+    'a.com': {'id': True, 'utm_source': True, 'page': False},
+    'b.com': {'q': True},
+}
+URLS = [
+    ('http://a.com/x?id=1&utm_source=fb&page=2', 'a.com'),
+    ('http://a.com/x?id=%2B16502530000&page=1', 'a.com'),
+    ('http://a.com/x?fbclid=abc', 'a.com'),
+    ('http://b.com/y?q=shoes&id=3', 'b.com'),
+    ('http://c.com/z?id=1', 'c.com'),
+]
+
+
+def test_sanitize():
+    sanitizer = URLSanitizer(URLRules(DOMAINS))
+    clean_url, params_dropped, params_kept = sanitizer.sanitize(URLS[0][0])
+    assert clean_url == 'http://a.com/x?id=1&utm_source=fb'
+    assert params_dropped == ['page']
+    assert params_kept == ['id', 'utm_source']
+    # a phone number is never kept
+    assert sanitizer.sanitize(URLS[1][0])[0] == 'http://a.com/x'
+
+
+def test_sanitize_with_domain():
+    sanitizer = URLSanitizer(URLRules(DOMAINS))
+    assert sanitizer.sanitize('http://www.b.com/y?q=1', 'b.com')[0] == \
+        'http://www.b.com/y?q=1'
+    assert sanitizer.sanitize('http://www.b.com/y?q=1')[0] == \
+        'http://www.b.com/y'
+
+
+def test_same_as_apply_rules(tmp_path):
+    rules_path = str(tmp_path / 'rules.json')
+    data_path = str(tmp_path / 'urls.tsv')
+    output_path = str(tmp_path / 'clean.tsv')
+    URLRules(DOMAINS).save(rules_path)
+    pd.DataFrame({
+        'canonical_url': [url for url, _domain in URLS],
+        'url_id': [str(i) for i in range(len(URLS))],
+        'full_domain': [domain for _url, domain in URLS],
+    }).to_csv(data_path, sep='\t', index=False)
+    apply_rules(data_path, rules_path, output_path)
+    clean_urls = pd.read_csv(
+        output_path, sep='\t', dtype={'urlid': str}).set_index('urlid')
+
+    sanitizer = URLSanitizer.from_rule_file(rules_path)
+    results = sanitizer.sanitize_many(
+        [url for url, _domain in URLS], [domain for _url, domain in URLS])
+    for i, (clean_url, params_dropped, params_kept) in enumerate(results):
+        row = clean_urls.loc[str(i)]
+        assert clean_url == row['clean_url']
+        assert sorted(params_dropped) == sorted(
+            json.loads(row['params_dropped']))
+        assert sorted(params_kept) == sorted(json.loads(row['params_kept']))